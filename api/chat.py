@@ -8,6 +8,7 @@
 @Desc    :   None
 """
 import json
+import asyncio
 import logging
 from datetime import datetime
 from settings import settings
@@ -18,7 +19,15 @@ from sse_starlette.sse import EventSourceResponse
 from service.prompt import DOC_RAG_PROMPT
 
 from service.llm import get_llm_response
+from service.context_packer import pack_context
+from service.answer_cache import ANSWER_CACHE
 from service.rag_service import recall_knowledge
+from service.kb_service import unknown_kbs
+from libs.message import Message
+from libs.tracing import Trace
+from service.metrics_service import track_stream
+from service.admission_service import CHAT_ADMISSION, release_after
+from starlette.background import BackgroundTask
 logger = logging.getLogger(__name__)
 qa_router = APIRouter()
 
@@ -31,22 +40,56 @@ class HMessage(BaseModel):
 async def chat(
     query: str = Body(..., description="问题"),
     history: list[HMessage] = Body(None, description="对话历史"),
-    kb_name: str = Body(settings.DEFAULT_KNOWLEDGE_BASE, description="用到的知识库"),
+    kb_name: str | list[str] = Body(settings.DEFAULT_KNOWLEDGE_BASE, description="用到的知识库，可传入列表跨库检索"),
     session_id: int = Body(int(datetime.now().timestamp()), description="会话ID，时间戳"),
     stream: bool = Body(True, description="是否启用流式响应"),
 ):
     """
     @description : 进行用户的问答
     """
-    knowledges, ids = await recall_knowledge(query, kb_name=kb_name, top_k=settings.TOP_K)
+    # 在查缓存与建索引前校验知识库，不存在或名称不合法时直接返回
+    missing = await unknown_kbs([kb_name] if isinstance(kb_name, str) else kb_name)
+    if missing:
+        return Message.error(msg="知识库不存在", data={"knowledge_bases": missing})
+
+    # 无对话历史时回答只取决于问题与知识库内容，可直接复用缓存；缓存键需读取索引版本文件，放到线程中计算
+    cache_key = None
+    if not history:
+        cache_key = await asyncio.to_thread(ANSWER_CACHE.make_key, [kb_name] if isinstance(kb_name, str) else kb_name, query)
+    cached = ANSWER_CACHE.get(cache_key) if cache_key else None
+    if cached:
+        logger.info(f"命中回答缓存: {query}")
+        return EventSourceResponse(track_stream(replay_answer(cached), "chat"), media_type="text/event-stream")
+
+    # 名额一直占用到流式输出结束，排队已满或超时时抛出 AdmissionRejected 由全局处理返回 429/503
+    ticket = await CHAT_ADMISSION.acquire()
+    trace = Trace("chat", kb=kb_name, session_id=session_id)
+    recall_errors, recall_metadatas = [], []
+    try:
+        with trace.activate():
+            knowledges, ids = await recall_knowledge(
+                query, kb_name=kb_name, top_k=settings.TOP_K, errors=recall_errors, metadatas=recall_metadatas
+            )
+    except BaseException:
+        ticket.release()
+        raise
     knowledges_text = ""
+    # 召回不完整（检索异常、超时、关键词提取失败）或无知识时的回答不可复用，否则临时故障会被缓存为固定回答
+    if recall_errors or not ids:
+        if recall_errors:
+            logger.warning(f"召回不完整，不缓存回答: {recall_errors}")
+        cache_key = None
     
     logger.info(f"查询到{len(knowledges)}条知识")
     for doc, id in zip(knowledges, ids):
         logger.debug(f"Chroma 召回文档: {id}, 内容: {doc[:15]}...")
 
-    for idx, knowledge in enumerate(knowledges):
+    # 合并相邻文本块并限制 token 预算，溯源只返回实际拼入提示词的知识
+    packed = pack_context(knowledges, ids, settings.CONTEXT_TOKEN_BUDGET, settings.TEXT_LLM, recall_metadatas)
+    for idx, (knowledge, _) in enumerate(packed):
         knowledges_text += f"{idx}、{knowledge}\n"
+    knowledge_map = dict(zip(ids, knowledges))
+    knowledges, ids = [knowledge_map[id] for _, group in packed for id in group], [id for _, group in packed for id in group]
 
     async def process_chat(
         query,
@@ -55,19 +98,45 @@ async def chat(
         stream=stream,
     ):
         # 知识库溯源
-        yield {"event": "start", "data": json.dumps([{id.split("/")[-1]: k}for k, id in zip(knowledges, ids)] , ensure_ascii=False)}
+        sources = json.dumps([{id.split("/")[-1]: k}for k, id in zip(knowledges, ids)] , ensure_ascii=False)
+        if settings.DEBUG:
+            # 调试模式下附带检索阶段的耗时汇总
+            data = {"sources": json.loads(sources), "trace": trace.summary()}
+            yield {"event": "start", "data": json.dumps(data, ensure_ascii=False)}
+        else:
+            yield {"event": "start", "data": sources}
         text = ""
-        async for response in get_llm_response(
-            query=query,
-            model=settings.TEXT_LLM,
-            history=history,
-            system_prompt=system_prompt,
-            temperature=0.7,
-            stream=stream,
-        ):
-            
-            text += response
-            yield {"event": "add", "data": json.dumps({"content": text}, ensure_ascii=False)}
+        try:
+            with trace.activate():
+                async for response in get_llm_response(
+                    query=query,
+                    model=settings.TEXT_LLM,
+                    history=history,
+                    system_prompt=system_prompt,
+                    temperature=0.7,
+                    stream=stream,
+                ):
+
+                    text += response
+                    yield {"event": "add", "data": json.dumps({"content": text}, ensure_ascii=False)}
+        finally:
+            trace.finish()
         yield {"event": "finish", "data": json.dumps({"content": text}, ensure_ascii=False)}
+        if cache_key and text:
+            ANSWER_CACHE.put(cache_key, {"sources": sources, "content": text})
+
+    return EventSourceResponse(
+        track_stream(release_after(process_chat(query, history), ticket), "chat"),
+        media_type="text/event-stream",
+        background=BackgroundTask(ticket.release),
+    )
 
-    return EventSourceResponse(process_chat(query, history), media_type="text/event-stream")
+
+async def replay_answer(cached: dict):
+    """
+    @description : 按与 process_chat 相同的事件顺序回放缓存的回答
+    """
+    content = json.dumps({"content": cached["content"]}, ensure_ascii=False)
+    yield {"event": "start", "data": cached["sources"]}
+    yield {"event": "add", "data": content}
+    yield {"event": "finish", "data": content}
@@ -7,18 +7,35 @@
 @Version :   1.0
 @Desc    :   None
 """
+import os
+import asyncio
 import logging
 import traceback
-from fastapi import APIRouter
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from sse_starlette.sse import EventSourceResponse
 from settings import settings
+from api.upload_file import UPLOAD_OPENAPI
 from service.async_kb_service import store_files_concurrently
+from service.stream_ingest_service import StreamIngestor
+from service.chroma import CursorExpired
+from service.upload_service import InvalidUploadName, check_name, resolve_under
+from service.metrics_service import track_stream
+from service.admission_service import INGEST_ADMISSION, release_after
 from service.kb_service import (
     delete_by_file,
     delete_kb,
     list_kb,
     list_kb_files,
     list_kb_knowledge,
+    stream_kb_knowledge,
     create_kb,
+    kb_stats,
+    rebuild_catalog,
+    warmup_kbs,
+    unknown_kbs,
+    hot_kbs,
 )
 
 from libs.message import Message
@@ -29,6 +46,25 @@ kb_router = APIRouter()
 UPLOAD_DIR = settings.UPLOAD_DIR
 
 
+class UploadEventSourceResponse(EventSourceResponse):
+    """
+    @name     : UploadEventSourceResponse
+    @desc     : 上传过程中返回的 SSE 响应。EventSourceResponse 会持续调用 receive 监听客户端断开，
+                与上传任务同时读取会取走请求体，因此上传任务结束后才把 receive 交给它
+    """
+
+    def __init__(self, content, upload: asyncio.Task, **kwargs):
+        super().__init__(content, **kwargs)
+        self.upload = upload
+
+    async def __call__(self, scope, receive, send):
+        async def receive_after_upload():
+            await asyncio.wait({self.upload})
+            return await receive()
+
+        await super().__call__(scope, receive_after_upload, send)
+
+
 @kb_router.post("/store_file_chunks", summary="存储文件到向量库")
 async def store_file_chunks_api(
     filename: list[str],
@@ -39,12 +75,16 @@ async def store_file_chunks_api(
     """
     @description : 将文件切片并存储到指定的知识库
     """
-    num_chunks, NOT_EXIST_FILES = await store_files_concurrently(
-        filename,
-        kb_name,
-        chunk_size,
-        chunk_overlap,
-    )
+    ticket = await INGEST_ADMISSION.acquire()
+    try:
+        num_chunks, NOT_EXIST_FILES = await store_files_concurrently(
+            filename,
+            kb_name,
+            chunk_size,
+            chunk_overlap,
+        )
+    finally:
+        ticket.release()
 
     if NOT_EXIST_FILES:
         return Message.error(msg="以下文件未成功存储", data={"not_exist_files": NOT_EXIST_FILES})
@@ -52,6 +92,41 @@ async def store_file_chunks_api(
     return Message.success(msg="文件已切片并存储到知识库", data={"chunks_count": num_chunks})
 
 
+@kb_router.post("/upload_and_store", summary="上传文件并存储到向量库", openapi_extra=UPLOAD_OPENAPI)
+async def upload_and_store_api(
+    request: Request,
+    kb_name: str = settings.DEFAULT_KNOWLEDGE_BASE,
+    chunk_size: int = 500,
+    chunk_overlap: int = 50,
+):
+    """
+    @description : 上传文件的同时切片入库，.txt/.md 边接收边入库，.docx/.pdf 在单个文件接收完成后立即解析，
+                   入库进度通过 SSE 返回：file / chunks / file_done / duplicate / unsupported / error / finish，
+                   超过大小限制等上传错误同样以 error 事件返回，并回滚本次请求已入库的文件
+    """
+    try:
+        kb_path = resolve_under(UPLOAD_DIR, check_name(kb_name, "知识库名称不合法"), "知识库名称不合法")
+    except InvalidUploadName as e:
+        return Message.error(msg=e.msg, data={"knowledge_base": kb_name})
+    if not os.path.isdir(kb_path):
+        return Message.error(msg="知识库不存在", data={"knowledge_base": kb_name})
+
+    ticket = await INGEST_ADMISSION.acquire()
+    try:
+        ingestor = StreamIngestor(kb_name, chunk_size, chunk_overlap)
+    except BaseException:
+        ticket.release()
+        raise
+    upload = ingestor.start(request)
+
+    return UploadEventSourceResponse(
+        track_stream(release_after(ingestor.stream_events(), ticket), "upload_and_store"),
+        upload=upload,
+        media_type="text/event-stream",
+        background=BackgroundTask(ticket.release),
+    )
+
+
 @kb_router.post("/create", summary="新建一个知识库")
 async def create_kb_api(
     kb_name: str = settings.DEFAULT_KNOWLEDGE_BASE,
@@ -98,6 +173,66 @@ async def list_files_in_kb_api(
         return Message.error(msg="列出文件失败")
 
 
+@kb_router.get("/stats", summary="知识库统计信息")
+async def kb_stats_api(
+    kb_name: str = Query(None, description="知识库名称，为空时返回全部知识库"),
+):
+    """
+    @description : 返回知识库的文件数、文本块数、字节数、嵌入模型与更新时间，指定知识库时附带文件明细
+    """
+    try:
+        stats = await kb_stats(kb_name)
+        if stats is None:
+            return Message.error(msg="知识库不存在", data={"knowledge_base": kb_name})
+        return Message.success(msg="知识库统计信息", data={"stats": stats})
+    except Exception as e:
+        logger.error(f"获取知识库统计信息失败: {str(e)}")
+        return Message.error(msg="获取知识库统计信息失败")
+
+
+@kb_router.post("/warmup", summary="预热知识库索引")
+async def warmup_api(
+    kb_name: list[str] = Query(..., description="要预热的知识库，可传多个"),
+    wait: bool = Query(False, description="是否等待预热完成"),
+):
+    """
+    @description : 在后台加载知识库的 BM25 索引、向量索引与嵌入模型，会话开始时调用可避免首个问答冷加载
+    """
+    try:
+        missing = await unknown_kbs(kb_name)
+        if missing:
+            return Message.error(msg="知识库不存在", data={"knowledge_bases": missing})
+        results = await warmup_kbs(kb_name, wait)
+        if results is None:
+            return Message.success(msg="已开始预热", data={"knowledge_bases": kb_name})
+        return Message.success(msg="预热完成", data={"results": results})
+    except Exception as e:
+        logger.error(f"预热知识库失败: {str(e)}")
+        return Message.error(msg="预热知识库失败")
+
+
+@kb_router.get("/hot", summary="热点知识库")
+async def hot_kbs_api():
+    """
+    @description : 各知识库的访问频率（指数衰减）与已加载 BM25 索引的知识库
+    """
+    return Message.success(msg="热点知识库", data=hot_kbs())
+
+
+@kb_router.post("/rebuild_catalog", summary="重建知识库目录")
+async def rebuild_catalog_api():
+    """
+    @description : 扫描上传目录与向量库重建知识库目录，用于手动改动上传目录后修复列表与统计
+    """
+    try:
+        await rebuild_catalog()
+        return Message.success(msg="知识库目录已重建")
+    except Exception as e:
+        logger.error(f"重建知识库目录失败: {str(e)}")
+        logger.error(traceback.format_exc())
+        return Message.error(msg="重建知识库目录失败")
+
+
 @kb_router.delete("/delete_file", summary="删除知识库中的文件")
 async def delete_file_from_kb_api(
     filename: list[str],
@@ -135,13 +270,27 @@ async def delete_kb_api(
 
 
 @kb_router.get("list_kb", summary="列出所有知识")
-async def list_kb_api(kb_name: str = settings.DEFAULT_KNOWLEDGE_BASE):
+async def list_kb_api(
+    kb_name: str = settings.DEFAULT_KNOWLEDGE_BASE,
+    cursor: str = Query(None, description="分页游标，取上一页返回的 next_cursor，为空时从第一页开始"),
+    limit: int = Query(100, ge=1, le=1000, description="每页数量"),
+    file_name: list[str] = Query(None, description="只列出这些文件的知识，可传多个"),
+    stream: bool = Query(False, description="以 NDJSON 流式返回全部知识，忽略分页参数"),
+):
     """
-    @description : 列出指定知识库中的所有知识
+    @description : 分页列出指定知识库中的知识；stream=true 时逐行返回 {"id", "document", "metadata"}
     """
     try:
-        knowledge_list = await list_kb_knowledge(kb_name)
-        return Message.success(msg="知识列表", data={"knowledge": knowledge_list})
+        if stream:
+            # 先确认知识库存在，避免流开始后才出错
+            await list_kb_knowledge(kb_name, None, 1, file_name)
+            return StreamingResponse(stream_kb_knowledge(kb_name, file_name), media_type="application/x-ndjson")
+
+        page = await list_kb_knowledge(kb_name, cursor, limit, file_name)
+        next_cursor = page.pop("next_cursor")
+        return Message.success(msg="知识列表", data={"knowledge": page, "next_cursor": next_cursor})
+    except CursorExpired as e:
+        return Message.error(msg=str(e), data={"cursor": cursor})
     except Exception as e:
         logger.error(f"列出知识失败: {str(e)}")
         return Message.error(msg="列出知识失败")
@@ -8,33 +8,58 @@
 @Desc    :   None
 """
 
-import os
-import time
-import shutil
-from typing import List
+import logging
 from libs.message import Message
-from fastapi import APIRouter, File, UploadFile
+from fastapi import APIRouter, Request
 
 from settings import settings
+from service.upload_service import InvalidUploadName, UploadSizeExceeded, stream_upload
+
+logger = logging.getLogger(__name__)
 
 file_router = APIRouter()
 
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# 请求体由接口内部流式解析，这里仅用于生成接口文档
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+                    "required": ["files"],
+                }
+            }
+        },
+        "required": True,
+    }
+}
 
 
-@file_router.post("/upload/", summary="上传文件")
+@file_router.post("/upload/", summary="上传文件", openapi_extra=UPLOAD_OPENAPI)
 async def upload_files(
-    files: List[UploadFile] = File(...),
+    request: Request,
     knowledge_base: str = settings.DEFAULT_KNOWLEDGE_BASE,
 ):
     """
-    @description : 上传文件
+    @description : 上传文件，边接收边写入知识库目录，内容与已有文件相同时不重复保存
     """
-    file_paths = []
-    for file in files:
-        file_location = os.path.join(UPLOAD_DIR, knowledge_base, str(int(time.time() * 100)) + "-" + file.filename)
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        file_paths.append(file_location)
-    return Message.success(msg="文件上传成功", data={"file_paths": file_paths})
+    try:
+        saved, duplicates = await stream_upload(request, knowledge_base)
+    except FileNotFoundError:
+        return Message.error(msg="知识库不存在", data={"knowledge_base": knowledge_base})
+    except UploadSizeExceeded as e:
+        logger.warning(f"上传文件超过大小限制: {e.filename}, 限制 {e.limit} 字节")
+        return Message.error(msg=e.msg, data={"file": e.filename, "limit": e.limit})
+    except InvalidUploadName as e:
+        logger.warning(f"拒绝上传: {e.msg}: {e.filename!r}")
+        return Message.error(msg=e.msg, data={"file": e.filename})
+
+    return Message.success(
+        msg="文件上传成功",
+        data={
+            "file_paths": [item["file_path"] for item in saved],
+            "files": saved,
+            "duplicates": duplicates,
+        },
+    )
@@ -8,19 +8,26 @@
 @Desc    :   FastAPI 主入口
 """
 
+import asyncio
 import logging
 import uvicorn
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.openapi.docs import get_swagger_ui_html
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from CustemException.CustomException import CustomException
 from libs.message import Message
 from api import api_router
 from settings import settings
 from service import sys_init
+from service.embedding_service import EMBEDDING_BATCHER
+from service.metrics_service import MetricsMiddleware, monitor_event_loop_lag
+from service.admission_service import AdmissionRejected, CHAT_ADMISSION, INGEST_ADMISSION
+from service.parse_worker import start_parse_pool, shutdown_parse_pool
+from service.warmup_service import keep_hot
+from libs.metrics import METRICS
 
 sys_init()
 
@@ -41,6 +48,27 @@ app = FastAPI(
     description=settings.DESCRIPTION,
     docs_url=None,
 )  # 禁用默认 /docs
+app.add_middleware(MetricsMiddleware)
+
+
+@app.on_event("startup")
+async def start_loop_lag_monitor():
+    app.state.loop_lag_task = asyncio.create_task(monitor_event_loop_lag())
+
+
+@app.on_event("startup")
+async def start_warmup():
+    app.state.warmup_task = asyncio.create_task(keep_hot())
+
+
+@app.on_event("startup")
+async def warm_parse_pool():
+    await start_parse_pool()
+
+
+@app.on_event("shutdown")
+async def stop_parse_pool():
+    shutdown_parse_pool()
 
 
 # ==============================
@@ -52,6 +80,25 @@ def default():
     return Message.info("程序运行中...")
 
 
+@app.get("/embedding_stats", summary="嵌入批处理指标")
+def embedding_stats():
+    """嵌入动态批处理的队列深度与批大小统计"""
+    return Message.success(msg="嵌入批处理指标", data=EMBEDDING_BATCHER.stats())
+
+
+@app.get("/admission_stats", summary="准入控制状态")
+def admission_stats():
+    """问答与入库的并发、排队与拒绝统计"""
+    return Message.success(msg="准入控制状态", data={"chat": CHAT_ADMISSION.stats(), "ingest": INGEST_ADMISSION.stats()})
+
+
+@app.get("/metrics", summary="Prometheus 指标", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 文本格式的运行指标，知识库大小等按需统计的指标在线程池中采集"""
+    content = await asyncio.to_thread(METRICS.render)
+    return PlainTextResponse(content, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/docs", include_in_schema=False)
 async def custom_swagger_ui_html():
     """自定义 Swagger UI"""
@@ -86,6 +133,16 @@ async def custom_exception_handler(request: Request, exc: CustomException):
     return JSONResponse(Message.error(msg=exc.msg, data=exc.data))
 
 
+@app.exception_handler(AdmissionRejected)
+async def admission_exception_handler(request: Request, exc: AdmissionRejected):
+    logger.warning(f"请求未被准入: {request.url.path}, 优先级 {exc.priority}, 状态码 {exc.status_code}")
+    return JSONResponse(
+        Message.error(msg=exc.msg, data={"retry_after": exc.retry_after}),
+        status_code=exc.status_code,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     try:
@@ -108,12 +165,26 @@ async def global_exception_handler(request: Request, exc: Exception):
 # 启动入口
 # ==============================
 if __name__ == "__main__":
-    uvicorn.run(
-        "app:app",
-        host="0.0.0.0",
-        port=settings.API_PORT,
-        log_level="info",
-        workers=1,
-        reload=True,
-        reload_excludes="*.log",
-    )
+    if settings.RUN_MODE == "prod":
+        workers = settings.WORKERS
+        if workers > 1 and not settings.CHROMA_HOST:
+            # 本地 PersistentClient 的向量索引在各进程内存中各自维护，多进程写入会相互覆盖
+            logger.warning("多进程部署需要配置 CHROMA_HOST 使用独立的 Chroma 服务，已回退为单进程")
+            workers = 1
+        uvicorn.run(
+            "app:app",
+            host="0.0.0.0",
+            port=settings.API_PORT,
+            log_level="info",
+            workers=workers,
+        )
+    else:
+        uvicorn.run(
+            "app:app",
+            host="0.0.0.0",
+            port=settings.API_PORT,
+            log_level="info",
+            workers=1,
+            reload=True,
+            reload_excludes="*.log",
+        )
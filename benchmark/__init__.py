@@ -0,0 +1,9 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   __init__.py
+@Time    :   2026/10/19 10:48:12
+@Author  :   SeeStars 
+@Version :   1.0
+@Desc    :   离线性能基准，需在项目根目录下以 python -m benchmark.xxx 运行
+'''
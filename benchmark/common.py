@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   common.py
+@Time    :   2026/10/19 20:05:17
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   基准共用的统计、进程资源读取与结果输出
+"""
+import os
+import json
+import time
+import resource
+import platform
+import subprocess
+
+
+def percentiles(values: list[float], points: tuple = (50, 95, 99)) -> dict:
+    """
+    @desc     : 计算分位数（线性插值），同时给出均值、最小、最大值
+    @param    : values: 样本
+    @param    : points: 分位点
+    @return   : {"p50": ..., "p95": ..., "p99": ..., "mean": ..., "min": ..., "max": ..., "count": ...}
+    """
+    if not values:
+        return {"count": 0}
+    data = sorted(values)
+    result = {}
+    for point in points:
+        rank = (len(data) - 1) * point / 100
+        low, high = int(rank), min(int(rank) + 1, len(data) - 1)
+        result[f"p{point}"] = data[low] + (data[high] - data[low]) * (rank - low)
+    result.update(mean=sum(data) / len(data), min=data[0], max=data[-1], count=len(data))
+    return result
+
+
+def read_process_usage(pid: int = None) -> dict:
+    """
+    @desc     : 读取进程的 CPU 累计时间与常驻内存，基于 /proc，仅支持 Linux
+    @param    : pid: 进程号，默认当前进程
+    @return   : {"cpu_seconds": 用户态+内核态秒数, "rss_bytes": 常驻内存字节数}
+    """
+    pid = pid or os.getpid()
+    with open(f"/proc/{pid}/stat", "r") as f:
+        # 进程名可能包含空格，从最后一个 ')' 之后开始按空格切分
+        fields = f.read().rsplit(")", 1)[1].split()
+    ticks = os.sysconf("SC_CLK_TCK")
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    return {
+        "cpu_seconds": (int(fields[11]) + int(fields[12])) / ticks,
+        "rss_bytes": int(fields[21]) * page_size,
+    }
+
+
+def peak_rss_bytes() -> int:
+    """
+    @desc     : 当前进程的峰值常驻内存
+    """
+    # Linux 下 ru_maxrss 单位为 KB，macOS 为字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if platform.system() == "Darwin" else peak * 1024
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return ""
+
+
+def write_result(result: dict, output: str = None):
+    """
+    @desc     : 补充运行环境信息后输出 JSON，指定 output 时同时写入文件
+    """
+    result.setdefault("meta", {}).update(
+        {
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": int(time.time()),
+        }
+    )
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    print(text)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   compare.py
+@Time    :   2026/10/19 21:02:37
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   对比两次基准结果的数值指标
+
+    python -m benchmark.compare before.json after.json
+"""
+import json
+import argparse
+
+
+def flatten(data, prefix: str = "") -> dict:
+    """
+    @desc     : 将嵌套结果展开为 {"recall.sequential_seconds.p95": 值}，只保留数值
+    """
+    items = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            items.update(flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        items[prefix] = data
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比两次基准结果")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    with open(args.before, "r", encoding="utf-8") as f:
+        before = flatten({k: v for k, v in json.load(f).items() if k not in ("config", "meta")})
+    with open(args.after, "r", encoding="utf-8") as f:
+        after = flatten({k: v for k, v in json.load(f).items() if k not in ("config", "meta")})
+
+    width = max((len(key) for key in before.keys() | after.keys()), default=10)
+    print(f"{'metric':<{width}}  {'before':>14}  {'after':>14}  {'change':>9}")
+    for key in sorted(before.keys() | after.keys()):
+        old, new = before.get(key), after.get(key)
+        change = f"{(new - old) / old * 100:+.1f}%" if old and new is not None else ""
+        old_text = f"{old:.6g}" if old is not None else "-"
+        new_text = f"{new:.6g}" if new is not None else "-"
+        print(f"{key:<{width}}  {old_text:>14}  {new_text:>14}  {change:>9}")
+
+
+if __name__ == "__main__":
+    main()
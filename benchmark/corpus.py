@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   corpus.py
+@Time    :   2026/10/19 20:11:42
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   生成合成中文语料与查询，用于离线基准，同一随机种子生成的内容完全一致
+"""
+import os
+import random
+
+# 每个主题一组术语，查询从同一主题取词，保证检索有可命中的文本
+TOPICS = {
+    "高血压": ["收缩压", "舒张压", "血压计", "动态血压监测", "家庭自测", "降压药", "钠盐摄入", "左心室肥厚"],
+    "糖尿病": ["空腹血糖", "糖化血红蛋白", "胰岛素", "二甲双胍", "低血糖", "视网膜病变", "足部护理", "饮食控制"],
+    "合同管理": ["甲方", "乙方", "违约责任", "付款条件", "争议解决", "保密条款", "验收标准", "履约保证金"],
+    "网络安全": ["访问控制", "身份认证", "漏洞扫描", "日志审计", "数据加密", "入侵检测", "安全基线", "应急响应"],
+    "财务报销": ["差旅费", "发票", "审批流程", "预算科目", "借款", "报销单", "住宿标准", "交通补贴"],
+    "设备维护": ["巡检周期", "故障代码", "备品备件", "润滑", "校准", "停机时间", "维修记录", "安全操作规程"],
+}
+FILLERS = ["根据", "应当", "按照规定", "在实际工作中", "需要注意的是", "一般情况下", "同时", "此外", "对于", "如果出现"]
+ENDINGS = ["。", "。", "。", "；", "！"]
+
+
+def make_sentence(rng: random.Random, topic: str) -> str:
+    terms = rng.sample(TOPICS[topic], k=rng.randint(2, 4))
+    parts = [rng.choice(FILLERS) + term for term in terms]
+    return "，".join(parts) + "相关要求" + rng.choice(ENDINGS)
+
+
+def make_document(rng: random.Random, topic: str, num_chars: int) -> str:
+    """
+    @desc     : 生成单个主题文档，按段落换行
+    @param    : topic: 主题
+    @param    : num_chars: 目标字数
+    """
+    paragraphs, size = [], 0
+    while size < num_chars:
+        paragraph = f"{topic}：" + "".join(make_sentence(rng, topic) for _ in range(rng.randint(3, 8)))
+        paragraphs.append(paragraph)
+        size += len(paragraph)
+    return "\n\n".join(paragraphs)
+
+
+def build_corpus(output_dir: str, num_files: int, chars_per_file: int, seed: int = 42) -> list[str]:
+    """
+    @desc     : 在目录下生成 .txt 语料文件
+    @param    : output_dir: 输出目录（通常为知识库目录）
+    @param    : num_files: 文件数量
+    @param    : chars_per_file: 每个文件的字数
+    @param    : seed: 随机种子
+    @return   : 文件路径列表
+    """
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    topics = list(TOPICS)
+    paths = []
+    for i in range(num_files):
+        topic = topics[i % len(topics)]
+        path = os.path.join(output_dir, f"bench_{i:05d}_{topic}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(make_document(rng, topic, chars_per_file))
+        paths.append(path)
+    return paths
+
+
+def build_queries(num_queries: int, seed: int = 7) -> list[str]:
+    """
+    @desc     : 生成查询，每条查询包含同一主题下的 2~3 个术语
+    """
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(num_queries):
+        topic = rng.choice(list(TOPICS))
+        terms = rng.sample(TOPICS[topic], k=rng.randint(2, 3))
+        queries.append(f"{topic}中{'和'.join(terms)}有什么要求？")
+    return queries
+
+
+def extract_terms(text: str, limit: int = 5) -> list[str]:
+    """
+    @desc     : 从文本中找出语料词表中的术语，供桩 LLM 模拟关键词提取
+    """
+    found = []
+    for topic, terms in TOPICS.items():
+        for term in [topic] + terms:
+            if term in text and term not in found:
+                found.append(term)
+    return found[:limit]
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   embedding_bench.py
+@Time    :   2026/10/19 10:52:30
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   嵌入后端一致性校验与吞吐对比
+
+    python -m benchmark.embedding_bench --backend onnx --backend-file onnx/model_qint8_avx512_vnni.onnx
+
+以当前 torch 默认后端（default_ef 路径）为基准，比较候选后端的余弦一致性与吞吐，
+最小余弦相似度低于阈值时以非 0 状态码退出，可直接用于 CI 校验。
+"""
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+from settings import settings
+from model.embedding_model import build_embedding_function
+
+SAMPLE_WORDS = [
+    "高血压", "收缩压", "舒张压", "血压计", "动态血压监测", "家庭自测", "袖带", "心率",
+    "降压药", "钠盐摄入", "体重指数", "糖尿病", "肾功能", "左心室肥厚", "随访", "诊断标准",
+]
+
+
+def build_texts(num_texts: int, seed: int = 42) -> list[str]:
+    """
+    @desc     : 生成用于对比的中文短文本
+    @param    : num_texts: 文本数量
+    @param    : seed: 随机种子
+    @return   : 文本列表
+    """
+    rng = random.Random(seed)
+    return [
+        "，".join(rng.choice(SAMPLE_WORDS) for _ in range(rng.randint(3, 30))) + "。"
+        for _ in range(num_texts)
+    ]
+
+
+def measure_throughput(ef, texts: list[str], batch_size: int) -> float:
+    """
+    @desc     : 计算编码吞吐（条/秒）
+    """
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        ef(texts[i : i + batch_size])
+    return len(texts) / (time.perf_counter() - start)
+
+
+def cosine_agreement(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    @desc     : 逐行计算两组向量的余弦相似度
+    """
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.sum(a * b, axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="嵌入后端一致性与吞吐基准")
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL)
+    parser.add_argument("--backend", default=settings.EMBEDDING_BACKEND)
+    parser.add_argument("--backend-file", default=settings.EMBEDDING_BACKEND_FILE)
+    parser.add_argument("--num-texts", type=int, default=256)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--output", default=None, help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    texts = build_texts(args.num_texts)
+    reference_ef = build_embedding_function(args.model, backend="torch")
+    candidate_ef = build_embedding_function(args.model, backend=args.backend, backend_file=args.backend_file)
+
+    reference = np.asarray(reference_ef(texts), dtype=np.float32)
+    candidate = np.asarray(candidate_ef(texts), dtype=np.float32)
+    cosines = cosine_agreement(reference, candidate)
+
+    # 检索一致性：以基准向量的近邻排序为准，比较 top-5 重合度
+    ref_rank = np.argsort(-reference @ reference.T, axis=1)[:, 1:6]
+    cand_rank = np.argsort(-candidate @ candidate.T, axis=1)[:, 1:6]
+    overlap = np.mean([len(set(r) & set(c)) / 5 for r, c in zip(ref_rank, cand_rank)])
+
+    result = {
+        "model": args.model,
+        "backend": args.backend,
+        "backend_file": args.backend_file,
+        "num_texts": len(texts),
+        "dimension_match": reference.shape == candidate.shape,
+        "cosine_mean": float(cosines.mean()),
+        "cosine_min": float(cosines.min()),
+        "top5_overlap": float(overlap),
+        "throughput": {
+            "torch": {bs: measure_throughput(reference_ef, texts, bs) for bs in (1, 32)},
+            args.backend: {bs: measure_throughput(candidate_ef, texts, bs) for bs in (1, 32)},
+        },
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if not result["dimension_match"] or result["cosine_min"] < args.min_cosine:
+        raise SystemExit(f"后端 {args.backend} 与 torch 输出不一致: cosine_min={result['cosine_min']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
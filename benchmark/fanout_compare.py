@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   fanout_compare.py
+@Time    :   2026/10/20 14:26:08
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   关键词扩展策略的离线对比：同一批问题与关键词分别用 fixed 与 adaptive 策略召回，
+             比较检索次数、耗时，以及 adaptive 结果对 fixed 结果的覆盖率和命中问题术语的比例
+
+    python -m benchmark.fanout_compare --num-files 50 --num-queries 200 --output fanout.json
+
+检索缓存固定关闭，两种策略都实际执行检索。
+"""
+import os
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+
+from benchmark.common import percentiles, write_result
+from benchmark.corpus import build_corpus, build_queries, extract_terms
+from benchmark.rag_bench import KB_NAME, bench_ingest, configure_environment
+from benchmark.stub_servers import StubModelServer, add_stub_arguments, stub_config_from_args
+
+POLICIES = ("fixed", "adaptive")
+
+
+def term_precision(query: str, knowledges: list[str]) -> float:
+    """
+    @desc     : 召回结果中包含问题里至少一个术语（不含主题词）的比例，作为相关性的近似
+    """
+    terms = extract_terms(query)[1:] or extract_terms(query)
+    if not knowledges:
+        return 0.0
+    return sum(any(term in knowledge for term in terms) for knowledge in knowledges) / len(knowledges)
+
+
+async def recall_with_policy(policy: str, query: str, keywords: list[str], top_k: int) -> dict:
+    from settings import settings
+    from service.metrics_service import KEYWORD_SEARCHES
+    from service.rag_service import _recall_with_timeout, _deduplicate_knowledge
+
+    settings.KEYWORDS_POLICY = policy
+    searches = KEYWORD_SEARCHES.get(policy=policy)
+    start = time.perf_counter()
+    results = await _recall_with_timeout(keywords, KB_NAME, top_k * 2, query)
+    seconds = time.perf_counter() - start
+    knowledges, ids = _deduplicate_knowledge([k for k, _, _ in results], [i for _, i, _ in results], top_k)
+    return {
+        "ids": ids,
+        "seconds": seconds,
+        "searches": KEYWORD_SEARCHES.get(policy=policy) - searches,
+        "precision": term_precision(query, knowledges),
+    }
+
+
+async def compare(queries: list[str], top_k: int) -> dict:
+    from service.metrics_service import KEYWORD_SEARCHES_AVOIDED
+    from service.rag_service import _extract_keywords
+
+    stats = {policy: {"seconds": [], "searches": 0, "precision": []} for policy in POLICIES}
+    coverage = []
+    for query in queries:
+        keywords = await _extract_keywords(query)
+        if not keywords:
+            continue
+        runs = {policy: await recall_with_policy(policy, query, keywords, top_k) for policy in POLICIES}
+        for policy, run in runs.items():
+            stats[policy]["seconds"].append(run["seconds"])
+            stats[policy]["searches"] += run["searches"]
+            stats[policy]["precision"].append(run["precision"])
+        fixed_ids = set(runs["fixed"]["ids"])
+        if fixed_ids:
+            coverage.append(len(fixed_ids & set(runs["adaptive"]["ids"])) / len(fixed_ids))
+
+    summary = {}
+    for policy, stat in stats.items():
+        summary[policy] = {
+            "searches": stat["searches"],
+            "searches_per_query": stat["searches"] / max(len(stat["seconds"]), 1),
+            "seconds": percentiles(stat["seconds"]),
+            "term_precision": sum(stat["precision"]) / max(len(stat["precision"]), 1),
+        }
+    summary["adaptive"]["avoided"] = {
+        reason: KEYWORD_SEARCHES_AVOIDED.get(reason=reason) for reason in ("duplicate", "low_score")
+    }
+    summary["adaptive_coverage_of_fixed"] = percentiles(coverage)
+    summary["search_reduction"] = 1 - summary["adaptive"]["searches"] / max(summary["fixed"]["searches"], 1)
+    return summary
+
+
+async def run(args) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="docrag_fanout_")
+    stub = await StubModelServer(stub_config_from_args(args)).start()
+    configure_environment(args, work_dir, stub.url)
+    try:
+        from settings import settings
+
+        paths = build_corpus(
+            os.path.join(settings.UPLOAD_DIR, KB_NAME), args.num_files, args.chars_per_file, seed=args.seed
+        )
+        ingest = await bench_ingest(paths, args.chunk_size, args.chunk_overlap, args.ingest_concurrency)
+        queries = build_queries(args.num_queries, seed=args.seed)
+        return {
+            "config": {key: value for key, value in vars(args).items() if key != "output"},
+            "ingest": {"files": ingest["files"], "chunks": ingest["chunks"]},
+            "settings": {
+                "KEYWORDS_DELAY": settings.KEYWORDS_DELAY,
+                "KEYWORDS_MIN_NOVELTY": settings.KEYWORDS_MIN_NOVELTY,
+                "KEYWORDS_MIN_SCORE": settings.KEYWORDS_MIN_SCORE,
+            },
+            "compare": await compare(queries, args.top_k),
+        }
+    finally:
+        await stub.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="关键词扩展策略对比")
+    parser.add_argument("--num-files", type=int, default=50, help="语料文件数量")
+    parser.add_argument("--chars-per-file", type=int, default=20000, help="每个文件的字数")
+    parser.add_argument("--num-queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=15, help="每个问题最终返回的知识数量")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--ingest-concurrency", type=int, default=8)
+    parser.add_argument("--embedding-model", default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="结果 JSON 输出路径")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    args.retrieval_cache_size = 0
+
+    write_result(asyncio.run(run(args)), args.output)
+
+
+if __name__ == "__main__":
+    main()
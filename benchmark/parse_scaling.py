@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   parse_scaling.py
+@Time    :   2026/10/19 23:41:36
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   解析与切片的扩展性基准：对比线程模式与不同大小的进程池（INGEST_PROCESS_WORKERS），
+             只测解析与切片，不含嵌入与写库
+
+    python -m benchmark.parse_scaling --num-files 400 --chars-per-file 50000 --docx-ratio 0.5 --output scaling.json
+    python -m benchmark.parse_scaling --workers 1,2,4,8
+"""
+import os
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import statistics
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import docx
+
+from benchmark.common import write_result
+from benchmark.corpus import build_corpus
+from service.parse_worker import parse_and_split
+
+
+def to_docx(path: str) -> str:
+    """
+    @desc     : 把 .txt 语料转为 .docx，每个空行分隔的段落对应一个 docx 段落
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        paragraphs = f.read().split("\n\n")
+    document = docx.Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    docx_path = os.path.splitext(path)[0] + ".docx"
+    document.save(docx_path)
+    os.remove(path)
+    return docx_path
+
+
+def default_workers() -> list[int]:
+    cpus = os.cpu_count() or 1
+    workers, n = [], 1
+    while n < cpus:
+        workers.append(n)
+        n *= 2
+    return workers + [cpus]
+
+
+async def run_threads(paths: list[str], args) -> int:
+    """
+    @desc     : 线程模式：与未启用进程池时相同，解析与切片放到线程池，受 GIL 限制
+    """
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def worker(path: str) -> int:
+        async with sem:
+            return len(await asyncio.to_thread(parse_and_split, path, args.chunk_size, args.chunk_overlap))
+
+    return sum(await asyncio.gather(*[worker(path) for path in paths]))
+
+
+async def run_pool(pool: ProcessPoolExecutor, paths: list[str], args) -> int:
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(
+        *[loop.run_in_executor(pool, parse_and_split, path, args.chunk_size, args.chunk_overlap) for path in paths]
+    )
+    return sum(len(chunks) for chunks in results)
+
+
+def summarize(timings: list[float], chunks: int, num_files: int, total_bytes: int) -> dict:
+    seconds = statistics.median(timings)
+    return {
+        "seconds": seconds,
+        "seconds_all": timings,
+        "chunks": chunks,
+        "files_per_second": num_files / seconds,
+        "mb_per_second": total_bytes / 1024 / 1024 / seconds,
+    }
+
+
+async def run(args) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="docrag_parse_")
+    try:
+        paths = build_corpus(work_dir, args.num_files, args.chars_per_file, seed=args.seed)
+        num_docx = int(len(paths) * args.docx_ratio)
+        paths = [to_docx(path) for path in paths[:num_docx]] + paths[num_docx:]
+        total_bytes = sum(os.path.getsize(path) for path in paths)
+
+        timings, chunks = [], 0
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            chunks = await run_threads(paths, args)
+            timings.append(time.perf_counter() - start)
+        modes = {"threads": summarize(timings, chunks, len(paths), total_bytes)}
+
+        for workers in args.workers:
+            start = time.perf_counter()
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            try:
+                # 预热：子进程启动与导入单独计时，不计入吞吐
+                await run_pool(pool, paths[:workers], args)
+                startup = time.perf_counter() - start
+                timings = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    chunks = await run_pool(pool, paths, args)
+                    timings.append(time.perf_counter() - start)
+            finally:
+                pool.shutdown()
+            result = summarize(timings, chunks, len(paths), total_bytes)
+            result["startup_seconds"] = startup
+            modes[f"processes_{workers}"] = result
+
+        baseline = modes["threads"]["seconds"]
+        for name, result in modes.items():
+            result["speedup"] = baseline / result["seconds"]
+            if name.startswith("processes_"):
+                result["efficiency"] = result["speedup"] / int(name.split("_")[1])
+
+        return {
+            "config": {key: value for key, value in vars(args).items() if key != "output"},
+            "corpus": {"files": len(paths), "docx_files": num_docx, "bytes": total_bytes},
+            "modes": modes,
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解析与切片的扩展性基准")
+    parser.add_argument("--num-files", type=int, default=200)
+    parser.add_argument("--chars-per-file", type=int, default=50000)
+    parser.add_argument("--docx-ratio", type=float, default=0.5, help="转为 docx 的文件比例")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8, help="线程模式下同时处理的文件数")
+    parser.add_argument(
+        "--workers",
+        type=lambda value: [int(n) for n in value.split(",")],
+        default=default_workers(),
+        help="逗号分隔的进程池大小，默认 1,2,4...直到 CPU 核数",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="每种模式重复次数，取中位数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    write_result(asyncio.run(run(args)), args.output)
+
+
+if __name__ == "__main__":
+    main()
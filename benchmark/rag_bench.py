@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   rag_bench.py
+@Time    :   2026/10/19 20:41:55
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   检索与入库的离线基准：合成中文语料 + 桩 LLM/VLM，输出 JSON 便于前后对比
+
+    python -m benchmark.rag_bench --num-files 200 --chars-per-file 20000 --output before.json
+    python -m benchmark.compare before.json after.json
+
+数据与向量库写入临时目录，不影响正式知识库；嵌入模型仍使用真实模型，可通过 --embedding-model 换成小模型。
+"""
+import os
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+
+from benchmark.common import percentiles, read_process_usage, peak_rss_bytes, write_result
+from benchmark.corpus import build_corpus, build_queries
+from benchmark.stub_servers import StubModelServer, add_stub_arguments, stub_config_from_args
+
+KB_NAME = "bench"
+
+
+def configure_environment(args, work_dir: str, stub_url: str):
+    """
+    @desc     : settings 在导入时读取环境变量，必须在导入 service 之前调用
+    """
+    os.environ.update(
+        {
+            "UPLOAD_DIR": os.path.join(work_dir, "uploads"),
+            "CHROMA_PATH": os.path.join(work_dir, ".chroma"),
+            "CHROMA_HOST": "",
+            "LLM_BASE_URL": stub_url,
+            "VLM_BASE_URL": stub_url,
+            "CHATGLM_API_KEY": "stub",
+            "TRACE_ENABLED": "false",
+            "RETRIEVAL_CACHE_SIZE": str(args.retrieval_cache_size),
+        }
+    )
+    if args.embedding_model:
+        os.environ["EMBEDDING_MODEL"] = args.embedding_model
+
+
+def rss_mb() -> float:
+    return round(read_process_usage()["rss_bytes"] / 1024 / 1024, 1)
+
+
+async def bench_ingest(paths: list[str], chunk_size: int, chunk_overlap: int, max_concurrent: int) -> dict:
+    from service.async_kb_service import store_files_concurrently
+
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    start = time.perf_counter()
+    num_chunks, failed = await store_files_concurrently(paths, KB_NAME, chunk_size, chunk_overlap, max_concurrent)
+    seconds = time.perf_counter() - start
+    return {
+        "files": len(paths),
+        "failed_files": len(failed),
+        "chunks": num_chunks,
+        "bytes": total_bytes,
+        "seconds": seconds,
+        "files_per_second": len(paths) / seconds,
+        "chunks_per_second": num_chunks / seconds,
+        "mb_per_second": total_bytes / 1024 / 1024 / seconds,
+    }
+
+
+def bench_bm25_load(repeat: int) -> dict:
+    from settings import settings
+    from model.bm25_index import BM25Manager
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        manager = BM25Manager(KB_NAME)
+        timings.append(time.perf_counter() - start)
+    index_file = os.path.join(settings.UPLOAD_DIR, KB_NAME, settings.BM25_INDEX_NAME)
+    return {
+        "docs": len(manager.ids),
+        "index_bytes": os.path.getsize(index_file) if os.path.exists(index_file) else 0,
+        "seconds": percentiles(timings),
+    }
+
+
+def dir_bytes(path: str, prefix: str = "") -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files if name.startswith(prefix))
+    return total
+
+
+def bench_disk() -> dict:
+    """
+    @desc     : 知识库各部分的磁盘占用
+    """
+    from settings import settings
+
+    kb_path = os.path.join(settings.UPLOAD_DIR, KB_NAME)
+    return {
+        "chroma_bytes": dir_bytes(settings.CHROMA_PATH),
+        "bm25_bytes": dir_bytes(kb_path, settings.BM25_INDEX_NAME),
+        "chunk_store_bytes": dir_bytes(kb_path, ".chunks"),
+    }
+
+
+async def bench_recall(queries: list[str], concurrency: int, warmup: int) -> dict:
+    from service.rag_service import recall_knowledge
+
+    for query in queries[:warmup]:
+        await recall_knowledge(query, kb_name=KB_NAME)
+
+    sequential, hits = [], 0
+    for query in queries:
+        start = time.perf_counter()
+        knowledges, _ = await recall_knowledge(query, kb_name=KB_NAME)
+        sequential.append(time.perf_counter() - start)
+        hits += bool(knowledges)
+
+    sem = asyncio.Semaphore(concurrency)
+    concurrent = []
+
+    async def worker(query: str):
+        async with sem:
+            start = time.perf_counter()
+            await recall_knowledge(query, kb_name=KB_NAME)
+            concurrent.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(query) for query in queries])
+    wall = time.perf_counter() - start
+
+    return {
+        "queries": len(queries),
+        "non_empty": hits,
+        "sequential_seconds": percentiles(sequential),
+        "concurrency": concurrency,
+        "concurrent_seconds": percentiles(concurrent),
+        "concurrent_qps": len(queries) / wall,
+    }
+
+
+async def run(args) -> dict:
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="docrag_bench_")
+    stub = await StubModelServer(stub_config_from_args(args)).start()
+    configure_environment(args, work_dir, stub.url)
+    result = {
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "work_dir", "keep")
+        },
+        "memory_mb": {"baseline": rss_mb()},
+    }
+
+    try:
+        start = time.perf_counter()
+        # 导入即加载默认嵌入模型
+        import service.rag_service  # noqa: F401
+        from settings import settings
+
+        result["startup_seconds"] = time.perf_counter() - start
+        result["memory_mb"]["after_import"] = rss_mb()
+
+        paths = build_corpus(
+            os.path.join(settings.UPLOAD_DIR, KB_NAME), args.num_files, args.chars_per_file, seed=args.seed
+        )
+        result["ingest"] = await bench_ingest(paths, args.chunk_size, args.chunk_overlap, args.ingest_concurrency)
+        result["memory_mb"]["after_ingest"] = rss_mb()
+
+        result["bm25_load"] = await asyncio.to_thread(bench_bm25_load, args.bm25_loads)
+        result["memory_mb"]["after_bm25_load"] = rss_mb()
+        result["disk"] = bench_disk()
+
+        queries = build_queries(args.num_queries, seed=args.seed)
+        result["recall"] = await bench_recall(queries, args.concurrency, args.warmup)
+        result["memory_mb"]["after_recall"] = rss_mb()
+        result["memory_mb"]["peak"] = round(peak_rss_bytes() / 1024 / 1024, 1)
+        result["stub_requests"] = dict(stub.requests)
+    finally:
+        await stub.stop()
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检索与入库离线基准")
+    parser.add_argument("--num-files", type=int, default=50, help="语料文件数量")
+    parser.add_argument("--chars-per-file", type=int, default=20000, help="每个文件的字数")
+    parser.add_argument("--num-queries", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=8, help="并发召回的请求数")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=50)
+    parser.add_argument("--ingest-concurrency", type=int, default=8)
+    parser.add_argument("--bm25-loads", type=int, default=5, help="冷加载 BM25 索引的次数")
+    parser.add_argument("--retrieval-cache-size", type=int, default=0, help="检索缓存大小，默认关闭以测量实际检索")
+    parser.add_argument("--embedding-model", default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--work-dir", default=None, help="工作目录，默认使用临时目录并在结束后删除")
+    parser.add_argument("--keep", action="store_true", help="保留临时目录")
+    parser.add_argument("--output", default=None, help="结果 JSON 输出路径")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    write_result(asyncio.run(run(args)), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   sse_load.py
+@Time    :   2026/10/19 21:20:48
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   并发 SSE 问答压测：同时打开大量 /chat 流，统计首事件耗时、事件间隔与服务端 CPU/内存
+
+    # 自动启动桩 LLM 与独立的服务进程，数据写入临时目录
+    python -m benchmark.sse_load --streams 300 --token-interval-ms 20 --output sse.json
+
+    # 压测已在运行的服务（需自行将其 LLM_BASE_URL 指向桩服务），--server-pid 用于采集 CPU/内存
+    python -m benchmark.sse_load --url http://127.0.0.1:5510 --server-pid 12345 --kb-name default
+
+事件间隔的长尾通常意味着事件循环被同步代码阻塞，可结合服务端 /metrics 的事件循环延迟一起看。
+"""
+import os
+import sys
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import aiohttp
+
+from benchmark.common import percentiles, read_process_usage, write_result
+from benchmark.corpus import build_corpus, build_queries
+from benchmark.stub_servers import StubModelServer, add_stub_arguments, stub_config_from_args
+
+KB_NAME = "bench"
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_ready(session: aiohttp.ClientSession, url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f"{url}/default") as resp:
+                if resp.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.5)
+    raise TimeoutError(f"服务在 {timeout}s 内未就绪: {url}")
+
+
+def start_server(port: int, work_dir: str, stub_url: str) -> subprocess.Popen:
+    """
+    @desc     : 以单进程、无热重载的方式启动服务，数据写入临时目录
+    """
+    env = dict(
+        os.environ,
+        UPLOAD_DIR=os.path.join(work_dir, "uploads"),
+        CHROMA_PATH=os.path.join(work_dir, ".chroma"),
+        CHROMA_HOST="",
+        LLM_BASE_URL=stub_url,
+        VLM_BASE_URL=stub_url,
+        CHATGLM_API_KEY="stub",
+        TRACE_ENABLED="false",
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=PROJECT_DIR,
+        env=env,
+    )
+
+
+async def prepare_kb(session: aiohttp.ClientSession, url: str, work_dir: str, args):
+    """
+    @desc     : 新建压测知识库并入库合成语料
+    """
+    async with session.post(f"{url}/api/kb/create", params={"kb_name": args.kb_name}) as resp:
+        await resp.read()
+    paths = build_corpus(os.path.join(work_dir, "uploads", args.kb_name), args.num_files, args.chars_per_file)
+    async with session.post(
+        f"{url}/api/kb/store_file_chunks", params={"kb_name": args.kb_name}, json=paths
+    ) as resp:
+        body = await resp.json()
+        if body.get("type") != "success":
+            raise RuntimeError(f"语料入库失败: {body}")
+
+
+async def read_sse(resp: aiohttp.ClientResponse):
+    """
+    @desc     : 逐个解析 SSE 事件，忽略 ping 注释
+    @return   : 异步生成 (事件名, 数据)
+    """
+    event, data = "message", []
+    async for raw in resp.content:
+        line = raw.decode("utf-8").rstrip("\r\n")
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith(":"):
+            continue
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+
+
+async def run_stream(session: aiohttp.ClientSession, url: str, query: str, args, delay: float) -> dict:
+    await asyncio.sleep(delay)
+    payload = {"query": query, "kb_name": args.kb_name, "stream": True}
+    if not args.allow_answer_cache:
+        # 带历史的请求不会命中回答缓存，保证每条流都真正走检索与生成
+        payload["history"] = [{"role": "user", "content": "你好"}, {"role": "assistant", "content": "你好"}]
+
+    result = {"ok": False, "events": 0, "gaps": []}
+    start = time.perf_counter()
+    last = None
+    try:
+        async with session.post(f"{url}/api/chat", json=payload) as resp:
+            async for event, _ in read_sse(resp):
+                now = time.perf_counter()
+                if last is None:
+                    result["first_event"] = now - start
+                else:
+                    result["gaps"].append(now - last)
+                if event == "add" and "first_token" not in result:
+                    result["first_token"] = now - start
+                last = now
+                result["events"] += 1
+                if event == "finish":
+                    result["ok"] = True
+    except Exception as e:
+        result["error"] = repr(e)
+    result["duration"] = time.perf_counter() - start
+    return result
+
+
+async def sample_process(pid: int, interval: float, samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        try:
+            samples.append((time.perf_counter(), read_process_usage(pid)))
+        except (FileNotFoundError, ProcessLookupError):
+            return
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def summarize_process(samples: list) -> dict:
+    if len(samples) < 2:
+        return {}
+    (t0, first), (t1, last) = samples[0], samples[-1]
+    cpu = [
+        (b["cpu_seconds"] - a["cpu_seconds"]) / (tb - ta)
+        for (ta, a), (tb, b) in zip(samples, samples[1:])
+        if tb > ta
+    ]
+    return {
+        "cpu_utilization_mean": (last["cpu_seconds"] - first["cpu_seconds"]) / (t1 - t0),
+        "cpu_utilization_max": max(cpu, default=0.0),
+        "rss_mb_start": round(first["rss_bytes"] / 1024 / 1024, 1),
+        "rss_mb_max": round(max(s["rss_bytes"] for _, s in samples) / 1024 / 1024, 1),
+    }
+
+
+async def read_loop_lag(session: aiohttp.ClientSession, url: str) -> dict:
+    """
+    @desc     : 从服务端 /metrics 读取事件循环延迟
+    """
+    try:
+        async with session.get(f"{url}/metrics") as resp:
+            text = await resp.text()
+    except aiohttp.ClientError:
+        return {}
+    values = {}
+    for line in text.splitlines():
+        for name in ("docrag_event_loop_lag_seconds", "docrag_event_loop_lag_histogram_seconds_sum",
+                     "docrag_event_loop_lag_histogram_seconds_count"):
+            if line.startswith(name + " "):
+                values[name] = float(line.split()[-1])
+    count = values.get("docrag_event_loop_lag_histogram_seconds_count")
+    if not count:
+        return {}
+    return {
+        "last_seconds": values.get("docrag_event_loop_lag_seconds"),
+        "mean_seconds": values["docrag_event_loop_lag_histogram_seconds_sum"] / count,
+    }
+
+
+async def run(args) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="docrag_sse_")
+    stub = None
+    server = None
+    url = args.url.rstrip("/") if args.url else None
+    server_pid = args.server_pid
+    timeout = aiohttp.ClientTimeout(total=None, sock_read=args.read_timeout)
+    connector = aiohttp.TCPConnector(limit=0)
+
+    try:
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            if not url:
+                stub = await StubModelServer(stub_config_from_args(args)).start()
+                port = free_port()
+                server = start_server(port, work_dir, stub.url)
+                server_pid = server.pid
+                url = f"http://127.0.0.1:{port}"
+                await wait_until_ready(session, url, args.startup_timeout)
+                await prepare_kb(session, url, work_dir, args)
+
+            samples, stop = [], asyncio.Event()
+            sampler = asyncio.create_task(sample_process(server_pid, 0.5, samples, stop)) if server_pid else None
+
+            queries = build_queries(args.streams)
+            start = time.perf_counter()
+            streams = await asyncio.gather(
+                *[
+                    run_stream(session, url, query, args, args.ramp_seconds * i / max(args.streams, 1))
+                    for i, query in enumerate(queries)
+                ]
+            )
+            wall = time.perf_counter() - start
+            stop.set()
+            if sampler:
+                await sampler
+
+            gaps = [gap for item in streams for gap in item["gaps"]]
+            errors = [item["error"] for item in streams if "error" in item]
+            return {
+                "config": {k: v for k, v in vars(args).items() if k != "output"},
+                "streams": {
+                    "total": len(streams),
+                    "completed": sum(item["ok"] for item in streams),
+                    "errors": len(errors),
+                    "error_samples": errors[:5],
+                    "wall_seconds": wall,
+                    "events_per_second": sum(item["events"] for item in streams) / wall,
+                },
+                "time_to_first_event": percentiles([item["first_event"] for item in streams if "first_event" in item]),
+                "time_to_first_token": percentiles([item["first_token"] for item in streams if "first_token" in item]),
+                "inter_event_gap": percentiles(gaps),
+                "max_gap_per_stream": percentiles([max(item["gaps"]) for item in streams if item["gaps"]]),
+                "stream_duration": percentiles([item["duration"] for item in streams]),
+                "server": summarize_process(samples),
+                "event_loop_lag": await read_loop_lag(session, url),
+            }
+    finally:
+        if server:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        if stub:
+            await stub.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发 SSE 问答压测")
+    parser.add_argument("--url", default=None, help="已运行服务的地址，为空时自动启动服务与桩 LLM")
+    parser.add_argument("--server-pid", type=int, default=None, help="已运行服务的进程号，用于采集 CPU/内存")
+    parser.add_argument("--kb-name", default=KB_NAME)
+    parser.add_argument("--streams", type=int, default=200, help="并发 SSE 流数量")
+    parser.add_argument("--ramp-seconds", type=float, default=2.0, help="在该时间内均匀发起所有流")
+    parser.add_argument("--num-files", type=int, default=20, help="自动启动时入库的语料文件数")
+    parser.add_argument("--chars-per-file", type=int, default=10000)
+    parser.add_argument("--allow-answer-cache", action="store_true", help="允许命中回答缓存")
+    parser.add_argument("--read-timeout", type=float, default=120)
+    parser.add_argument("--startup-timeout", type=float, default=180)
+    parser.add_argument("--output", default=None, help="结果 JSON 输出路径")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    write_result(asyncio.run(run(args)), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   stub_servers.py
+@Time    :   2026/10/19 20:24:06
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   本地 OpenAI 兼容的桩 LLM / VLM 服务，延迟可配置，用于离线基准与压测
+
+    python -m benchmark.stub_servers --port 9100 --latency-ms 200 --token-interval-ms 20
+
+单独运行时将 LLM_BASE_URL 与 VLM_BASE_URL 指向 http://127.0.0.1:9100 即可。
+"""
+import json
+import time
+import uuid
+import asyncio
+import argparse
+from dataclasses import dataclass
+
+from aiohttp import web
+
+from benchmark.corpus import extract_terms
+
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 50  # LLM 首个输出前的延迟
+    token_interval_ms: float = 10  # 流式输出的间隔
+    num_tokens: int = 64  # 流式回答的输出块数量
+    vlm_latency_ms: float = 300  # 每张图片的识别延迟
+
+
+class StubModelServer:
+    """
+    @name     : StubModelServer
+    @desc     : 提供 /chat/completions：
+                图片输入按 VLM 处理，返回固定的识别文本；
+                非流式文本请求视为关键词提取，返回问题中出现的语料术语；
+                流式文本请求按间隔逐块输出回答
+    """
+
+    def __init__(self, config: StubConfig = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or StubConfig()
+        self.host = host
+        self.port = port
+        self.requests = {"llm": 0, "vlm": 0}
+        self._runner = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> "StubModelServer":
+        app = web.Application()
+        app.router.add_post("/chat/completions", self.chat_completions)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # port=0 时由系统分配端口
+        self.port = self._runner.addresses[0][1]
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    @staticmethod
+    def _completion(model: str, content: str) -> dict:
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    @staticmethod
+    def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> bytes:
+        data = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        model = body.get("model", "stub")
+        user_content = body["messages"][-1]["content"]
+
+        if isinstance(user_content, list):
+            self.requests["vlm"] += 1
+            await asyncio.sleep(self.config.vlm_latency_ms / 1000)
+            return web.json_response(self._completion(model, "桩服务识别的图片文字：设备维护巡检周期与校准要求。"))
+
+        self.requests["llm"] += 1
+        await asyncio.sleep(self.config.latency_ms / 1000)
+        if not body.get("stream"):
+            keywords = extract_terms(user_content) or [user_content]
+            return web.json_response(self._completion(model, ",".join(keywords)))
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        await response.write(self._chunk(completion_id, model, {"role": "assistant", "content": ""}))
+        for i in range(self.config.num_tokens):
+            await response.write(self._chunk(completion_id, model, {"content": f"片段{i}"}))
+            await asyncio.sleep(self.config.token_interval_ms / 1000)
+        await response.write(self._chunk(completion_id, model, {}, finish_reason="stop"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency-ms", type=float, default=StubConfig.latency_ms, help="LLM 首个输出前的延迟")
+    parser.add_argument("--token-interval-ms", type=float, default=StubConfig.token_interval_ms, help="流式输出间隔")
+    parser.add_argument("--num-tokens", type=int, default=StubConfig.num_tokens, help="流式回答的输出块数量")
+    parser.add_argument("--vlm-latency-ms", type=float, default=StubConfig.vlm_latency_ms, help="每张图片的识别延迟")
+
+
+def stub_config_from_args(args) -> StubConfig:
+    return StubConfig(
+        latency_ms=args.latency_ms,
+        token_interval_ms=args.token_interval_ms,
+        num_tokens=args.num_tokens,
+        vlm_latency_ms=args.vlm_latency_ms,
+    )
+
+
+async def serve_forever(server: StubModelServer):
+    await server.start()
+    print(f"桩模型服务已启动: {server.url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的桩 LLM / VLM 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    asyncio.run(serve_forever(StubModelServer(stub_config_from_args(args), args.host, args.port)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   multipart_stream.py
+@Time    :   2026/10/19 13:05:41
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   边接收边解析 multipart/form-data 请求体，不在内存或临时文件中缓存整个文件
+"""
+
+from fastapi import Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+
+class MultipartStreamReader:
+    """
+    @name     : MultipartStreamReader
+    @desc     : 将请求体解析为事件流：
+                ("file", 字段名, 文件名) → 若干 ("data", bytes) → ("end",)
+                普通表单字段产生 ("field", 字段名, 值)
+    """
+
+    def __init__(self, request: Request):
+        self.request = request
+        self.events = []
+
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._field_name = None
+        self._is_file = False
+        self._field_value = b""
+
+    def _on_part_begin(self):
+        self._disposition = b""
+        self._field_value = b""
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        self._field_name = options.get(b"name", b"").decode("utf-8", errors="replace")
+        self._is_file = b"filename" in options
+        if self._is_file:
+            filename = options[b"filename"].decode("utf-8", errors="replace")
+            self.events.append(("file", self._field_name, filename))
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._is_file:
+            self.events.append(("data", data[start:end]))
+        else:
+            self._field_value += data[start:end]
+
+    def _on_part_end(self):
+        if self._is_file:
+            self.events.append(("end",))
+        else:
+            self.events.append(("field", self._field_name, self._field_value.decode("utf-8", errors="replace")))
+
+    async def __aiter__(self):
+        _, params = parse_options_header(self.request.headers.get("content-type", ""))
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise ValueError("请求体不是合法的 multipart/form-data")
+
+        parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+            },
+        )
+        async for chunk in self.request.stream():
+            parser.write(chunk)
+            events, self.events = self.events, []
+            for event in events:
+                yield event
+        parser.finalize()
+        events, self.events = self.events, []
+        for event in events:
+            yield event
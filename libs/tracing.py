@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   tracing.py
+@Time    :   2026/10/19 18:02:15
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   请求级耗时追踪：按阶段记录 span，结束后以 OpenTelemetry 字段格式逐行写入 JSONL 文件，
+             写入在后台线程中进行，文件按大小轮转
+"""
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import random
+import asyncio
+import inspect
+import logging
+import logging.handlers
+import functools
+import threading
+import contextvars
+from contextlib import aclosing, contextmanager
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# 当前请求的 Trace 与所在 span，asyncio 任务与 to_thread 都会复制上下文，子任务中的 span 自动挂到父 span 下
+_current_trace: contextvars.ContextVar["Trace | None"] = contextvars.ContextVar("current_trace", default=None)
+_current_span: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("current_span", default=None)
+
+# span 结束时的回调 listener(span)，供指标等模块订阅，与是否处于 Trace 中无关
+SPAN_LISTENERS: list = []
+
+
+class Span:
+    """
+    @name     : Span
+    @desc     : 一个阶段的耗时记录
+    """
+
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, parent_id: str | None, attributes: dict):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns or time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def to_otel(self, trace_id: str) -> dict:
+        return {
+            "traceId": trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+        }
+
+
+class Trace:
+    """
+    @name     : Trace
+    @desc     : 一次请求（问答或入库）的全部 span
+    """
+
+    def __init__(self, name: str, **attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.root = Span(name, None, attributes)
+        self.spans: list[Span] = [self.root]
+        self.finished = False
+
+    @contextmanager
+    def activate(self):
+        """
+        @desc     : 将该 Trace 设为当前上下文的 Trace，适用于在生成器等不同任务中继续记录
+        """
+        trace_token = _current_trace.set(self)
+        span_token = _current_span.set(self.root)
+        try:
+            yield self
+        finally:
+            try:
+                _current_span.reset(span_token)
+                _current_trace.reset(trace_token)
+            except ValueError:
+                # 客户端断开后生成器由垃圾回收在其他上下文中关闭，此时无需恢复
+                pass
+
+    def summary(self) -> dict:
+        """
+        @desc     : 按阶段汇总耗时
+        @return   : {"total_ms": 总耗时, "stages": {阶段名: {"count": 次数, "ms": 累计毫秒}}}，
+                    同名阶段并发执行时累计值可能超过总耗时
+        """
+        result = {"total_ms": round(self.root.duration_ms, 2), "stages": {}}
+        for item in self.spans[1:]:
+            stage = result["stages"].setdefault(item.name, {"count": 0, "ms": 0.0})
+            stage["count"] += 1
+            stage["ms"] = round(stage["ms"] + item.duration_ms, 2)
+        return result
+
+    def finish(self):
+        """
+        @desc     : 结束根 span 并导出
+        """
+        if self.finished:
+            return
+        self.finished = True
+        self.root.end_ns = time.time_ns()
+        _notify(self.root)
+        if settings.TRACE_ENABLED and random.random() < settings.TRACE_SAMPLE_RATE:
+            export_trace(self)
+
+
+def _notify(item: Span):
+    for listener in SPAN_LISTENERS:
+        try:
+            listener(item)
+        except Exception as e:
+            logger.error(f"span 回调执行失败: {e}")
+
+
+class TraceExporter:
+    """
+    @name     : TraceExporter
+    @desc     : 后台线程序列化并写入 Trace，调用方只入队不做磁盘 IO；文件超过 TRACE_FILE_MAX_BYTES 时轮转，
+                队列积压超过 max_pending 时丢弃新的 Trace
+    """
+
+    def __init__(self, max_pending: int = 10000):
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._writer = logging.getLogger("docrag.trace")
+        self._writer.propagate = False
+        self._writer.setLevel(logging.INFO)
+
+    def submit(self, record: dict):
+        if self._thread is None:
+            self._start()
+        if self.queue.qsize() >= self.max_pending:
+            self.dropped += 1
+            return
+        self.queue.put(record)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            if settings.TRACE_FILE:
+                os.makedirs(os.path.dirname(os.path.abspath(settings.TRACE_FILE)), exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    settings.TRACE_FILE,
+                    maxBytes=settings.TRACE_FILE_MAX_BYTES,
+                    backupCount=settings.TRACE_FILE_BACKUPS,
+                    encoding="utf-8",
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                self._writer.addHandler(handler)
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            try:
+                line = json.dumps(record, ensure_ascii=False, default=str)
+                if settings.TRACE_FILE:
+                    self._writer.info(line)
+                else:
+                    logger.info(f"trace: {line}")
+            except Exception as e:
+                logger.error(f"写入 trace 失败: {e}")
+
+    def close(self, timeout: float = 5.0):
+        """
+        @desc     : 写完已入队的 Trace 后停止后台线程
+        """
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+        for handler in list(self._writer.handlers):
+            handler.close()
+            self._writer.removeHandler(handler)
+
+
+TRACE_EXPORTER = TraceExporter()
+
+
+def export_trace(trace: Trace):
+    """
+    @desc     : 将 Trace 交给后台线程，以一行 JSON 追加到 TRACE_FILE，未配置文件时写入日志
+    """
+    TRACE_EXPORTER.submit(
+        {
+            "traceId": trace.trace_id,
+            "name": trace.root.name,
+            "durationMs": round(trace.root.duration_ms, 2),
+            "spans": [item.to_otel(trace.trace_id) for item in trace.spans],
+        }
+    )
+
+
+def current_trace() -> Trace | None:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    @desc     : 在当前 Trace 下记录一个阶段，没有活动 Trace 时不做记录
+    @param    : name: 阶段名称
+    @param    : attributes: 附加属性
+    """
+    trace = _current_trace.get()
+    parent = _current_span.get()
+    item = Span(name, parent.span_id if parent else None, attributes)
+    if trace is not None:
+        trace.spans.append(item)
+    token = _current_span.set(item)
+    try:
+        yield item
+    except BaseException as e:
+        item.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        item.end_ns = time.time_ns()
+        _notify(item)
+
+
+@contextmanager
+def start_trace(name: str, **attributes):
+    """
+    @desc     : 开始一个根 Trace，退出时导出；已处于其他 Trace 中时退化为普通 span
+    @param    : name: 根 span 名称
+    @param    : attributes: 附加属性
+    """
+    if _current_trace.get() is not None:
+        with span(name, **attributes) as item:
+            yield item
+        return
+
+    trace = Trace(name, **attributes)
+    with trace.activate():
+        try:
+            yield trace.root
+        except BaseException as e:
+            trace.root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            trace.finish()
+
+
+def traced(name: str = None):
+    """
+    @desc     : 为函数、协程函数或异步生成器记录 span 的装饰器，异步生成器额外记录首个结果的耗时
+    @param    : name: 阶段名称，默认为函数名
+    """
+
+    def decorator(func):
+        span_name = name or func.__name__
+
+        if inspect.isasyncgenfunction(func):
+
+            @functools.wraps(func)
+            async def gen_wrapper(*args, **kwargs):
+                # 生成器可能在其他上下文中被关闭，这里不切换当前 span，只记录耗时与首个结果的时间
+                trace = _current_trace.get()
+                parent = _current_span.get()
+                item = Span(span_name, parent.span_id if parent else None, {})
+                if trace is not None:
+                    trace.spans.append(item)
+                try:
+                    # 提前关闭时同步关闭被包装的生成器，使其 finally 立即执行
+                    async with aclosing(func(*args, **kwargs)) as gen:
+                        async for value in gen:
+                            if "first_chunk_ms" not in item.attributes:
+                                item.set("first_chunk_ms", round(item.duration_ms, 2))
+                            yield value
+                except BaseException as e:
+                    item.error = f"{type(e).__name__}: {e}"
+                    raise
+                finally:
+                    item.end_ns = time.time_ns()
+                    _notify(item)
+
+            return gen_wrapper
+
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
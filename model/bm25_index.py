@@ -10,10 +10,16 @@
 
 import os
 import json
+import time
 import logging
+import threading
+from concurrent.futures import Future
+from filelock import FileLock
 from rank_bm25 import BM25Okapi
 from collections import OrderedDict
 
+from model.chunk_store import CHUNK_STORES, chunk_file_name
+
 logger = logging.getLogger(__name__)
 
 from settings import settings
@@ -25,57 +31,178 @@ class BM25Manager:
     """
     @name     : BM25Manager
     @desc     : 管理单个知识库的 BM25 索引
+                写操作追加到日志文件并递增版本号，全程持有文件锁，多进程间串行；
+                读方检测到版本变化后只回放新增的日志，不必重新加载整个索引。
+                索引文件与日志只记录文本块 id，原文保存在文本块存储中，检索时只读取最终 top_k 的原文
     """
 
     def __init__(self, kb_name: str, bm25_file: str = settings.BM25_INDEX_NAME):
         self.kb_name = kb_name
         self.bm25_file = os.path.join(UPLOAD_DIR, kb_name, bm25_file)
-
-        self.docs = []
+        self.journal_file = self.bm25_file + ".journal"
+        self.version_file = self.bm25_file + ".version"
+        # FileLock 会创建缺失的父目录，不能为不存在的知识库建锁
+        if not os.path.isdir(os.path.dirname(self.bm25_file)):
+            raise FileNotFoundError(f"知识库 {kb_name} 不存在")
+        self.lock = FileLock(self.bm25_file + ".lock")
+        # 保护内存索引，避免检索与增量更新交错
+        self.mem_lock = threading.RLock()
+        self.store = CHUNK_STORES.get(kb_name)
+
+        self.ids = []
         self.tokenized_docs = []
         self.bm25 = None
-        self.load_index()
+        self.version = 0
+        self.last_check = 0.0
+        with self.lock:
+            self.load_index()
+
+    def read_version(self) -> int:
+        """
+        @desc     : 读取磁盘上的索引版本号
+        """
+        try:
+            with open(self.version_file, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_version(self, version: int):
+        # 先写临时文件再替换，其他进程不会读到被截断的空版本号
+        tmp_file = self.version_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(str(version))
+        os.replace(tmp_file, self.version_file)
+
+    def _read_journal(self) -> list[dict]:
+        if not os.path.exists(self.journal_file):
+            return []
+        with open(self.journal_file, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _rebuild(self):
+        self.bm25 = BM25Okapi(self.tokenized_docs) if self.tokenized_docs else None
+
+    def _apply(self, entry: dict, texts: list[str] = None):
+        """
+        @desc     : 将一条日志应用到内存索引（不重建 BM25）
+        @param    : texts: 新增文档的原文，为空时从日志（旧版本）或文本块存储读取
+        """
+        if entry["op"] == "add":
+            texts = texts or entry.get("texts") or self.store.get_many(entry["ids"])
+            self.ids.extend(entry["ids"])
+            self.tokenized_docs.extend((doc or "").split() for doc in texts)
+        elif entry["op"] == "delete":
+            removed = set(entry["ids"])
+            kept = [i for i, id in enumerate(self.ids) if id not in removed]
+            self.ids = [self.ids[i] for i in kept]
+            self.tokenized_docs = [self.tokenized_docs[i] for i in kept]
+        self.version = entry["version"]
 
     def load_index(self):
         """
-        @description : 加载文件
+        @description : 加载快照文件并回放日志，调用方需持有文件锁
         """
+        with self.mem_lock:
+            self._load_index()
+
+    def _load_index(self):
+        data = []
         if os.path.exists(self.bm25_file):
             with open(self.bm25_file, "r", encoding="utf-8") as f:
                 data = json.load(f)
-            self.docs = list(data.values())
-            self.ids = list(data.keys())
-        else:
-            self.docs = []
-            self.ids = []
+        # 快照为 {"version": 版本号, "ids": [...]}，合并时若在清空日志前中断，已并入快照的日志不再回放
+        snapshot_version = 0
+        if isinstance(data, dict) and "version" in data and isinstance(data.get("ids"), list):
+            snapshot_version = data["version"]
+            data = data["ids"]
+        journal = [entry for entry in self._read_journal() if entry["version"] > snapshot_version]
+
+        # 旧版本的索引文件为 {id: 原文}，日志中也带原文，先迁移到文本块存储
+        legacy = dict(data) if isinstance(data, dict) else {}
+        for entry in journal:
+            if entry["op"] == "add" and "texts" in entry:
+                legacy.update(zip(entry["ids"], entry["texts"]))
+        if legacy:
+            self.store.put_missing(list(legacy), list(legacy.values()))
+
+        self.ids = list(data)
+        self.tokenized_docs = [(doc or "").split() for doc in self.store.get_many(self.ids)]
+        for entry in journal:
+            self._apply(entry)
+        self.version = max(self.read_version(), snapshot_version)
+        self._rebuild()
+
+    def _sync(self):
+        """
+        @desc     : 追平磁盘上的最新版本，调用方需持有文件锁
+        """
+        current = self.read_version()
+        if current == self.version:
+            return
 
-        self.tokenized_docs = [doc.split() for doc in self.docs]
-        if self.tokenized_docs:
-            self.bm25 = BM25Okapi(self.tokenized_docs)
+        entries = [e for e in self._read_journal() if e["version"] > self.version]
+        # 日志已被压缩或知识库被重建时，只能全量加载
+        if current < self.version or not entries or entries[0]["version"] != self.version + 1:
+            logger.info(f"BM25 知识库 {self.kb_name} 全量重新加载, 版本 {self.version} -> {current}")
+            self.load_index()
+            return
 
-    def add(self, ids: list[str], texts: list[str]):
+        with self.mem_lock:
+            for entry in entries:
+                self._apply(entry)
+            self._rebuild()
+        logger.info(f"BM25 知识库 {self.kb_name} 增量加载 {len(entries)} 条变更, 当前版本 {self.version}")
+
+    def refresh(self):
         """
-        @description : 新增文档，同时更新 JSON 文件和内存索引
+        @desc     : 检查其他进程是否更新了索引，最多每 BM25_RELOAD_INTERVAL 秒检查一次
         """
-        # 更新 JSON 文件
-        if os.path.exists(self.bm25_file):
-            with open(self.bm25_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                logger.info(f"加载 BM25 知识库 {self.kb_name}，当前记录数 {len(data)}")
-        else:
-            data = {}
+        now = time.monotonic()
+        if now - self.last_check < settings.BM25_RELOAD_INTERVAL:
+            return
+        self.last_check = now
+        if self.read_version() != self.version:
+            with self.lock:
+                self._sync()
 
-        for i, t in zip(ids, texts):
-            data[str(i)] = t
+    def _commit(self, op: str, ids: list[str], texts: list[str] = None):
+        """
+        @desc     : 追加一条变更日志并应用到内存，调用方需持有文件锁。日志只记录 id，原文已写入文本块存储
+        """
+        entry = {"version": self.version + 1, "op": op, "ids": ids}
+        with open(self.journal_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._write_version(entry["version"])
+
+        with self.mem_lock:
+            self._apply(entry, texts)
+            if ids:
+                self._rebuild()
 
-        with open(self.bm25_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-            logger.info(f"BM25 知识库 {self.kb_name} 已更新，新增 {len(texts)} 条记录")
+        if entry["version"] % settings.BM25_JOURNAL_MAX == 0:
+            self._compact()
 
-        # 更新内存
-        self.docs.extend(texts)
-        self.tokenized_docs = [doc.split() for doc in self.docs]
-        self.bm25 = BM25Okapi(self.tokenized_docs)
+    def _compact(self):
+        """
+        @desc     : 将日志合并进快照文件，调用方需持有文件锁
+        """
+        tmp_file = self.bm25_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "ids": self.ids}, f, ensure_ascii=False)
+        os.replace(tmp_file, self.bm25_file)
+        open(self.journal_file, "w", encoding="utf-8").close()
+        logger.info(f"BM25 知识库 {self.kb_name} 已合并日志, 当前版本 {self.version}")
+
+    def add(self, ids: list[str], texts: list[str] = None):
+        """
+        @description : 新增文档，同时更新磁盘日志和内存索引，原文需已写入文本块存储，
+                       texts 为空时从文本块存储读取
+        """
+        with self.lock:
+            self._sync()
+            self._commit("add", [str(i) for i in ids], list(texts) if texts else None)
+        logger.info(f"BM25 知识库 {self.kb_name} 已更新，新增 {len(ids)} 条记录")
 
     def search(self, query: str, top_k: int = 5, min_score: float = 0.1):
         """
@@ -84,96 +211,170 @@ class BM25Manager:
         @param    : top_k: 返回前 top_k 个结果
         @return   : (文本列表, id列表, 分数列表)
         """
-        if not self.bm25:
-            return [], [], []
-
-        tokenized_query = query.split()
-        scores = self.bm25.get_scores(tokenized_query)
-
-        # 排序，得到索引和分数
-        ranked = sorted(enumerate(scores), key=lambda x: x[1], reverse=True)[:top_k]
-
-        docs, ids, final_scores = [], [], []
-        for i, score in ranked[:top_k]:
-            if score >= min_score:
-                docs.append(self.docs[i])
-                ids.append(self.ids[i])
-                final_scores.append(score)
-        return docs, ids, final_scores
+        with self.mem_lock:
+            if not self.bm25:
+                return [], [], []
+
+            tokenized_query = query.split()
+            scores = self.bm25.get_scores(tokenized_query)
+
+            # 排序，得到索引和分数
+            ranked = sorted(enumerate(scores), key=lambda x: x[1], reverse=True)[:top_k]
+
+            ids, final_scores = [], []
+            for i, score in ranked:
+                if score >= min_score:
+                    ids.append(self.ids[i])
+                    final_scores.append(score)
+
+        # 只读取最终结果的原文
+        texts = self.store.get_many(ids)
+        found = [i for i, text in enumerate(texts) if text is not None]
+        return [texts[i] for i in found], [ids[i] for i in found], [final_scores[i] for i in found]
     
     def delete_file(self, file_names: list[str]):
         """
         @desc     : 删除指定文件的文档
         @param    : file_name: 要删除的文件名列表
         """
-        if not os.path.exists(self.bm25_file):
-            return
+        with self.lock:
+            self._sync()
+            removed = []
+            for file_name in file_names:
+                file_name = os.path.basename(file_name)
+                matched = [id for id in self.ids if chunk_file_name(id) == file_name]
+                removed.extend(matched)
+                logger.info(f"从 BM25 知识库 {self.kb_name} 删除文档文件: {file_name}, 共{len(matched)}条")
+            if removed:
+                self._commit("delete", removed)
+
+    def bump_version(self):
+        """
+        @desc     : 不修改文档，只推进索引版本号，使以版本号为键的检索与回答缓存失效
+        """
+        with self.lock:
+            self._sync()
+            self._commit("delete", [])
 
-        with open(self.bm25_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        
-        for file_name in file_names:
-            temp_num = 0
-            for ids_name in list(data.keys()):
-                if file_name in ids_name:
-                    del data[ids_name]
-                    temp_num +=1
-            logger.info(f"从 BM25 知识库 {self.kb_name} 删除文档文件: {file_name}, 共{temp_num}条")
-
-        with open(self.bm25_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-
-        self.load_index()
     def delete_ids(self, ids: list[str]):
         """
         @desc     : 删除指定 ID 的文档
         @param    : ids: 要删除的文档 ID 列表
         """
-        if not os.path.exists(self.bm25_file):
-            return
-
-        with open(self.bm25_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        for id in ids:
-            if str(id) in data:
-                del data[str(id)]
+        with self.lock:
+            self._sync()
+            existing = set(self.ids)
+            removed = [str(id) for id in ids if str(id) in existing]
+            for id in removed:
                 logger.info(f"从 BM25 知识库 {self.kb_name} 删除文档 ID: {id}")
-
-        with open(self.bm25_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-
-        self.load_index()
+            if removed:
+                self._commit("delete", removed)
 
 
 class BM25Registry:
     """
     @name     : BM25Registry
     @desc     : 全局 BM25 缓存管理器（支持多知识库、LRU 缓存）
+                设置 score_fn(kb_name) 后改为淘汰得分（访问频率）最低的知识库，得分相同时淘汰最久未访问的。
+                索引在注册表锁外加载，同一知识库的并发请求等待同一个加载结果，不阻塞其他知识库
     """
 
-    def __init__(self, max_cached_kb: int = settings.MAX_CACHED_KB):
+    def __init__(self, max_cached_kb: int = settings.MAX_CACHED_KB, score_fn=None):
         self.max_cached_kb = max_cached_kb
+        self.score_fn = score_fn
         self.cache: OrderedDict[str, BM25Manager] = OrderedDict()
+        # 正在加载的知识库 -> 加载结果
+        self._loading: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hit": 0, "miss": 0, "eviction": 0}
 
-    def get(self, kb_name: str) -> BM25Manager:
-        # 如果缓存里有，提升到最新
-        if kb_name in self.cache:
-            self.cache.move_to_end(kb_name)
-            return self.cache[kb_name]
+    def contains(self, kb_name: str) -> bool:
+        return kb_name in self.cache
+
+    def drop(self, kb_name: str):
+        with self._lock:
+            self.cache.pop(kb_name, None)
+            # 正在加载的结果不再放入缓存
+            self._loading.pop(kb_name, None)
 
-        # 不在缓存 → 延迟加载
-        manager = BM25Manager(kb_name)
+    def _insert(self, kb_name: str, manager: BM25Manager):
+        """
+        @desc     : 放入缓存并按上限淘汰，调用方需持有注册表锁
+        """
         self.cache[kb_name] = manager
         self.cache.move_to_end(kb_name)
 
-        # 超过上限 → 移除最久未使用的
+        # 超过上限 → 移除最久未使用的（或访问频率最低的），刚加载的不参与淘汰
         if len(self.cache) > self.max_cached_kb:
-            removed_kb, _ = self.cache.popitem(last=False)
+            candidates = list(self.cache)[:-1]
+            if self.score_fn:
+                removed_kb = min(candidates, key=self.score_fn)
+            else:
+                removed_kb = candidates[0]
+            del self.cache[removed_kb]
+            self.stats["eviction"] += 1
             logger.info(f"释放 BM25 索引: {removed_kb}")
 
+    def _load(self, kb_name: str, loading: Future) -> BM25Manager:
+        try:
+            manager = BM25Manager(kb_name)
+        except BaseException as e:
+            with self._lock:
+                if self._loading.get(kb_name) is loading:
+                    del self._loading[kb_name]
+            loading.set_exception(e)
+            raise
+
+        with self._lock:
+            if self._loading.get(kb_name) is loading:
+                del self._loading[kb_name]
+                self._insert(kb_name, manager)
+        loading.set_result(manager)
+        return manager
+
+    def get(self, kb_name: str) -> BM25Manager:
+        with self._lock:
+            # 如果缓存里有，提升到最新
+            manager = self.cache.get(kb_name)
+            if manager is not None:
+                self.cache.move_to_end(kb_name)
+                self.stats["hit"] += 1
+            else:
+                self.stats["miss"] += 1
+                loading = self._loading.get(kb_name)
+                owner = loading is None
+                if owner:
+                    loading = self._loading[kb_name] = Future()
+
+        if manager is None:
+            # 不在缓存 → 延迟加载，已有线程在加载时等待其结果
+            manager = self._load(kb_name, loading) if owner else loading.result()
+
+        # 其他进程可能已写入新版本
+        manager.refresh()
         return manager
 
 
 # 全局唯一实例，可在 service 层直接调用
-BM25_REGISTRY = BM25Registry(max_cached_kb=3)
+BM25_REGISTRY = BM25Registry(max_cached_kb=settings.MAX_CACHED_KB)
+
+
+def read_index_version(kb_name: str, bm25_file: str = settings.BM25_INDEX_NAME) -> str:
+    """
+    @desc     : 读取知识库的索引版本标识，每次入库、删除都会改变
+                由目录 inode 与变更版本号组成，知识库删除重建后版本号归零也不会与旧数据混淆
+    @param    : kb_name: 知识库名称
+    @return   : 版本标识，知识库不存在时为空字符串
+    """
+    kb_path = os.path.join(UPLOAD_DIR, kb_name)
+    try:
+        inode = os.stat(kb_path).st_ino
+    except FileNotFoundError:
+        return ""
+
+    try:
+        with open(os.path.join(kb_path, bm25_file + ".version"), "r", encoding="utf-8") as f:
+            version = f.read().strip() or "0"
+    except FileNotFoundError:
+        version = "0"
+    return f"{inode}:{version}"
@@ -10,23 +10,45 @@
 import os
 import chromadb
 from settings import settings
-from chromadb.utils import embedding_functions
+from model.embedding_model import EMBEDDING_REGISTRY
 
-chroma_client = chromadb.PersistentClient(path=".chroma")
+if settings.CHROMA_HOST:
+    # 多进程部署：所有进程通过同一个 Chroma 服务读写
+    chroma_client = chromadb.HttpClient(host=settings.CHROMA_HOST, port=settings.CHROMA_PORT)
+else:
+    chroma_client = chromadb.PersistentClient(path=settings.CHROMA_PATH)
 os.environ["ANONYMIZED_TELEMETRY"] = "False"  # 关闭遥测
-default_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name=settings.EMBEDDING_MODEL_LOCAL_PATH if settings.EMBEDDING_MODEL_LOCAL_PATH else settings.EMBEDDING_MODEL,
-)
+# 默认模型常驻缓存，不参与淘汰
+default_ef = EMBEDDING_REGISTRY.acquire(settings.EMBEDDING_MODEL)
+
+
+def get_collection_model(collection) -> str:
+    '''
+    @desc     : 读取 collection 创建时记录的嵌入模型，旧数据未记录时视为默认模型
+    @param    : collection : Chroma Collection
+    @return   : 嵌入模型名称
+    '''
+    return (collection.metadata or {}).get("embedding_model", settings.EMBEDDING_MODEL)
+
 
 def get_chroma_collection(kb_name: str, embedding_model: str = None):
     '''
     @desc     : 获取或创建一个 Chroma Collection
     @param    : kb_name : 知识库名称
+    @param    : embedding_model : 嵌入模型名称，为空时使用默认模型
     @return   : Chroma Collection
     '''
-    if embedding_model:
-        custom_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name=embedding_model,
-        )
-        return chroma_client.get_or_create_collection(name=kb_name, embedding_function=custom_ef)
-    return chroma_client.get_or_create_collection(name=kb_name, embedding_function=default_ef)
+    model_name = embedding_model or settings.EMBEDDING_MODEL
+    try:
+        recorded_model = get_collection_model(chroma_client.get_collection(name=kb_name))
+    except Exception:
+        recorded_model = None
+
+    if recorded_model and recorded_model != model_name:
+        raise ValueError(f"知识库 {kb_name} 使用的嵌入模型为 {recorded_model}，与指定的 {model_name} 不一致")
+
+    return chroma_client.get_or_create_collection(
+        name=kb_name,
+        embedding_function=EMBEDDING_REGISTRY.get(model_name),
+        metadata={"embedding_model": model_name},
+    )
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   chunk_store.py
+@Time    :   2026/10/20 10:05:51
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   知识库文本块存储：每个知识库一份只追加的压缩数据文件与偏移表，
+             向量库与 BM25 只保存文本块 id，需要原文时按 id 读取
+"""
+import os
+import json
+import mmap
+import zlib
+import logging
+import threading
+from collections import OrderedDict
+from filelock import FileLock
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = settings.UPLOAD_DIR
+CHUNK_INDEX_NAME = ".chunks.idx"
+CHUNK_LOCK_NAME = ".chunks.lock"
+# 解压后的数据块缓存个数
+BLOCK_CACHE_SIZE = 32
+
+
+def chunk_file_name(chunk_id: str) -> str:
+    """
+    @desc     : 由文本块 id（文件路径_序号）得到文件名
+    """
+    return os.path.basename(chunk_id.rsplit("_", 1)[0])
+
+
+class ChunkStore:
+    """
+    @name     : ChunkStore
+    @desc     : 文本按写入顺序打包成约 CHUNK_STORE_BLOCK_SIZE 字节的数据块，整块 zlib 压缩后追加到数据文件；
+                偏移表为 JSONL，每行记录一个数据块的位置与块内各文本块的 id 和结束位置，删除只追加墓碑记录，
+                失效数据超过一半时重写。写操作持有文件锁，读方按偏移表文件的大小与 inode 变化增量加载，
+                偏移表首行记录当前数据文件名，重写后换用新数据文件，多进程间不会读到错位的数据
+    """
+
+    def __init__(self, kb_name: str):
+        self.kb_name = kb_name
+        self.kb_path = os.path.join(UPLOAD_DIR, kb_name)
+        self.index_file = os.path.join(self.kb_path, CHUNK_INDEX_NAME)
+        self.lock = FileLock(os.path.join(self.kb_path, CHUNK_LOCK_NAME))
+        self.mem_lock = threading.RLock()
+
+        self.data_name = None
+        self.blocks: list[tuple[int, int]] = []
+        # id -> (数据块序号, 块内起始字节, 块内结束字节)
+        self.locations: dict[str, tuple[int, int, int]] = {}
+        self.dead = 0
+        self._index_ino = None
+        self._index_pos = 0
+        self._fd = None
+        self._mmap = None
+        self._cache: OrderedDict[int, bytes] = OrderedDict()
+
+    # ---------------- 读取 ----------------
+
+    def _reset(self):
+        self.data_name = None
+        self.blocks = []
+        self.locations = {}
+        self.dead = 0
+        self._index_ino = None
+        self._index_pos = 0
+        self._cache.clear()
+        self._close_data()
+
+    def _close_data(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def refresh(self):
+        """
+        @desc     : 加载偏移表的新增记录，偏移表被重写（inode 变化）时全量重新加载
+        """
+        with self.mem_lock:
+            try:
+                stat = os.stat(self.index_file)
+            except FileNotFoundError:
+                self._reset()
+                return
+            if stat.st_ino != self._index_ino or stat.st_size < self._index_pos:
+                self._reset()
+                self._index_ino = stat.st_ino
+            if stat.st_size == self._index_pos:
+                return
+
+            with open(self.index_file, "rb") as f:
+                f.seek(self._index_pos)
+                data = f.read()
+            # 写方可能还没写完最后一行
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                if line.strip():
+                    self._apply(json.loads(line))
+            self._index_pos += end
+
+    def _apply(self, entry: dict):
+        if "data" in entry:
+            self.data_name = entry["data"]
+        elif "block" in entry:
+            block_no = len(self.blocks)
+            self.blocks.append(tuple(entry["block"]))
+            start = 0
+            for id, end in zip(entry["ids"], entry["ends"]):
+                if id in self.locations:
+                    self.dead += 1
+                self.locations[id] = (block_no, start, end)
+                start = end
+        elif "delete" in entry:
+            for id in entry["delete"]:
+                if self.locations.pop(id, None) is not None:
+                    self.dead += 1
+
+    def _read_block(self, block_no: int) -> bytes:
+        if block_no in self._cache:
+            self._cache.move_to_end(block_no)
+            return self._cache[block_no]
+
+        offset, length = self.blocks[block_no]
+        if self._fd is None:
+            self._fd = os.open(os.path.join(self.kb_path, self.data_name), os.O_RDONLY)
+        if settings.CHUNK_STORE_MMAP:
+            if self._mmap is None or offset + length > len(self._mmap):
+                # 数据文件只追加，超出映射范围时重新映射
+                if self._mmap is not None:
+                    self._mmap.close()
+                self._mmap = mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ)
+            raw = self._mmap[offset:offset + length]
+        else:
+            raw = os.pread(self._fd, length, offset)
+
+        block = zlib.decompress(raw)
+        self._cache[block_no] = block
+        if len(self._cache) > BLOCK_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return block
+
+    def get_many(self, ids: list[str]) -> list[str | None]:
+        """
+        @desc     : 按 id 读取文本块
+        @param    : ids: 文本块 id 列表
+        @return   : 与 ids 一一对应的文本，不存在的为 None
+        """
+        self.refresh()
+        with self.mem_lock:
+            texts = []
+            for id in ids:
+                location = self.locations.get(id)
+                if location is None:
+                    texts.append(None)
+                    continue
+                block_no, start, end = location
+                texts.append(self._read_block(block_no)[start:end].decode("utf-8"))
+            return texts
+
+    def iter_all(self):
+        """
+        @desc     : 按写入顺序遍历全部文本块
+        @return   : 生成 (id, 文本)
+        """
+        self.refresh()
+        with self.mem_lock:
+            items = sorted(self.locations.items(), key=lambda item: item[1])
+        for id, (block_no, start, end) in items:
+            with self.mem_lock:
+                yield id, self._read_block(block_no)[start:end].decode("utf-8")
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self.locations)
+
+    # ---------------- 写入 ----------------
+
+    def _ensure_files(self):
+        """
+        @desc     : 首次写入时创建数据文件与偏移表，调用方需持有文件锁
+        """
+        if self.data_name is None:
+            self.data_name = ".chunks.0.dat"
+            open(os.path.join(self.kb_path, self.data_name), "ab").close()
+            with open(self.index_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"data": self.data_name}) + "\n")
+
+    def _write(self, ids: list[str], texts: list[str], index_file: str = None):
+        """
+        @desc     : 打包、压缩并追加数据块，再追加对应的偏移表记录，调用方需持有文件锁
+        """
+        self._ensure_files()
+        lines = []
+        with open(os.path.join(self.kb_path, self.data_name), "ab") as data_f:
+            offset = data_f.tell()
+            block, block_ids, ends = bytearray(), [], []
+            for i, (id, text) in enumerate(zip(ids, texts)):
+                block += text.encode("utf-8")
+                block_ids.append(str(id))
+                ends.append(len(block))
+                if len(block) >= settings.CHUNK_STORE_BLOCK_SIZE or i == len(ids) - 1:
+                    raw = zlib.compress(bytes(block))
+                    data_f.write(raw)
+                    lines.append(json.dumps({"block": [offset, len(raw)], "ids": block_ids, "ends": ends}, ensure_ascii=False))
+                    offset += len(raw)
+                    block, block_ids, ends = bytearray(), [], []
+        # 数据写完后再写偏移表，读方看到的偏移一定指向已写入的数据
+        with open(index_file or self.index_file, "a", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+
+    def append(self, ids: list[str], texts: list[str]):
+        """
+        @desc     : 写入文本块，id 已存在时以新内容为准
+        @param    : ids: 文本块 id 列表
+        @param    : texts: 文本列表
+        """
+        if not ids:
+            return
+        with self.lock:
+            self.refresh()
+            self._write(ids, texts)
+            self.refresh()
+
+    def put_missing(self, ids: list[str], texts: list[str]):
+        """
+        @desc     : 只写入尚不存在的文本块，用于把旧版本索引中的原文迁移进来
+        """
+        with self.lock:
+            self.refresh()
+            missing = [(id, text) for id, text in zip(ids, texts) if id not in self.locations]
+            if missing:
+                self._write([id for id, _ in missing], [text for _, text in missing])
+                self.refresh()
+                logger.info(f"知识库 {self.kb_name} 迁移 {len(missing)} 个文本块到文本块存储")
+
+    def delete(self, ids: list[str]):
+        """
+        @desc     : 删除文本块，失效数据超过一半时重写数据文件
+        @param    : ids: 文本块 id 列表
+        """
+        with self.lock:
+            self.refresh()
+            removed = [id for id in ids if id in self.locations]
+            if not removed:
+                return
+            with open(self.index_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"delete": removed}, ensure_ascii=False) + "\n")
+            self.refresh()
+            if self.dead > len(self.locations):
+                self._compact()
+
+    def delete_files(self, file_names: list[str]):
+        """
+        @desc     : 删除指定文件的全部文本块
+        @param    : file_names: 文件名列表
+        """
+        self.refresh()
+        names = {os.path.basename(name) for name in file_names}
+        with self.mem_lock:
+            ids = [id for id in self.locations if chunk_file_name(id) in names]
+        self.delete(ids)
+
+    def _compact(self):
+        """
+        @desc     : 只保留有效文本块，写入新的数据文件与偏移表后替换，调用方需持有文件锁
+        """
+        items = list(self.iter_all())
+        generation = int(self.data_name.split(".")[2]) + 1
+        old_data = os.path.join(self.kb_path, self.data_name)
+        tmp_index = self.index_file + ".tmp"
+
+        with self.mem_lock:
+            self._reset()
+            self.data_name = f".chunks.{generation}.dat"
+            open(os.path.join(self.kb_path, self.data_name), "wb").close()
+            # 先写临时偏移表，整体替换后读方才会切换到新数据文件
+            with open(tmp_index, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"data": self.data_name}) + "\n")
+            if items:
+                self._write([id for id, _ in items], [text for _, text in items], tmp_index)
+            os.replace(tmp_index, self.index_file)
+            self._reset()
+        # 其他进程已打开的文件描述符仍可读取旧文件直到重新加载
+        os.remove(old_data)
+        self.refresh()
+        logger.info(f"知识库 {self.kb_name} 文本块存储已重写, 有效文本块 {len(items)} 个")
+
+    def close(self):
+        with self.mem_lock:
+            self._close_data()
+
+
+class ChunkStoreRegistry:
+    """
+    @name     : ChunkStoreRegistry
+    @desc     : 按知识库缓存 ChunkStore，删除知识库时需先移除
+    """
+
+    def __init__(self):
+        self.stores: dict[str, ChunkStore] = {}
+        self._lock = threading.Lock()
+
+    def get(self, kb_name: str) -> ChunkStore:
+        with self._lock:
+            if kb_name not in self.stores:
+                self.stores[kb_name] = ChunkStore(kb_name)
+            return self.stores[kb_name]
+
+    def drop(self, kb_name: str):
+        with self._lock:
+            store = self.stores.pop(kb_name, None)
+        if store is not None:
+            store.close()
+
+
+CHUNK_STORES = ChunkStoreRegistry()
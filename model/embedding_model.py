@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   embedding_model.py
+@Time    :   2026/10/19 10:12:45
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   文本嵌入模型的实例缓存（引用计数 + LRU 淘汰）
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future
+
+from chromadb.utils import embedding_functions
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def build_embedding_function(model_name: str, backend: str = None, backend_file: str = None):
+    """
+    @desc     : 按指定推理后端构建嵌入函数，同一模型在不同后端下输出同一向量空间
+    @param    : model_name: 模型名称
+    @param    : backend: torch / onnx / openvino，为空时读取配置
+    @param    : backend_file: onnx/openvino 模型文件（如 int8 量化文件），为空时读取配置
+    @return   : 嵌入函数实例
+    """
+    backend = backend or settings.EMBEDDING_BACKEND
+    kwargs = {}
+    if backend != "torch":
+        # 需要 sentence-transformers>=3.2，onnx 后端另需 optimum[onnxruntime]
+        kwargs["backend"] = backend
+        backend_file = backend_file or settings.EMBEDDING_BACKEND_FILE
+        if backend_file:
+            kwargs["model_kwargs"] = {"file_name": backend_file}
+
+    return embedding_functions.SentenceTransformerEmbeddingFunction(
+        model_name=resolve_model_path(model_name),
+        **kwargs,
+    )
+
+
+def resolve_model_path(model_name: str) -> str:
+    """
+    @desc     : 将模型名称解析为实际加载路径，默认模型优先使用本地路径
+    @param    : model_name: 模型名称
+    @return   : 模型加载路径
+    """
+    if model_name == settings.EMBEDDING_MODEL and settings.EMBEDDING_MODEL_LOCAL_PATH:
+        return settings.EMBEDDING_MODEL_LOCAL_PATH
+    return model_name
+
+
+class EmbeddingRegistry:
+    """
+    @name     : EmbeddingRegistry
+    @desc     : 全局嵌入模型缓存，按模型名称复用已加载的实例
+                正在使用中的模型（引用计数 > 0）不会被淘汰；
+                模型在注册表锁外加载，同一模型的并发请求等待同一个加载结果，不阻塞已加载模型的获取
+    """
+
+    def __init__(self, max_cached_model: int = settings.MAX_CACHED_EMBEDDING_MODEL):
+        self.max_cached_model = max_cached_model
+        self.cache: OrderedDict[str, embedding_functions.SentenceTransformerEmbeddingFunction] = OrderedDict()
+        self.ref_counts: dict[str, int] = {}
+        # 正在加载的模型 -> 加载结果
+        self._loading: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, model_name: str):
+        logger.info(f"加载嵌入模型: {model_name}, 推理后端: {settings.EMBEDDING_BACKEND}")
+        return build_embedding_function(model_name)
+
+    def _evict(self):
+        """
+        @desc     : 超过上限时，按最久未使用的顺序淘汰未被引用的模型
+        """
+        for name in list(self.cache.keys()):
+            if len(self.cache) <= self.max_cached_model:
+                break
+            if self.ref_counts.get(name, 0) > 0:
+                continue
+            del self.cache[name]
+            self.ref_counts.pop(name, None)
+            logger.info(f"释放嵌入模型: {name}")
+
+    def acquire(self, model_name: str):
+        """
+        @desc     : 获取模型实例并增加引用计数，使用完毕后需调用 release
+        @param    : model_name: 模型名称
+        @return   : 嵌入函数实例
+        """
+        with self._lock:
+            ef = self.cache.get(model_name)
+            if ef is not None:
+                return self._hold(model_name, ef)
+            loading = self._loading.get(model_name)
+            owner = loading is None
+            if owner:
+                loading = self._loading[model_name] = Future()
+
+        if not owner:
+            # 已有线程在加载该模型，等待其结果
+            ef = loading.result()
+            with self._lock:
+                return self._hold(model_name, ef)
+
+        try:
+            ef = self._load(model_name)
+        except BaseException as e:
+            with self._lock:
+                self._loading.pop(model_name, None)
+            loading.set_exception(e)
+            raise
+
+        with self._lock:
+            self._loading.pop(model_name, None)
+            ef = self._hold(model_name, ef)
+        loading.set_result(ef)
+        return ef
+
+    def _hold(self, model_name: str, ef):
+        """
+        @desc     : 放入缓存（已被淘汰时重新放入）并增加引用计数，调用方需持有注册表锁
+        """
+        self.cache.setdefault(model_name, ef)
+        self.cache.move_to_end(model_name)
+        self.ref_counts[model_name] = self.ref_counts.get(model_name, 0) + 1
+        self._evict()
+        return self.cache[model_name]
+
+    def release(self, model_name: str):
+        """
+        @desc     : 释放一次引用
+        @param    : model_name: 模型名称
+        """
+        with self._lock:
+            if self.ref_counts.get(model_name, 0) > 0:
+                self.ref_counts[model_name] -= 1
+            self._evict()
+
+    def get(self, model_name: str):
+        """
+        @desc     : 获取模型实例（不持有引用），用于创建 collection 等一次性场景
+        @param    : model_name: 模型名称
+        @return   : 嵌入函数实例
+        """
+        ef = self.acquire(model_name)
+        self.release(model_name)
+        return ef
+
+    @contextmanager
+    def use(self, model_name: str):
+        """
+        @desc     : 在 with 块内持有模型引用，避免编码过程中被淘汰
+        @param    : model_name: 模型名称
+        """
+        ef = self.acquire(model_name)
+        try:
+            yield ef
+        finally:
+            self.release(model_name)
+
+
+# 全局唯一实例
+EMBEDDING_REGISTRY = EmbeddingRegistry()
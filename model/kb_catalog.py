@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   kb_catalog.py
+@Time    :   2026/10/19 22:40:18
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   知识库元数据目录（SQLite）：知识库与文件列表、文本块数量、字节数、嵌入模型、更新时间，
+             新建、上传、入库、删除时在事务中同步更新，列表接口不再扫描上传目录
+"""
+import os
+import json
+import time
+import logging
+import sqlite3
+from collections import Counter
+from contextlib import contextmanager
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = settings.UPLOAD_DIR
+# 旧版本记录在各知识库目录下的文件哈希索引，重建目录时导入
+LEGACY_HASH_INDEX = ".file_hashes.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kb (
+    name TEXT PRIMARY KEY,
+    embedding_model TEXT,
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    byte_size INTEGER NOT NULL DEFAULT 0,
+    file_count INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS kb_file (
+    kb_name TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    sha256 TEXT,
+    byte_size INTEGER NOT NULL DEFAULT 0,
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (kb_name, file_name)
+);
+CREATE INDEX IF NOT EXISTS idx_kb_file_sha ON kb_file (kb_name, sha256);
+"""
+
+
+class KBCatalog:
+    """
+    @name     : KBCatalog
+    @desc     : 每次操作使用独立连接，写操作以 BEGIN IMMEDIATE 开启事务，多进程之间由 SQLite 文件锁串行
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._initialized = False
+
+    @contextmanager
+    def _transaction(self, write: bool = False):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            if not self._initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+                self._initialized = True
+            conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _refresh_kb(conn: sqlite3.Connection, kb_name: str):
+        """
+        @desc     : 由文件表汇总知识库的文本块数、字节数与文件数
+        """
+        conn.execute(
+            """
+            UPDATE kb SET
+                chunk_count = (SELECT COALESCE(SUM(chunk_count), 0) FROM kb_file WHERE kb_name = :kb),
+                byte_size = (SELECT COALESCE(SUM(byte_size), 0) FROM kb_file WHERE kb_name = :kb),
+                file_count = (SELECT COUNT(*) FROM kb_file WHERE kb_name = :kb),
+                updated_at = :now
+            WHERE name = :kb
+            """,
+            {"kb": kb_name, "now": time.time()},
+        )
+
+    @staticmethod
+    def _ensure_kb(conn: sqlite3.Connection, kb_name: str):
+        now = time.time()
+        conn.execute(
+            "INSERT OR IGNORE INTO kb (name, created_at, updated_at) VALUES (?, ?, ?)", (kb_name, now, now)
+        )
+
+    def is_empty(self) -> bool:
+        with self._transaction() as conn:
+            return conn.execute("SELECT COUNT(*) FROM kb").fetchone()[0] == 0
+
+    def create_kb(self, kb_name: str, embedding_model: str = None):
+        with self._transaction(write=True) as conn:
+            self._ensure_kb(conn, kb_name)
+            if embedding_model:
+                conn.execute("UPDATE kb SET embedding_model = ? WHERE name = ?", (embedding_model, kb_name))
+
+    def delete_kb(self, kb_name: str):
+        with self._transaction(write=True) as conn:
+            conn.execute("DELETE FROM kb_file WHERE kb_name = ?", (kb_name,))
+            conn.execute("DELETE FROM kb WHERE name = ?", (kb_name,))
+
+    def register_file(
+        self, kb_name: str, file_path: str, sha256: str = None, byte_size: int = None, reset_chunks: bool = False
+    ) -> str | None:
+        """
+        @desc     : 登记文件，若知识库中已存在相同哈希的文件则不登记并返回其路径
+        @param    : kb_name: 知识库名称
+        @param    : file_path: 文件路径
+        @param    : sha256: 文件哈希，为空时不做重复检查
+        @param    : byte_size: 文件大小，为空时读取文件
+        @param    : reset_chunks: 文件将重新入库时为 True，文本块数量清零后由本次入库重新计数
+        @return   : 已存在的同内容文件路径，不存在时为 None
+        """
+        file_name = os.path.basename(file_path)
+        if byte_size is None:
+            byte_size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+
+        with self._transaction(write=True) as conn:
+            if sha256:
+                row = conn.execute(
+                    "SELECT file_path FROM kb_file WHERE kb_name = ? AND sha256 = ? AND file_name != ?",
+                    (kb_name, sha256, file_name),
+                ).fetchone()
+                # 已删除的文件不再视为重复
+                if row and os.path.exists(row["file_path"]):
+                    return row["file_path"]
+
+            self._ensure_kb(conn, kb_name)
+            conn.execute(
+                """
+                INSERT INTO kb_file (kb_name, file_name, file_path, sha256, byte_size, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (kb_name, file_name) DO UPDATE SET
+                    file_path = excluded.file_path,
+                    sha256 = COALESCE(excluded.sha256, kb_file.sha256),
+                    byte_size = excluded.byte_size,
+                    updated_at = excluded.updated_at
+                """,
+                (kb_name, file_name, file_path, sha256, byte_size, time.time()),
+            )
+            if reset_chunks:
+                self._reset_chunks(conn, kb_name, file_name)
+            self._refresh_kb(conn, kb_name)
+        return None
+
+    @staticmethod
+    def _reset_chunks(conn: sqlite3.Connection, kb_name: str, file_name: str):
+        conn.execute(
+            "UPDATE kb_file SET chunk_count = 0 WHERE kb_name = ? AND file_name = ?",
+            (kb_name, os.path.basename(file_name)),
+        )
+
+    def reset_chunks(self, kb_name: str, file_name: str):
+        """
+        @desc     : 文件开始重新入库前清零文本块数量，record_chunks 只在同一次入库内取最大值，
+                    重新切片后文本块变少时不会沿用旧的数量
+        @param    : kb_name: 知识库名称
+        @param    : file_name: 文件名
+        """
+        with self._transaction(write=True) as conn:
+            self._reset_chunks(conn, kb_name, file_name)
+            self._refresh_kb(conn, kb_name)
+
+    def record_chunks(self, kb_name: str, metadatas: list[dict], embedding_model: str = None):
+        """
+        @desc     : 入库后更新各文件的文本块数量，取已写入的最大 chunk_index + 1，重复写入同一文本块不会重复计数；
+                    重新入库前需通过 register_file(reset_chunks=True) 或 reset_chunks 清零
+        @param    : kb_name: 知识库名称
+        @param    : metadatas: 本次写入的文本块元数据，需包含 file_name 与 chunk_index
+        @param    : embedding_model: 知识库使用的嵌入模型
+        """
+        counts = Counter()
+        for meta in metadatas:
+            name = meta["file_name"]
+            counts[name] = max(counts[name], int(meta.get("chunk_index", 0)) + 1)
+
+        now = time.time()
+        with self._transaction(write=True) as conn:
+            self._ensure_kb(conn, kb_name)
+            for file_name, count in counts.items():
+                conn.execute(
+                    """
+                    INSERT INTO kb_file (kb_name, file_name, file_path, chunk_count, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (kb_name, file_name) DO UPDATE SET
+                        chunk_count = MAX(kb_file.chunk_count, excluded.chunk_count),
+                        updated_at = excluded.updated_at
+                    """,
+                    (kb_name, file_name, os.path.join(UPLOAD_DIR, kb_name, file_name), count, now),
+                )
+            if embedding_model:
+                conn.execute("UPDATE kb SET embedding_model = ? WHERE name = ?", (embedding_model, kb_name))
+            self._refresh_kb(conn, kb_name)
+
+    def delete_files(self, kb_name: str, file_names: list[str]):
+        with self._transaction(write=True) as conn:
+            conn.executemany(
+                "DELETE FROM kb_file WHERE kb_name = ? AND file_name = ?",
+                [(kb_name, os.path.basename(name)) for name in file_names],
+            )
+            self._refresh_kb(conn, kb_name)
+
+    def list_kbs(self) -> list[dict]:
+        with self._transaction() as conn:
+            return [dict(row) for row in conn.execute("SELECT * FROM kb ORDER BY name")]
+
+    def get_kb(self, kb_name: str) -> dict | None:
+        with self._transaction() as conn:
+            row = conn.execute("SELECT * FROM kb WHERE name = ?", (kb_name,)).fetchone()
+            return dict(row) if row else None
+
+    def list_files(self, kb_name: str) -> list[dict]:
+        with self._transaction() as conn:
+            return [
+                dict(row)
+                for row in conn.execute("SELECT * FROM kb_file WHERE kb_name = ? ORDER BY file_name", (kb_name,))
+            ]
+
+    def rebuild(self, chunk_counter=None):
+        """
+        @desc     : 扫描上传目录重建目录数据，用于首次启动或修复
+        @param    : chunk_counter: 可选的 chunk_counter(kb_name) -> {文件名: 文本块数}，为空时文本块数记为 0
+        """
+        kbs = {}
+        if os.path.isdir(UPLOAD_DIR):
+            for kb_name in os.listdir(UPLOAD_DIR):
+                kb_path = os.path.join(UPLOAD_DIR, kb_name)
+                if not os.path.isdir(kb_path):
+                    continue
+                hashes = {}
+                legacy_index = os.path.join(kb_path, LEGACY_HASH_INDEX)
+                if os.path.exists(legacy_index):
+                    with open(legacy_index, "r", encoding="utf-8") as f:
+                        hashes = {os.path.basename(path): sha for sha, path in json.load(f).items()}
+                files = []
+                for entry in os.scandir(kb_path):
+                    if not entry.is_file() or entry.name.startswith((settings.BM25_INDEX_NAME, ".")):
+                        continue
+                    if entry.name.endswith(".part"):
+                        continue
+                    files.append((entry.name, entry.path, hashes.get(entry.name), entry.stat().st_size))
+                chunks = chunk_counter(kb_name) if chunk_counter else {}
+                kbs[kb_name] = (files, chunks)
+
+        now = time.time()
+        with self._transaction(write=True) as conn:
+            conn.execute("DELETE FROM kb_file")
+            conn.execute("DELETE FROM kb WHERE name NOT IN (%s)" % ",".join("?" * len(kbs)), list(kbs))
+            for kb_name, (files, chunks) in kbs.items():
+                self._ensure_kb(conn, kb_name)
+                conn.executemany(
+                    """
+                    INSERT INTO kb_file (kb_name, file_name, file_path, sha256, byte_size, chunk_count, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    [
+                        (kb_name, name, path, sha, size, chunks.get(name, 0), now)
+                        for name, path, sha, size in files
+                    ],
+                )
+                self._refresh_kb(conn, kb_name)
+        logger.info(f"知识库目录已重建，共 {len(kbs)} 个知识库")
+
+
+KB_CATALOG = KBCatalog(settings.KB_CATALOG_PATH or os.path.join(UPLOAD_DIR, ".kb_catalog.db"))
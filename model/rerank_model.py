@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   rerank_model.py
+@Time    :   2026/10/19 15:30:12
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   本地 cross-encoder 重排模型，首次使用时加载
+"""
+import logging
+import threading
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+_rerank_model = None
+_lock = threading.Lock()
+
+
+def get_rerank_model():
+    """
+    @desc     : 获取重排模型单例
+    @return   : CrossEncoder 实例
+    """
+    global _rerank_model
+    with _lock:
+        if _rerank_model is None:
+            from sentence_transformers import CrossEncoder
+
+            model_path = settings.RERANK_MODEL_LOCAL_PATH or settings.RERANK_MODEL
+            logger.info(f"加载重排模型: {model_path}")
+            _rerank_model = CrossEncoder(model_path, max_length=512)
+        return _rerank_model
@@ -18,4 +18,11 @@ def sys_init() :
     '''
     @description : 系统初始化
     '''
-    os.makedirs(os.path.join(UPLOAD_DIR, DEFAULT_KNOWLEDGE_BASE), exist_ok=True)
\ No newline at end of file
+    os.makedirs(os.path.join(UPLOAD_DIR, DEFAULT_KNOWLEDGE_BASE), exist_ok=True)
+
+    from model.kb_catalog import KB_CATALOG
+    from service.chroma import count_chunks_by_file
+
+    # 首次启动或目录文件丢失时由上传目录与向量库重建
+    if KB_CATALOG.is_empty():
+        KB_CATALOG.rebuild(count_chunks_by_file)
\ No newline at end of file
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   admission_service.py
+@Time    :   2026/10/19 21:48:33
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   接口级准入控制：问答与入库分属不同优先级，各自限制并发与排队长度，
+             排队已满返回 429，排队超时返回 503，均附带 Retry-After
+"""
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """请求未被准入"""
+
+    def __init__(self, msg: str, status_code: int, retry_after: int, priority: str):
+        super().__init__(msg)
+        self.msg = msg
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.priority = priority
+
+
+class AdmissionTicket:
+    """
+    @name     : AdmissionTicket
+    @desc     : 已准入请求的凭证，release 可重复调用
+    """
+
+    def __init__(self, controller: "AdmissionController"):
+        self.controller = controller
+        self.start = time.perf_counter()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller._release(time.perf_counter() - self.start)
+
+
+class AdmissionController:
+    """
+    @name     : AdmissionController
+    @desc     : 单个优先级的准入控制，超过并发上限的请求按先后排队，排队数量与等待时间均有上限
+    """
+
+    def __init__(self, priority: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.priority = priority
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        # 请求平均占用时长，用于估算 Retry-After
+        self.avg_seconds = 1.0
+        self.rejected = {"queue_full": 0, "timeout": 0}
+
+    def retry_after(self) -> int:
+        waves = (len(self.waiters) + 1) / max(self.max_concurrent, 1)
+        return max(1, math.ceil(waves * self.avg_seconds))
+
+    async def acquire(self) -> AdmissionTicket:
+        """
+        @desc     : 申请准入，必要时排队等待
+        @return   : 准入凭证，请求结束后调用 release
+        """
+        if self.running < self.max_concurrent and not self.waiters:
+            self.running += 1
+            return AdmissionTicket(self)
+
+        if len(self.waiters) >= self.max_queue:
+            self.rejected["queue_full"] += 1
+            raise AdmissionRejected("服务繁忙，请稍后重试", 429, self.retry_after(), self.priority)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self.rejected["timeout"] += 1
+            raise AdmissionRejected("排队超时，请稍后重试", 503, self.retry_after(), self.priority)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        return AdmissionTicket(self)
+
+    def _abandon(self, waiter: asyncio.Future):
+        if waiter.done() and not waiter.cancelled():
+            # 已被唤醒但调用方不再需要，名额转交下一个
+            self._release(None)
+            return
+        waiter.cancel()
+        try:
+            self.waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _release(self, seconds: float | None):
+        if seconds is not None:
+            self.avg_seconds = 0.9 * self.avg_seconds + 0.1 * seconds
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                # 名额直接交给排队者，running 不变
+                waiter.set_result(None)
+                return
+        self.running -= 1
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": len(self.waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "avg_seconds": round(self.avg_seconds, 3),
+            "rejected": dict(self.rejected),
+        }
+
+
+async def release_after(events, ticket: AdmissionTicket):
+    """
+    @desc     : 包装流式响应的事件生成器，流结束或断开时释放准入名额
+    """
+    try:
+        async for event in events:
+            yield event
+    finally:
+        ticket.release()
+
+
+CHAT_ADMISSION = AdmissionController(
+    "chat", settings.CHAT_MAX_CONCURRENT, settings.CHAT_MAX_QUEUE, settings.CHAT_QUEUE_TIMEOUT
+)
+INGEST_ADMISSION = AdmissionController(
+    "ingest", settings.INGEST_MAX_CONCURRENT, settings.INGEST_MAX_QUEUE, settings.INGEST_QUEUE_TIMEOUT
+)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   answer_cache.py
+@Time    :   2026/10/19 16:48:03
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   完整回答缓存，按 (知识库, 规范化问题, 知识库索引版本) 命中
+"""
+import re
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from settings import settings
+from model.bm25_index import read_index_version
+
+logger = logging.getLogger(__name__)
+
+TRAILING_PUNCTUATION = "?？!！。.~～ "
+
+
+def normalize_query(query: str) -> str:
+    """
+    @desc     : 规范化问题文本：全半角统一、去除多余空白与结尾标点、英文小写
+    @param    : query: 用户问题
+    @return   : 规范化后的问题
+    """
+    query = unicodedata.normalize("NFKC", query)
+    query = re.sub(r"\s+", " ", query).strip().rstrip(TRAILING_PUNCTUATION)
+    return query.lower()
+
+
+class AnswerCache:
+    """
+    @name     : AnswerCache
+    @desc     : 回答缓存（LRU），key 中包含知识库的索引版本，入库或删除后旧回答自动失效
+    """
+
+    def __init__(self, max_entries: int = settings.ANSWER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.cache: OrderedDict[tuple, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def make_key(self, kb_names: list[str], query: str) -> tuple | None:
+        """
+        @desc     : 生成缓存 key，缓存关闭时返回 None
+        @param    : kb_names: 知识库名称列表
+        @param    : query: 用户问题
+        @return   : 缓存 key
+        """
+        if self.max_entries <= 0:
+            return None
+        kb_names = tuple(sorted(set(kb_names)))
+        return kb_names, normalize_query(query), tuple(read_index_version(name) for name in kb_names)
+
+    def get(self, key: tuple) -> dict | None:
+        with self._lock:
+            entry = self.cache.get(key)
+            if entry is not None:
+                self.cache.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, entry: dict):
+        with self._lock:
+            self.cache[key] = entry
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+
+    def invalidate(self, kb_name: str):
+        """
+        @desc     : 立即清除涉及该知识库的缓存，释放内存（版本变化本身已保证不会命中旧回答）
+        @param    : kb_name: 知识库名称
+        """
+        with self._lock:
+            for key in [key for key in self.cache if kb_name in key[0]]:
+                del self.cache[key]
+
+
+# 全局唯一实例
+ANSWER_CACHE = AnswerCache()
@@ -16,8 +16,10 @@ logger = logging.getLogger(__name__)
 
 UPLOAD_DIR = settings.UPLOAD_DIR
 from model.bm25_index import BM25_REGISTRY
+from libs.tracing import traced
 
 
+@traced()
 def bm25_search(
     query: str,
     kb_name: str,
@@ -37,12 +39,12 @@ def bm25_search(
     return texts, ids, ranked_scores
 
 
-def save_to_bm25_file(kb_name: str, ids: list[str], texts: list[str]):
+def save_to_bm25_file(kb_name: str, ids: list[str], texts: list[str] = None):
     """
     @desc     : 存储知识库内容到json文件
     @param    : kb_name: str - 知识库名称
     @param    : ids: list[str] - 文档ID列表
-    @param    : texts: list[str] - 文档内容列表
+    @param    : texts: list[str] - 文档内容列表，为空时从文本块存储读取
     @return   : None
     """
 
@@ -61,7 +63,6 @@ async def delete_by_file_bm25(file_name: list[str], kb_name: str):
     """
 
     try:
-        print(type(kb_name))
         bm25_indexes = BM25_REGISTRY.get(kb_name)
         bm25_indexes.delete_file(file_name)
     except Exception as e:
@@ -70,6 +71,20 @@ async def delete_by_file_bm25(file_name: list[str], kb_name: str):
         return False
     return True
 
+def bump_bm25_version(kb_name: str):
+    """
+    @desc     : 推进知识库的索引版本号，回滚等未必改动 BM25 的写入在此之后不会命中旧缓存
+    @param    : kb_name: str - 知识库名称
+    @return   : 是否成功
+    """
+    try:
+        BM25_REGISTRY.get(kb_name).bump_version()
+    except Exception as e:
+        logger.error(f"更新 BM25 知识库 {kb_name} 版本号时出错: {e}")
+        logger.error(traceback.format_exc())
+        return False
+    return True
+
 def delete_kb_bm25(kb_name: str, ids: list[str]):
     """
     @desc     : 从知识库中删除文档
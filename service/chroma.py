@@ -7,29 +7,80 @@
 @Version :   1.0
 @Desc    :   None
 """
+import json
+import base64
+import asyncio
 import logging
-from model.chroma_model import chroma_client
+from model.chroma_model import chroma_client, get_collection_model
+from model.chunk_store import CHUNK_STORES
+from service.embedding_service import EMBEDDING_BATCHER
 from settings import settings
+from libs.tracing import span, traced
 
 logger = logging.getLogger(__name__)
 UPLOAD_DIR = settings.UPLOAD_DIR
 
 
-def search_from_chroma(
+class CursorExpired(ValueError):
+    """分页游标无效或已失效"""
+
+
+def _encode_cursor(offset: int, last_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([offset, last_id]).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> tuple[int, str]:
+    try:
+        offset, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if not isinstance(offset, int) or offset < 1 or not isinstance(last_id, str):
+            raise ValueError(cursor)
+    except (ValueError, TypeError):
+        raise CursorExpired("无效的分页游标")
+    return offset, last_id
+
+
+def _fill_documents(kb_name: str, ids: list[str], documents: list[str | None]) -> list[str | None]:
+    """
+    @desc     : 向量库只保存文本块 id，原文从文本块存储读取；旧数据的原文仍在向量库中，直接使用
+    """
+    missing = [i for i, document in enumerate(documents) if document is None]
+    if not missing:
+        return documents
+    documents = list(documents)
+    texts = CHUNK_STORES.get(kb_name).get_many([ids[i] for i in missing])
+    for i, text in zip(missing, texts):
+        documents[i] = text
+    return documents
+
+
+@traced()
+async def search_from_chroma(
     query: str,
     kb_name: str = settings.DEFAULT_KNOWLEDGE_BASE,
     top_k: int = 5,
+    query_embedding: list = None,
 ):
     """
     @desc     : 从向量库中搜索
     @param    : query: 查询内容
     @param    : kb_name: 知识库名称
     @param    : top_k: 返回的结果数量
+    @param    : query_embedding: 已用该知识库的嵌入模型编码好的查询向量，为空时在此编码
     """
     collection = chroma_client.get_collection(name=kb_name)
-    results = collection.query(query_texts=[query], n_results=top_k)
+    if query_embedding is not None:
+        query_embeddings = [query_embedding]
+    else:
+        # 使用建库时记录的模型编码查询，保证与库内向量处于同一空间；编码请求与其他并发请求合批
+        with span("embedding"):
+            query_embeddings = await EMBEDDING_BATCHER.encode([query], get_collection_model(collection))
+    with span("chroma.query", top_k=top_k):
+        results = await asyncio.to_thread(collection.query, query_embeddings=query_embeddings, n_results=top_k)
 
-    return results["documents"][0], results["ids"][0], results["distances"][0]
+    ids, distances = results["ids"][0], results["distances"][0]
+    documents = await asyncio.to_thread(_fill_documents, kb_name, ids, results["documents"][0])
+    found = [i for i, document in enumerate(documents) if document is not None]
+    return [documents[i] for i in found], [ids[i] for i in found], [distances[i] for i in found]
 
 
 async def delete_by_file_chroma(file_name: list[str], kb_name: str):
@@ -56,15 +107,100 @@ async def delete_kb_chroma(kb_name: str):
     return True
 
 
-async def list_knowledge(kb_name: str) -> list[str]:
+def _file_filter(file_names: list[str] | None) -> dict | None:
+    if not file_names:
+        return None
+    names = [name.split("/")[-1] for name in file_names]
+    return {"file_name": names[0]} if len(names) == 1 else {"file_name": {"$in": names}}
+
+
+async def list_knowledge(
+    kb_name: str,
+    cursor: str = None,
+    limit: int = 100,
+    file_names: list[str] = None,
+) -> dict:
+    """
+    @desc     : 分页列出指定知识库中的知识。向量库只支持按偏移分页，游标记录偏移与上一页最后一条 id，
+                翻页时校验该 id 仍在原位置：之前的知识被删除导致位置移动时抛出 CursorExpired，
+                不会静默跳过或重复；翻页期间新增的知识出现在后续页
+    @param    : kb_name: str - 知识库名称
+    @param    : cursor: 不透明游标，取上一页返回的 next_cursor，为空时从第一页开始
+    @param    : limit: 每页数量
+    @param    : file_names: 只列出这些文件的知识
+    @return   : {"ids", "documents", "metadatas", "next_cursor"}，没有下一页时 next_cursor 为 None
+    """
+    collection = chroma_client.get_collection(name=kb_name)
+    offset, last_id = _decode_cursor(cursor) if cursor else (0, None)
+    # 多取上一页的最后一条用于校验位置
+    start = offset - 1 if last_id is not None else offset
+    page = await asyncio.to_thread(
+        collection.get,
+        where=_file_filter(file_names),
+        limit=limit + offset - start,
+        offset=start,
+        include=["documents", "metadatas"],
+    )
+    ids, documents, metadatas = page["ids"], page["documents"], page["metadatas"]
+    if last_id is not None:
+        if not ids or ids[0] != last_id:
+            raise CursorExpired("知识库内容已变化，分页游标已失效，请从第一页重新分页")
+        ids, documents, metadatas = ids[1:], documents[1:], metadatas[1:]
+
+    return {
+        "ids": ids,
+        "documents": await asyncio.to_thread(_fill_documents, kb_name, ids, documents),
+        "metadatas": metadatas,
+        "next_cursor": _encode_cursor(offset + len(ids), ids[-1]) if len(ids) == limit else None,
+    }
+
+
+def count_chunks_by_file(kb_name: str, batch_size: int = 5000) -> dict[str, int]:
+    """
+    @desc     : 按文件统计知识库中的文本块数量，用于重建知识库目录
+    @param    : kb_name: str - 知识库名称
+    @return   : {文件名: 文本块数}
+    """
+    try:
+        collection = chroma_client.get_collection(name=kb_name)
+    except Exception:
+        return {}
+    counts, offset = {}, 0
+    while True:
+        page = collection.get(limit=batch_size, offset=offset, include=["metadatas"])
+        for meta in page["metadatas"]:
+            name = (meta or {}).get("file_name")
+            counts[name] = counts.get(name, 0) + 1
+        if len(page["ids"]) < batch_size:
+            return counts
+        offset += batch_size
+
+
+async def iter_knowledge(kb_name: str, file_names: list[str] = None, batch_size: int = 500):
     """
-    @desc     : 列出指定知识库中的所有知识
+    @desc     : 按批读取知识库中的全部知识：按偏移分页只读 id，再按 id 读取该批的原文与元数据，内存只保留两批 id。
+                每页与上一页重叠 batch_size 条并跳过上一页已输出的 id，读取期间前面的知识被删除（不超过 batch_size 条）
+                导致位置前移时不会漏读；读取期间被删除的知识跳过，新增的知识出现在后续批次
     @param    : kb_name: str - 知识库名称
-    @return   : 知识列表
+    @param    : file_names: 只列出这些文件的知识
+    @param    : batch_size: 每次从向量库读取的数量
+    @return   : 异步生成 (id, 文本, 元数据)
     """
     collection = chroma_client.get_collection(name=kb_name)
-    # knowledge_lists = collection.get()
-    all_docs = collection.get(ids=None, include=["documents", "metadatas"])
-    for doc, meta in zip(all_docs["documents"], all_docs["metadatas"]):
-        logger.debug(f"Chroma 知识库 {meta['file_name']} 中的文档: {doc[:10]}...")
-    return all_docs
+    where = _file_filter(file_names)
+    offset, seen = 0, set()
+    while True:
+        start = max(0, offset - batch_size)
+        limit = offset - start + batch_size
+        ids = (await asyncio.to_thread(collection.get, where=where, limit=limit, offset=start, include=[]))["ids"]
+        batch = [id for id in ids if id not in seen]
+        offset, seen = start + len(ids), set(ids)
+        if batch:
+            page = await asyncio.to_thread(collection.get, ids=batch, include=["documents", "metadatas"])
+            documents = await asyncio.to_thread(_fill_documents, kb_name, page["ids"], page["documents"])
+            rows = {id: (document, metadata) for id, document, metadata in zip(page["ids"], documents, page["metadatas"])}
+            for id in batch:
+                if id in rows:
+                    yield id, *rows[id]
+        if len(ids) < limit:
+            return
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   context_packer.py
+@Time    :   2026/10/19 16:05:52
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   按 token 预算拼装召回知识：合并同文件相邻/重叠的文本块，按相关度填充预算。
+             有元数据时按 (知识库, 文件名, chunk_index) 判断相邻，按 start/end 偏移精确去掉重叠部分
+"""
+import re
+import logging
+from typing import List, Tuple
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# 各模型系列的 token 估算系数：(每个中日韩字符的 token 数, 每个其他字符的 token 数)
+TOKEN_RATIOS = {
+    "glm": (0.75, 0.3),
+    "qwen": (0.7, 0.3),
+    "deepseek": (0.7, 0.3),
+    "gpt": (1.0, 0.3),
+}
+DEFAULT_TOKEN_RATIO = (1.0, 0.3)
+CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str, model: str = settings.TEXT_LLM) -> int:
+    """
+    @desc     : 粗略估算文本在指定模型下的 token 数，偏保守
+    @param    : text: 文本
+    @param    : model: 模型名称
+    @return   : token 数
+    """
+    cjk_ratio, other_ratio = next(
+        (ratio for prefix, ratio in TOKEN_RATIOS.items() if model.lower().startswith(prefix)),
+        DEFAULT_TOKEN_RATIO,
+    )
+    num_cjk = len(CJK_PATTERN.findall(text))
+    return int(num_cjk * cjk_ratio + (len(text) - num_cjk) * other_ratio) + 1
+
+
+def _parse_chunk_id(chunk_id: str) -> Tuple[str, int | None]:
+    """
+    @desc     : 从 "{文件路径}_{chunk_index}" 形式的 id 中解析文件与序号
+    """
+    file_path, _, index = chunk_id.rpartition("_")
+    return (file_path, int(index)) if file_path and index.isdigit() else (chunk_id, None)
+
+
+def _chunk_position(chunk_id: str, metadata: dict | None) -> Tuple[tuple, int | None, int | None, int | None]:
+    """
+    @desc     : 文本块所属的分组与位置，优先使用元数据，缺少 file_name/chunk_index 时从 id 解析
+    @return   : (分组键, chunk_index, start, end)，未知的位置为 None
+    """
+    if metadata and metadata.get("file_name") and metadata.get("chunk_index") is not None:
+        start, end = metadata.get("start"), metadata.get("end")
+        if start is None or end is None:
+            start = end = None
+        return (metadata.get("kb_name"), metadata["file_name"]), int(metadata["chunk_index"]), start, end
+    file_path, index = _parse_chunk_id(chunk_id)
+    return (None, file_path), index, None, None
+
+
+def _join_overlap(left: str, right: str, max_overlap: int) -> str:
+    """
+    @desc     : 拼接相邻文本块，去掉 right 开头与 left 结尾重叠的部分
+    """
+    for size in range(min(len(left), len(right), max_overlap), 0, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return left + "\n" + right
+
+
+def _extend_group(group: dict, text: str, index: int | None, start: int | None, end: int | None) -> bool:
+    """
+    @desc     : 文本块与分组相邻时拼接到分组末尾
+    @return   : 是否已拼接
+    """
+    with_offsets = start is not None and group["end"] is not None
+    if with_offsets and start <= group["end"]:
+        # 偏移重叠或首尾相接：只追加超出当前末尾的部分
+        group["text"] += text[group["end"] - start:]
+    elif index is not None and group["last_index"] is not None and index == group["last_index"] + 1:
+        if with_offsets:
+            group["text"] += "\n" + text
+        else:
+            group["text"] = _join_overlap(group["text"], text, max_overlap=len(text) // 2)
+    else:
+        return False
+
+    group["last_index"] = index
+    group["end"] = max(group["end"], end) if with_offsets else end
+    return True
+
+
+def pack_context(
+    knowledges: List[str],
+    ids: List[str],
+    token_budget: int = settings.CONTEXT_TOKEN_BUDGET,
+    model: str = settings.TEXT_LLM,
+    metadatas: List[dict] = None,
+) -> List[Tuple[str, List[str]]]:
+    """
+    @desc     : 合并同一文件中序号相邻或偏移重叠、首尾相接的文本块，再按相关度（召回顺序）填充 token 预算
+    @param    : knowledges: 按相关度排序的知识列表
+    @param    : ids: 知识对应的 id 列表
+    @param    : token_budget: 知识部分的 token 预算，<=0 时不限制
+    @param    : model: 用于估算 token 的模型名称
+    @param    : metadatas: 知识对应的元数据（file_name、chunk_index、start、end、kb_name），为空时从 id 解析
+    @return   : [(合并后的文本, 包含的 id 列表)]，按相关度排序
+    """
+    metadatas = metadatas or [None] * len(ids)
+    # 按文件分组，记录每个文本块的召回名次
+    by_file: dict[tuple, list] = {}
+    for rank, (text, chunk_id, metadata) in enumerate(zip(knowledges, ids, metadatas)):
+        key, index, start, end = _chunk_position(chunk_id, metadata)
+        by_file.setdefault(key, []).append((index, rank, text, chunk_id, start, end))
+
+    groups = []
+    members = {}
+    for items in by_file.values():
+        items.sort(key=lambda x: (x[0] is None, x[0] if x[0] is not None else x[1]))
+        current = None
+        for index, rank, text, chunk_id, start, end in items:
+            members[chunk_id] = (rank, text)
+            if current and _extend_group(current, text, index, start, end):
+                current["ids"].append(chunk_id)
+                current["rank"] = min(current["rank"], rank)
+                continue
+            if current:
+                groups.append(current)
+            current = {"rank": rank, "text": text, "ids": [chunk_id], "last_index": index, "end": end}
+        if current:
+            groups.append(current)
+
+    groups.sort(key=lambda g: g["rank"])
+
+    packed = []
+    used_tokens = 0
+    for group in groups:
+        text, group_ids = group["text"], group["ids"]
+        tokens = estimate_tokens(text, model)
+        if token_budget > 0 and used_tokens + tokens > token_budget and len(group_ids) > 1:
+            # 合并后放不下时，退回只放其中最相关的一块
+            best_id = min(group_ids, key=lambda i: members[i][0])
+            text, group_ids = members[best_id][1], [best_id]
+            tokens = estimate_tokens(text, model)
+        if token_budget > 0 and used_tokens + tokens > token_budget:
+            continue
+        packed.append((text, group_ids))
+        used_tokens += tokens
+
+    logger.info(f"上下文拼装: {len(knowledges)} 条知识合并为 {len(groups)} 段，入选 {len(packed)} 段，约 {used_tokens} tokens")
+    return packed
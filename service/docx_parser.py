@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   docx_parser.py
+@Time    :   2026/10/20 15:37:12
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   docx 流式解析：直接从压缩包中增量读取 word/document.xml，按文档顺序输出段落与表格，
+             根据标题样式维护章节路径，不构建完整的文档对象，内存占用与文件大小无关
+"""
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Iterator
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+DOCUMENT_XML = "word/document.xml"
+STYLES_XML = "word/styles.xml"
+# 章节路径各级标题之间的分隔符
+SECTION_SEPARATOR = " > "
+
+_HEADING_NAME = re.compile(r"^heading\s*(\d)$", re.IGNORECASE)
+# outlineLvl 为 9 表示正文
+_BODY_OUTLINE_LEVEL = 9
+
+
+def _read_heading_styles(archive: zipfile.ZipFile) -> dict[str, int]:
+    """
+    @desc     : 从 styles.xml 读取段落样式对应的标题级别，Title 为 0 级，heading N 为 N 级，
+                其余样式按大纲级别（outlineLvl + 1）判断，并沿 basedOn 继承
+    @return   : {styleId: 标题级别}
+    """
+    try:
+        root = ET.fromstring(archive.read(STYLES_XML))
+    except KeyError:
+        return {}
+
+    names, outlines, based_on = {}, {}, {}
+    for style in root.iter(f"{W}style"):
+        if style.get(f"{W}type") != "paragraph":
+            continue
+        style_id = style.get(f"{W}styleId")
+        name = style.find(f"{W}name")
+        names[style_id] = (name.get(f"{W}val") if name is not None else "").strip().lower()
+        outline = style.find(f"{W}pPr/{W}outlineLvl")
+        if outline is not None:
+            outlines[style_id] = int(outline.get(f"{W}val"))
+        parent = style.find(f"{W}basedOn")
+        if parent is not None:
+            based_on[style_id] = parent.get(f"{W}val")
+
+    def level_of(style_id: str, depth: int = 0) -> int | None:
+        name = names.get(style_id, "")
+        if name == "title":
+            return 0
+        match = _HEADING_NAME.match(name)
+        if match:
+            return int(match.group(1))
+        if style_id in outlines:
+            return outlines[style_id] + 1 if outlines[style_id] < _BODY_OUTLINE_LEVEL else None
+        if style_id in based_on and depth < 10:
+            return level_of(based_on[style_id], depth + 1)
+        return None
+
+    levels = {}
+    for style_id in names:
+        level = level_of(style_id)
+        if level is not None:
+            levels[style_id] = level
+    return levels
+
+
+def _paragraph_text(paragraph: ET.Element) -> str:
+    parts = []
+    for node in paragraph.iter():
+        if node.tag == f"{W}t":
+            parts.append(node.text or "")
+        elif node.tag == f"{W}tab":
+            parts.append("\t")
+        elif node.tag in (f"{W}br", f"{W}cr"):
+            parts.append("\n")
+    return "".join(parts)
+
+
+def _heading_level(paragraph: ET.Element, heading_styles: dict[str, int]) -> int | None:
+    properties = paragraph.find(f"{W}pPr")
+    if properties is None:
+        return None
+    outline = properties.find(f"{W}outlineLvl")
+    if outline is not None:
+        value = int(outline.get(f"{W}val"))
+        return value + 1 if value < _BODY_OUTLINE_LEVEL else None
+    style = properties.find(f"{W}pStyle")
+    if style is not None:
+        return heading_styles.get(style.get(f"{W}val"))
+    return None
+
+
+def _table_text(table: ET.Element) -> str:
+    """
+    @desc     : 表格每行输出一行，单元格之间用 " | " 分隔，嵌套表格按单元格内容展开
+    """
+    rows = []
+    for row in table.findall(f"{W}tr"):
+        cells = []
+        for cell in row.findall(f"{W}tc"):
+            lines = []
+            for child in cell:
+                if child.tag == f"{W}p":
+                    lines.append(_paragraph_text(child))
+                elif child.tag == f"{W}tbl":
+                    lines.append(_table_text(child))
+            cells.append(" ".join(line.strip() for line in lines if line.strip()))
+        if any(cells):
+            rows.append(" | ".join(cells))
+    return "\n".join(rows)
+
+
+def _element_blocks(element: ET.Element, heading_styles: dict[str, int]) -> Iterator[tuple[str, str, int | None]]:
+    if element.tag == f"{W}p":
+        text = _paragraph_text(element)
+        if text.strip():
+            yield "paragraph", text, _heading_level(element, heading_styles)
+    elif element.tag == f"{W}tbl":
+        text = _table_text(element)
+        if text:
+            yield "table", text, None
+    elif element.tag == f"{W}sdt":
+        # 内容控件（如目录、封面）中的段落与表格
+        content = element.find(f"{W}sdtContent")
+        for child in content if content is not None else ():
+            yield from _element_blocks(child, heading_styles)
+
+
+def iter_docx_blocks(file_path: str) -> Iterator[tuple[str, str, int | None]]:
+    """
+    @desc     : 按文档顺序流式输出正文中的段落与表格，每处理完一个块即释放其 XML 节点
+    @param    : file_path: docx 文件路径
+    @return   : 生成 (类型 paragraph/table, 文本, 标题级别)，非标题段落与表格的标题级别为 None
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        heading_styles = _read_heading_styles(archive)
+        with archive.open(DOCUMENT_XML) as f:
+            depth = 0
+            body = None
+            for event, element in ET.iterparse(f, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+                    if depth == 2 and element.tag == f"{W}body":
+                        body = element
+                    continue
+
+                depth -= 1
+                # document(1) > body(2) > 段落/表格(3)
+                if depth != 2 or body is None:
+                    continue
+                yield from _element_blocks(element, heading_styles)
+                body.remove(element)
+
+
+def read_docx_text(file_path: str) -> str:
+    """
+    @desc     : 读取 docx 的正文文本（含表格），各段落与表格之间换行
+    @param    : file_path: docx 文件路径
+    @return   : 文本内容
+    """
+    return "\n".join(text for _, text, _ in iter_docx_blocks(file_path))
+
+
+def iter_docx_sections(file_path: str) -> Iterator[tuple[list[str], str]]:
+    """
+    @desc     : 按标题把正文分为章节，每个标题开始一个新章节，标题本身作为章节文本的第一行
+    @param    : file_path: docx 文件路径
+    @return   : 生成 (章节路径, 章节文本)，章节路径为从高到低的各级标题，标题之前的内容路径为空
+    """
+    stack: list[tuple[int, str]] = []
+    lines: list[str] = []
+    for _, text, level in iter_docx_blocks(file_path):
+        if level is not None:
+            if lines:
+                yield [title for _, title in stack], "\n".join(lines)
+                lines = []
+            while stack and stack[-1][0] >= level:
+                stack.pop()
+            stack.append((level, " ".join(text.split())))
+        lines.append(text)
+    if lines:
+        yield [title for _, title in stack], "\n".join(lines)
+
+
+def section_label(path: list[str]) -> str:
+    return SECTION_SEPARATOR.join(path)
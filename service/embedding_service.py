@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   embedding_service.py
+@Time    :   2026/10/19 11:20:05
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   进程内的嵌入动态批处理，合并并发请求的编码任务
+"""
+import math
+import asyncio
+import logging
+import traceback
+from collections import Counter, deque
+
+from settings import settings
+from model.embedding_model import EMBEDDING_REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+class PendingQueue:
+    """
+    @name     : PendingQueue
+    @desc     : 单个模型的待编码队列，按优先级分别排队，取批时按权重分配名额
+    """
+
+    def __init__(self, weights: dict[str, int]):
+        self.weights = weights
+        self.items: dict[str, deque] = {priority: deque() for priority in weights}
+        self.event = asyncio.Event()
+
+    def put(self, priority: str, item):
+        self.items[priority].append(item)
+        self.event.set()
+
+    def qsize(self) -> int:
+        return sum(len(items) for items in self.items.values())
+
+    async def wait(self, timeout: float = None) -> bool:
+        """
+        @desc     : 等待新的待编码项
+        @return   : 超时返回 False
+        """
+        self.event.clear()
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def take(self, size: int) -> list:
+        """
+        @desc     : 按权重取出一批：各优先级先取各自份额，剩余名额再按权重顺序补齐
+        """
+        demand = {priority: items for priority, items in self.items.items() if items}
+        total_weight = sum(self.weights[priority] for priority in demand)
+        batch = []
+        for priority, items in demand.items():
+            quota = math.ceil(size * self.weights[priority] / total_weight)
+            for _ in range(min(quota, len(items), size - len(batch))):
+                batch.append(items.popleft())
+        for items in demand.values():
+            while items and len(batch) < size:
+                batch.append(items.popleft())
+        return batch
+
+
+class EmbeddingBatcher:
+    """
+    @name     : EmbeddingBatcher
+    @desc     : 收集各协程提交的待编码文本，凑满 max_batch_size 条或等待 max_wait_ms 后统一编码，
+                再把结果分发回各调用方。每个模型一个队列和一个后台 worker；
+                问答与入库分开排队并按权重分享每一批，大批量入库不会让检索请求排在全部文本块之后
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = settings.EMBEDDING_BATCH_SIZE,
+        max_wait_ms: float = settings.EMBEDDING_BATCH_WAIT_MS,
+        weights: dict[str, int] = None,
+    ):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.weights = weights or {"chat": settings.EMBEDDING_CHAT_WEIGHT, "ingest": settings.EMBEDDING_INGEST_WEIGHT}
+        # 权重为 0 的优先级分不到名额，全部为 0 时 PendingQueue.take 会除零
+        invalid = {priority: weight for priority, weight in self.weights.items() if weight < 1}
+        if invalid:
+            raise ValueError(f"嵌入批处理权重必须不小于 1: {invalid}")
+        self._loop = None
+        self._queues: dict[str, PendingQueue] = {}
+        self._workers: dict[str, asyncio.Task] = {}
+
+        self.total_batches = 0
+        self.total_items = 0
+        self.last_batch_size = 0
+        self.batch_size_counts: Counter[int] = Counter()
+
+    def _get_queue(self, model_name: str) -> PendingQueue:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 事件循环变化（如多次 asyncio.run）时旧 worker 已失效，重新创建
+            self._loop = loop
+            self._queues.clear()
+            self._workers.clear()
+
+        if model_name not in self._queues:
+            queue = PendingQueue(self.weights)
+            self._queues[model_name] = queue
+            self._workers[model_name] = loop.create_task(self._worker(model_name, queue))
+        return self._queues[model_name]
+
+    async def encode(self, texts: list[str], model_name: str = None, priority: str = "chat") -> list:
+        """
+        @desc     : 提交文本并等待编码结果
+        @param    : texts: 待编码的文本列表
+        @param    : model_name: 嵌入模型名称，为空时使用默认模型
+        @param    : priority: chat / ingest
+        @return   : 与 texts 一一对应的向量列表
+        """
+        if not texts:
+            return []
+        queue = self._get_queue(model_name or settings.EMBEDDING_MODEL)
+        futures = []
+        for text in texts:
+            future = self._loop.create_future()
+            queue.put(priority, (text, future))
+            futures.append(future)
+        return list(await asyncio.gather(*futures))
+
+    async def _collect(self, queue: PendingQueue) -> list:
+        """
+        @desc     : 取出一批待编码项，队列中已够一批时直接取走，不足一批时最多等待 max_wait
+        """
+        while not queue.qsize():
+            await queue.wait()
+        deadline = self._loop.time() + self.max_wait
+        while queue.qsize() < self.max_batch_size:
+            remaining = deadline - self._loop.time()
+            if remaining <= 0 or not await queue.wait(remaining):
+                break
+        batch = queue.take(self.max_batch_size)
+        # 调用方已取消的项无需编码
+        return [(text, future) for text, future in batch if not future.done()]
+
+    async def _worker(self, model_name: str, queue: PendingQueue):
+        while True:
+            batch = []
+            # 任何异常只让本批失败，worker 退出后该模型的请求会一直等待
+            try:
+                batch = await self._collect(queue)
+                if not batch:
+                    continue
+
+                texts = [text for text, _ in batch]
+                embeddings = await asyncio.to_thread(self._encode_batch, model_name, texts)
+
+                self.total_batches += 1
+                self.total_items += len(texts)
+                self.last_batch_size = len(texts)
+                self.batch_size_counts[len(texts)] += 1
+                for (_, future), embedding in zip(batch, embeddings):
+                    if not future.done():
+                        future.set_result(embedding)
+            except Exception as e:
+                logger.error(f"批量编码失败, 模型: {model_name}, 数量: {len(batch)}, 错误: {e}")
+                logger.error(traceback.format_exc())
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    @staticmethod
+    def _encode_batch(model_name: str, texts: list[str]) -> list:
+        with EMBEDDING_REGISTRY.use(model_name) as ef:
+            return ef(texts)
+
+    def stats(self) -> dict:
+        """
+        @desc     : 批处理运行指标
+        @return   : 队列深度、批次数、平均批大小及批大小分布
+        """
+        return {
+            "queue_depth": {
+                name: {priority: len(items) for priority, items in queue.items.items()}
+                for name, queue in self._queues.items()
+            },
+            "total_batches": self.total_batches,
+            "total_items": self.total_items,
+            "avg_batch_size": self.total_items / self.total_batches if self.total_batches else 0,
+            "last_batch_size": self.last_batch_size,
+            "batch_size_counts": dict(sorted(self.batch_size_counts.items())),
+        }
+
+
+# 全局唯一实例，chat 与入库共用
+EMBEDDING_BATCHER = EmbeddingBatcher()
@@ -9,19 +9,31 @@
 """
 
 import os
+import time
+import bisect
+import shutil
+import tempfile
 
 import asyncio
 import aiofiles
-import docx
 import logging
-import re
-from asyncio import Semaphore
+import fitz
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator
 from pdf2image import convert_from_path
 
+from settings import settings
 from service.vlm import get_image_text
+from service.text_splitter import IncrementalSplitter
+from service.parse_worker import read_pdf_text_layer
+from service.docx_parser import read_docx_text
+from libs.tracing import traced
+from service.metrics_service import record_ocr
 
 logger = logging.getLogger(__name__)
 
+@traced()
 async def read_file_content(file_path: str) -> str:
     """
     @desc     : 读取文件内容
@@ -43,93 +55,177 @@ async def read_file_content(file_path: str) -> str:
         return text
 
     elif ext == ".docx":
-        doc = docx.Document(file_path)
-        return "\n".join([para.text for para in doc.paragraphs])
+        return await asyncio.to_thread(read_docx_text, file_path)
 
     else:
         raise ValueError(f"不支持的文件类型: {ext}")
 
 
-async def split_pdf(filename: str, output_dir: str, max_concurrent: int = 8) -> list[str]:
-    '''
-    @desc     : 将 PDF 文件按页拆分为多个单独的 PDF 文件
-    @param    : filename: PDF 文件路径
-    @param    : output_dir: 输出目录
-    @return   : 拆分后的 PDF 文件列表
-    '''
-    try:
-        os.makedirs(output_dir, exist_ok=True)
-        pages = convert_from_path(filename, dpi=300)
-    except Exception as e:
-        logger.error(f"pdf转图片失败: {e}")
-        raise ValueError(f"无法处理 PDF 文件: {filename}") from e
-    tasks = []
-
-    saved_files = []
-    sem = Semaphore(max_concurrent)
+def _count_pages(file_path: str) -> int:
+    with fitz.open(file_path) as pdf:
+        return pdf.page_count
 
-    async def save_page_image(page, image_path: str, sem: Semaphore):
-        async with sem:
-            # page.save 是阻塞操作，用 to_thread 放到线程池
-            await asyncio.to_thread(page.save, image_path, "PNG")
-            logger.info(f"已保存图片: {image_path}")
 
-    for i, page in enumerate(pages):
-        image_path = os.path.join(output_dir, f"page_{i+1}.png")
-        saved_files.append(image_path)
-        tasks.append(save_page_image(page, image_path, sem))
+def _render_page(file_path: str, page_no: int, image_path: str):
+    """
+    @desc     : 渲染 PDF 的单页并保存为 PNG，内存中只保留这一页的图片
+    """
+    pages = convert_from_path(file_path, dpi=300, first_page=page_no, last_page=page_no)
+    pages[0].save(image_path, "PNG")
 
-    await asyncio.gather(*tasks)
-    
-    logger.info(f"共 {len(pages)} 页已保存到 {output_dir} 文件夹")
 
-async def ocr_image(image_path: str, max_concurrent: int = 5) -> str:
+async def ocr_page(file_path: str, page_no: int, output_dir: str, retries: int = settings.OCR_PAGE_RETRIES) -> str | None:
     """
-    对图片进行 OCR 识别（并发控制）
-
-    :param image_path: 图片文件夹路径
-    :param max_concurrent: 最大并发数
-    :return: 识别出的文本内容
+    @desc     : 渲染并识别单页，渲染或识别失败时按指数退避重试，已渲染的图片在重试时复用
+    @param    : file_path: PDF 文件路径
+    @param    : page_no: 页码，从 1 开始
+    @param    : output_dir: 页面图片的临时目录
+    @param    : retries: 重试次数
+    @return   : 识别出的文本，重试后仍渲染或识别失败时返回 None
     """
-    logger.info(f"正在对{image_path}下的图片进行 OCR 识别")
-    
-    files = [f for f in os.listdir(image_path) if f.endswith('.png')]
-    sorted_files = sorted(files, key=lambda x: int(re.search(r'\d+', x).group()))
-    
+    image_path = os.path.join(output_dir, f"page_{page_no}.png")
+    try:
+        for attempt in range(retries + 1):
+            try:
+                if not os.path.exists(image_path):
+                    await asyncio.to_thread(_render_page, file_path, page_no, image_path)
+                text = await get_image_text(image_path)
+                logger.info(f"已识别 {file_path} 第 {page_no} 页的文字内容")
+                return text
+            except Exception as e:
+                logger.error(f"渲染或识别 {file_path} 第 {page_no} 页失败(第 {attempt + 1} 次): {e}")
+                if attempt < retries:
+                    await asyncio.sleep(2 ** attempt)
+        return None
+    finally:
+        if os.path.exists(image_path):
+            await safe_remove(image_path)
+
+
+@traced()
+async def iter_ocr_pages(
+    file_path: str, max_concurrent: int = settings.OCR_MAX_CONCURRENT
+) -> AsyncIterator[tuple[int, str | None]]:
+    """
+    @desc     : 逐页渲染并识别 PDF，最多 max_concurrent 页同时进行；按页码顺序输出，
+                某页及其之前的页全部完成后立即输出，后续页的识别与调用方的处理并行
+    @param    : file_path: PDF 文件路径
+    @param    : max_concurrent: 同时识别的页数
+    @return   : 生成 (页码, 文本)，页码从 1 开始，识别失败的页文本为 None
+    """
+    try:
+        num_pages = await asyncio.to_thread(_count_pages, file_path)
+    except Exception as e:
+        logger.error(f"读取 PDF 页数失败: {e}")
+        raise ValueError(f"无法处理 PDF 文件: {file_path}") from e
+    logger.info(f"正在对 {file_path} 的 {num_pages} 页进行 OCR 识别")
+
+    # 隐藏目录，不会被当作知识库文件
+    output_dir = tempfile.mkdtemp(prefix=".ocr_", dir=os.path.dirname(file_path) or None)
     sem = asyncio.Semaphore(max_concurrent)
+    start = time.perf_counter()
 
-    async def ocr_worker(img_file: str) -> str:
+    async def ocr_worker(page_no: int) -> str | None:
         async with sem:
-            img_path = os.path.join(image_path, img_file)
-            try:
-                text = await get_image_text(img_path)
-                logger.info(f"已识别图片 {img_file} 的文字内容")
-                await safe_remove(img_path)
-            except Exception as e:
-                logger.error(f"识别图片 {img_file} 时发生错误: {e}")
-                text = ""
-                raise ValueError(f"无法识别图片 {img_file} 的文字内容") from e
-            return text
+            return await ocr_page(file_path, page_no, output_dir)
 
-    tasks = [ocr_worker(f) for f in sorted_files]
-    results = await asyncio.gather(*tasks)
+    # 最多提前调度 2 倍并发数的页，调用方处理较慢时已识别未取走的结果不会无限堆积
+    window = max_concurrent * 2
+    pending: deque[tuple[int, asyncio.Task]] = deque()
+    next_page, done, failed = 1, 0, 0
+    try:
+        while next_page <= num_pages or pending:
+            while next_page <= num_pages and len(pending) < window:
+                pending.append((next_page, asyncio.create_task(ocr_worker(next_page))))
+                next_page += 1
+            page_no, task = pending.popleft()
+            text = await task
+            done += 1
+            failed += text is None
+            yield page_no, text
+    finally:
+        for _, task in pending:
+            task.cancel()
+        await asyncio.gather(*[task for _, task in pending], return_exceptions=True)
+        record_ocr(done - failed, time.perf_counter() - start, failed)
+        await asyncio.to_thread(shutil.rmtree, output_dir, True)
+
+
+async def iter_ocr_chunks(
+    file_path: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    missing_pages: list[int] = None,
+) -> AsyncIterator[list[tuple[str, int, int, dict]]]:
+    """
+    @desc     : 按页顺序识别扫描版 PDF 并增量切片，前面的页切出的文本块可先行入库；
+                各页文本以换行连接，文本块可跨页，元数据记录起止页码
+    @param    : file_path: PDF 文件路径
+    @param    : chunk_size: 文本块大小
+    @param    : chunk_overlap: 文本块重叠大小
+    @param    : missing_pages: 识别失败而跳过的页码追加到该列表
+    @return   : 生成文本块批次，每个文本块为 (文本块, start, end, {"page": 起始页, "page_end": 结束页})
+    """
+    splitter = IncrementalSplitter(chunk_size, chunk_overlap)
+    page_starts, page_numbers = [], []
+    length = 0
+    missing = [] if missing_pages is None else missing_pages
+
+    def with_pages(chunks: list[tuple[str, int, int]]) -> list[tuple[str, int, int, dict]]:
+        return [
+            (
+                chunk,
+                start,
+                end,
+                {
+                    "page": page_numbers[bisect.bisect_right(page_starts, start) - 1],
+                    "page_end": page_numbers[bisect.bisect_right(page_starts, end - 1) - 1],
+                },
+            )
+            for chunk, start, end in chunks
+        ]
+
+    async with aclosing(iter_ocr_pages(file_path)) as pages:
+        async for page_no, text in pages:
+            if text is None:
+                missing.append(page_no)
+                continue
+            page_starts.append(length)
+            page_numbers.append(page_no)
+            text += "\n"
+            length += len(text)
+            chunks = await asyncio.to_thread(splitter.feed, text)
+            if chunks:
+                yield with_pages(chunks)
+
+    if not page_numbers:
+        raise ValueError(f"无法识别 PDF 文件: {file_path}，全部 {len(missing)} 页识别失败")
+    if missing:
+        logger.warning(f"{file_path} 第 {missing} 页识别失败，已跳过")
+    chunks = splitter.finish()
+    if chunks:
+        yield with_pages(chunks)
 
-    return "".join(results)
 
 async def read_pdf_content(file_path: str) -> str:
     """
-    读取 PDF 文件内容
+    读取 PDF 文件内容，逐页 OCR 后以换行连接，识别失败的页跳过
 
     :param file_path: PDF 文件路径
     :return: PDF 文本内容
     """
-    logger.info(f"正在将文件{file_path}转换成图片")
-    output_path = file_path.replace(".pdf", "")
-    await split_pdf(file_path, output_path)
-    text = await ocr_image(output_path)
-    await safe_remove(output_path)
-
-    return text
+    texts, missing = [], []
+    async with aclosing(iter_ocr_pages(file_path)) as pages:
+        async for page_no, text in pages:
+            if text is None:
+                missing.append(page_no)
+            else:
+                texts.append(text)
+    if missing and not texts:
+        raise ValueError(f"无法识别 PDF 文件: {file_path}，全部 {len(missing)} 页识别失败")
+    if missing:
+        logger.warning(f"{file_path} 第 {missing} 页识别失败，已跳过")
+    return "\n".join(texts)
 
 async def safe_remove(path: str) -> bool:
     '''
@@ -9,11 +9,19 @@
 '''
 
 import os
+import json
+import asyncio
 import logging
 import traceback
-from service.chroma import list_knowledge
+from service.chroma import list_knowledge, iter_knowledge, count_chunks_by_file
 from service.chroma import delete_by_file_chroma, delete_kb_chroma
 from service.bm25_service import delete_by_file_bm25, delete_kb_bm25
+from service.answer_cache import ANSWER_CACHE
+from service.retrieval_cache import RETRIEVAL_CACHE
+from model.kb_catalog import KB_CATALOG
+from model.chunk_store import CHUNK_STORES
+from model.bm25_index import BM25_REGISTRY
+from service.warmup_service import KB_ACCESS, kb_exists, warm_kbs, schedule_warmup
 
 from settings import settings
 
@@ -26,7 +34,7 @@ async def list_kb() -> list[str]:
     @desc     : 列出所有知识库
     @return   : 知识库名称列表
     """
-    return [d for d in os.listdir(UPLOAD_DIR) if os.path.isdir(os.path.join(UPLOAD_DIR, d))]
+    return [kb["name"] for kb in await asyncio.to_thread(KB_CATALOG.list_kbs)]
 
 
 async def list_kb_files(kb_name: str) -> list[str]:
@@ -35,14 +43,83 @@ async def list_kb_files(kb_name: str) -> list[str]:
     @param    : kb_name: str - 知识库名称
     @return   : 文件名称列表
     """
-    kb_path = os.path.join(UPLOAD_DIR, kb_name)
-    if not os.path.exists(kb_path):
-        return []
+    return [f["file_name"] for f in await asyncio.to_thread(KB_CATALOG.list_files, kb_name)]
+
+
+async def kb_stats(kb_name: str = None) -> list[dict] | dict | None:
+    """
+    @desc     : 知识库统计信息：文件数、文本块数、字节数、嵌入模型、更新时间，均来自知识库目录
+    @param    : kb_name: str - 知识库名称，为空时返回全部知识库
+    @return   : 单个知识库的统计信息（不存在时为 None）或全部知识库的统计列表
+    """
+    if kb_name is None:
+        return await asyncio.to_thread(KB_CATALOG.list_kbs)
+    kb = await asyncio.to_thread(KB_CATALOG.get_kb, kb_name)
+    if kb is not None:
+        kb["files"] = await asyncio.to_thread(KB_CATALOG.list_files, kb_name)
+    return kb
 
-    return [f for f in os.listdir(kb_path) if os.path.isfile(os.path.join(kb_path, f)) and f != settings.BM25_INDEX_NAME]
 
-async def list_kb_knowledge(kb_name: str):
-    return await list_knowledge(kb_name)
+async def unknown_kbs(kb_names: list[str]) -> list[str]:
+    """
+    @desc     : 筛选出不存在的知识库
+    @param    : kb_names: 知识库名称列表
+    @return   : 不存在的知识库名称列表
+    """
+    return [kb_name for kb_name in kb_names if not await asyncio.to_thread(kb_exists, kb_name)]
+
+
+async def warmup_kbs(kb_names: list[str], wait: bool = False) -> dict | None:
+    """
+    @desc     : 预热知识库索引，通常在会话开始、用户选定知识库时调用
+    @param    : kb_names: 知识库名称列表
+    @param    : wait: 是否等待预热完成
+    @return   : 等待时返回各知识库的加载耗时
+    """
+    # 只统计已存在的知识库，不存在的名称不进入热度表，也不会被后台预热建锁
+    kb_names = [kb_name for kb_name in kb_names if await asyncio.to_thread(kb_exists, kb_name)]
+    for kb_name in kb_names:
+        KB_ACCESS.record(kb_name)
+    if wait:
+        return await warm_kbs(kb_names)
+    schedule_warmup(kb_names)
+    return None
+
+
+def hot_kbs() -> dict:
+    """
+    @desc     : 知识库访问频率与当前已加载 BM25 索引的知识库
+    """
+    return {"access": KB_ACCESS.stats(), "bm25_cached": list(BM25_REGISTRY.cache)}
+
+
+async def rebuild_catalog():
+    """
+    @desc     : 扫描上传目录与向量库重建知识库目录
+    """
+    await asyncio.to_thread(KB_CATALOG.rebuild, count_chunks_by_file)
+
+async def list_kb_knowledge(kb_name: str, cursor: str = None, limit: int = 100, file_names: list[str] = None) -> dict:
+    """
+    @desc     : 分页列出知识库中的知识
+    @param    : kb_name: str - 知识库名称
+    @param    : cursor: 上一页返回的 next_cursor，为空时从第一页开始
+    @param    : limit: 每页数量
+    @param    : file_names: 文件名过滤
+    @return   : 当前页知识与 next_cursor
+    """
+    return await list_knowledge(kb_name, cursor, limit, file_names)
+
+
+async def stream_kb_knowledge(kb_name: str, file_names: list[str] = None):
+    """
+    @desc     : 逐行输出知识库中的全部知识 (NDJSON)
+    @param    : kb_name: str - 知识库名称
+    @param    : file_names: 文件名过滤
+    @return   : 异步生成每行 JSON 文本
+    """
+    async for id, document, metadata in iter_knowledge(kb_name, file_names):
+        yield json.dumps({"id": id, "document": document, "metadata": metadata}, ensure_ascii=False) + "\n"
 
 async def create_kb(kb_name: str) -> str:
     """
@@ -56,10 +133,11 @@ async def create_kb(kb_name: str) -> str:
         # 创建一个文件夹
         os.makedirs(kb_path, exist_ok=False)
         with open(os.path.join(kb_path, settings.BM25_INDEX_NAME), "w", encoding="utf-8") as f:
-            f.write("{}")
+            f.write("[]")
     except FileExistsError:
         logger.error(f"知识库 {kb_name} 已存在")
         raise
+    await asyncio.to_thread(KB_CATALOG.create_kb, kb_name)
     return kb_path
 
 async def delete_by_ids():
@@ -74,6 +152,10 @@ async def delete_by_file(file_names: list[str], kb_name: str):
     """
     await delete_by_file_chroma(file_names, kb_name)
     await delete_by_file_bm25(file_names, kb_name)
+    ANSWER_CACHE.invalidate(kb_name)
+    RETRIEVAL_CACHE.invalidate(kb_name)
+    await asyncio.to_thread(CHUNK_STORES.get(kb_name).delete_files, file_names)
+    await asyncio.to_thread(KB_CATALOG.delete_files, kb_name, file_names)
     try :
         for filename in file_names:
             kb_path = os.path.join(UPLOAD_DIR, kb_name)
@@ -95,6 +177,12 @@ async def delete_kb(kb_name: str):
     @return   : bool - 删除是否成功
     """
     success = await delete_kb_chroma(kb_name)
+    ANSWER_CACHE.invalidate(kb_name)
+    RETRIEVAL_CACHE.invalidate(kb_name)
+    await asyncio.to_thread(KB_CATALOG.delete_kb, kb_name)
+    CHUNK_STORES.drop(kb_name)
+    BM25_REGISTRY.drop(kb_name)
+    KB_ACCESS.forget(kb_name)
     # success &= await delete_kb_bm25(kb_name) # 不需要删除的操作，下边的一步会覆盖操作
     kb_path = os.path.join(UPLOAD_DIR, kb_name)
 
@@ -12,11 +12,14 @@ import os
 from settings import settings
 from openai import AsyncOpenAI
 import logging
+from libs.tracing import traced
+from service.metrics_service import track_model_request
 
 logger = logging.getLogger(__name__)
 api_key = os.getenv("CHATGLM_API_KEY", settings.CHATGLM_API_KEY)
 
 
+@traced()
 async def get_llm_response(
     query: str,
     model: str = settings.TEXT_LLM,
@@ -46,8 +49,9 @@ async def get_llm_response(
     messages.append({"role": "user", "content": query})
 
     try:
-        async for chunk in process_response(llm_client, model, messages, temperature, stream):
-            yield chunk
+        with track_model_request("llm"):
+            async for chunk in process_response(llm_client, model, messages, temperature, stream):
+                yield chunk
     except Exception as e:
         logger.error(f"请求发生错误: {str(e)}")
         raise ValueError(f"请求发生错误: {str(e)}") from e
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   metrics_service.py
+@Time    :   2026/10/19 19:32:08
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   服务运行指标：请求、各阶段耗时、SSE 连接、LLM/VLM 调用、BM25 缓存、知识库大小、关键词检索次数、OCR 速度、事件循环延迟
+"""
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+
+from settings import settings
+from libs.metrics import METRICS
+from libs.tracing import SPAN_LISTENERS, Span
+
+logger = logging.getLogger(__name__)
+
+HTTP_REQUESTS = METRICS.counter("docrag_http_requests_total", "HTTP 请求数", ("method", "path", "status"))
+HTTP_LATENCY = METRICS.histogram(
+    "docrag_http_request_duration_seconds", "HTTP 请求到响应头发出的耗时", ("method", "path")
+)
+STAGE_LATENCY = METRICS.histogram("docrag_stage_duration_seconds", "RAG 各阶段耗时", ("stage",))
+STAGE_ERRORS = METRICS.counter("docrag_stage_errors_total", "RAG 各阶段异常次数", ("stage",))
+LLM_FIRST_CHUNK = METRICS.histogram("docrag_llm_first_chunk_seconds", "LLM 首个输出块的耗时")
+SSE_ACTIVE = METRICS.gauge("docrag_sse_streams_active", "正在进行的 SSE 流", ("endpoint",))
+SSE_TOTAL = METRICS.counter("docrag_sse_streams_total", "SSE 流总数", ("endpoint",))
+MODEL_INFLIGHT = METRICS.gauge("docrag_model_requests_inflight", "进行中的模型请求", ("kind",))
+MODEL_ERRORS = METRICS.counter("docrag_model_errors_total", "模型请求失败次数", ("kind",))
+BM25_CACHE = METRICS.counter("docrag_bm25_registry_total", "BM25 索引缓存命中/未命中/淘汰次数", ("result",))
+KB_CHUNKS = METRICS.gauge("docrag_kb_chunks", "知识库文本块数量", ("kb",))
+KB_BYTES = METRICS.gauge("docrag_kb_bytes", "知识库文件占用字节数", ("kb",))
+OCR_PAGES = METRICS.counter("docrag_ocr_pages_total", "OCR 识别的页数")
+OCR_SECONDS = METRICS.counter("docrag_ocr_seconds_total", "OCR 累计耗时，与页数相除即平均速度")
+KEYWORD_SEARCHES = METRICS.counter(
+    "docrag_keyword_searches_total", "召回时实际执行的单关键词检索次数（向量与 BM25 各计一次）", ("policy",)
+)
+KEYWORD_SEARCHES_AVOIDED = METRICS.counter(
+    "docrag_keyword_searches_avoided_total", "adaptive 策略提前停止扩展而省去的检索次数", ("reason",)
+)
+OCR_FAILED_PAGES = METRICS.counter("docrag_ocr_failed_pages_total", "重试后仍识别失败而跳过的页数")
+RERANK_SKIPPED = METRICS.counter(
+    "docrag_rerank_skipped_total", "有知识未参与打分的重排次数，busy 为耗时上限内未等到空闲重排线程，timeout 为打分超过耗时上限", ("reason",)
+)
+OCR_PAGES_PER_SECOND = METRICS.gauge("docrag_ocr_pages_per_second", "最近一次 OCR 任务的识别速度")
+LOOP_LAG = METRICS.gauge("docrag_event_loop_lag_seconds", "最近一次测得的事件循环延迟")
+LOOP_LAG_HISTOGRAM = METRICS.histogram(
+    "docrag_event_loop_lag_histogram_seconds",
+    "事件循环延迟分布",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+def _observe_span(item: Span):
+    STAGE_LATENCY.observe(item.duration_ms / 1000, stage=item.name)
+    if item.error:
+        STAGE_ERRORS.inc(stage=item.name)
+    first_chunk_ms = item.attributes.get("first_chunk_ms")
+    if first_chunk_ms is not None and item.name == "get_llm_response":
+        LLM_FIRST_CHUNK.observe(first_chunk_ms / 1000)
+
+
+SPAN_LISTENERS.append(_observe_span)
+
+
+def collect_bm25_registry():
+    from model.bm25_index import BM25_REGISTRY
+
+    for result in ("hit", "miss", "eviction"):
+        BM25_CACHE.set(BM25_REGISTRY.stats[result], result=result)
+
+
+def collect_kb_sizes():
+    """
+    @desc     : 从知识库目录读取每个知识库的文本块数量与文件大小，只在导出指标时执行
+    """
+    from model.kb_catalog import KB_CATALOG
+
+    KB_CHUNKS.clear()
+    KB_BYTES.clear()
+    for kb in KB_CATALOG.list_kbs():
+        KB_CHUNKS.set(kb["chunk_count"], kb=kb["name"])
+        KB_BYTES.set(kb["byte_size"], kb=kb["name"])
+
+
+ADMISSION_RUNNING = METRICS.gauge("docrag_admission_running", "已准入正在处理的请求", ("priority",))
+ADMISSION_QUEUED = METRICS.gauge("docrag_admission_queued", "排队等待准入的请求", ("priority",))
+ADMISSION_REJECTED = METRICS.counter("docrag_admission_rejected_total", "未被准入的请求", ("priority", "reason"))
+
+
+def collect_admission():
+    from service.admission_service import CHAT_ADMISSION, INGEST_ADMISSION
+
+    for controller in (CHAT_ADMISSION, INGEST_ADMISSION):
+        ADMISSION_RUNNING.set(controller.running, priority=controller.priority)
+        ADMISSION_QUEUED.set(len(controller.waiters), priority=controller.priority)
+        for reason, count in controller.rejected.items():
+            ADMISSION_REJECTED.set(count, priority=controller.priority, reason=reason)
+
+
+METRICS.collectors.extend([collect_bm25_registry, collect_kb_sizes, collect_admission])
+
+
+def record_ocr(pages: int, seconds: float, failed: int = 0):
+    OCR_PAGES.inc(pages)
+    if failed:
+        OCR_FAILED_PAGES.inc(failed)
+    OCR_SECONDS.inc(seconds)
+    if seconds > 0:
+        OCR_PAGES_PER_SECOND.set(pages / seconds)
+
+
+def record_keyword_fanout(policy: str, searches: int, avoided: int = 0, reason: str = None):
+    KEYWORD_SEARCHES.inc(searches, policy=policy)
+    if avoided:
+        KEYWORD_SEARCHES_AVOIDED.inc(avoided, reason=reason)
+
+
+@contextmanager
+def track_model_request(kind: str):
+    """
+    @desc     : 统计模型请求的并发数与失败次数，取消与客户端断开不计为失败
+    @param    : kind: llm / vlm
+    """
+    MODEL_INFLIGHT.inc(kind=kind)
+    try:
+        yield
+    except Exception:
+        MODEL_ERRORS.inc(kind=kind)
+        raise
+    finally:
+        MODEL_INFLIGHT.dec(kind=kind)
+
+
+async def track_stream(events, endpoint: str):
+    """
+    @desc     : 包装 SSE 事件生成器，统计进行中与累计的流数量
+    @param    : events: 异步事件生成器
+    @param    : endpoint: 接口名称
+    """
+    SSE_TOTAL.inc(endpoint=endpoint)
+    SSE_ACTIVE.inc(endpoint=endpoint)
+    try:
+        async for event in events:
+            yield event
+    finally:
+        SSE_ACTIVE.dec(endpoint=endpoint)
+
+
+async def monitor_event_loop_lag(interval: float = settings.LOOP_LAG_INTERVAL):
+    """
+    @desc     : 周期性休眠并测量实际唤醒的延迟，反映事件循环被同步代码阻塞的程度
+    """
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - start - interval)
+        LOOP_LAG.set(lag)
+        LOOP_LAG_HISTOGRAM.observe(lag)
+
+
+class MetricsMiddleware:
+    """
+    @name     : MetricsMiddleware
+    @desc     : ASGI 中间件，按路由模板统计请求数与响应头发出前的耗时，不包装响应体，不影响 SSE 流式输出
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        method = scope["method"]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                # 未匹配的路径统一归类，避免标签数量无限增长
+                path = getattr(route, "path", "unmatched")
+                HTTP_REQUESTS.inc(method=method, path=path, status=str(message["status"]))
+                HTTP_LATENCY.observe(time.perf_counter() - start, method=method, path=path)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   parse_worker.py
+@Time    :   2026/10/19 23:25:07
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   入库的解析与切片进程池：txt/md/docx 与带文本层的 PDF 在子进程中解析并切片，
+             只把文本块列表传回主进程，避免大文件解析与切片受 GIL 限制只能用满一个核；
+             docx 按章节切片，未启用进程池时在线程中执行
+"""
+import os
+import signal
+import asyncio
+import logging
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz
+from settings import settings
+from service.text_splitter import TextSplitter
+from service.docx_parser import iter_docx_sections, section_label
+
+logger = logging.getLogger(__name__)
+
+# 可在子进程中完整处理的文件类型，扫描版 PDF 仍需回到主进程走 OCR
+POOL_EXTS = (".txt", ".md", ".docx", ".pdf")
+# 按文档结构切片的文件类型，不启用进程池时也不走 read_file_content + 整体切片
+STRUCTURED_EXTS = (".docx",)
+
+_POOL: ProcessPoolExecutor | None = None
+# 不从已启动多个线程的服务进程直接 fork：forkserver 的服务进程只导入本模块，子进程从它 fork；
+# 不支持 forkserver 的平台使用 spawn
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def read_pdf_text_layer(file_path: str, min_chars_per_page: int = 20) -> str:
+    """
+    @desc     : 直接读取 PDF 的文本层，扫描件（文本层为空或过少）返回空字符串
+    @param    : file_path: PDF 文件路径
+    @param    : min_chars_per_page: 平均每页的最少字符数，低于该值视为扫描件
+    @return   : 文本内容
+    """
+    with fitz.open(file_path) as pdf:
+        pages = [page.get_text() for page in pdf]
+
+    text = "".join(pages)
+    if not pages or len(text.strip()) < min_chars_per_page * len(pages):
+        return ""
+    return text
+
+
+@functools.lru_cache(maxsize=16)
+def _get_splitter(chunk_size: int, chunk_overlap: int) -> TextSplitter:
+    return TextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def parse_and_split(file_path: str, chunk_size: int, chunk_overlap: int) -> list[tuple] | None:
+    """
+    @desc     : 在子进程中执行：解析文件并切片
+    @param    : file_path: 文件路径
+    @param    : chunk_size: 文本块大小
+    @param    : chunk_overlap: 文本块重叠大小
+    @return   : (文本块, start, end) 列表，docx 为 (文本块, start, end, {"section": 章节路径})；扫描版 PDF 返回 None
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in (".txt", ".md"):
+        with open(file_path, "r", encoding="utf-8") as f:
+            content = f.read()
+    elif ext == ".docx":
+        sections = ((section_label(path), text) for path, text in iter_docx_sections(file_path))
+        return _get_splitter(chunk_size, chunk_overlap).split_sections(sections)
+    elif ext == ".pdf":
+        content = read_pdf_text_layer(file_path)
+        if not content:
+            return None
+    else:
+        raise ValueError(f"不支持的文件类型: {ext}")
+    return _get_splitter(chunk_size, chunk_overlap).split_chunks(content)
+
+
+def _init_worker():
+    """
+    @desc     : 子进程初始化：中断信号交给主进程处理，由主进程关闭进程池
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def get_parse_pool() -> ProcessPoolExecutor | None:
+    """
+    @desc     : 懒加载进程池，INGEST_PROCESS_WORKERS 为 0 时不启用
+    """
+    global _POOL
+    if settings.INGEST_PROCESS_WORKERS <= 0:
+        return None
+    if _POOL is None:
+        context = multiprocessing.get_context(START_METHOD)
+        if START_METHOD == "forkserver":
+            # 默认会在 forkserver 中导入 __main__（app.py），只预加载解析所需的模块
+            context.set_forkserver_preload([__name__])
+        _POOL = ProcessPoolExecutor(
+            max_workers=settings.INGEST_PROCESS_WORKERS, mp_context=context, initializer=_init_worker
+        )
+    return _POOL
+
+
+async def start_parse_pool():
+    """
+    @desc     : 服务启动时预先创建子进程。子进程不从服务进程 fork，不继承其线程、锁与已加载的模型，
+                只导入解析与切片所需的模块（以及 __mp_main__ 形式的主模块，服务启动代码需放在 __main__ 判断下）；
+                在启动阶段创建也避免了在入库高峰时才承担子进程的启动开销
+    """
+    pool = get_parse_pool()
+    if pool is not None:
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(pool, os.getpid) for _ in range(settings.INGEST_PROCESS_WORKERS)])
+
+
+def shutdown_parse_pool():
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL = None
+
+
+async def split_file_in_pool(file_path: str, chunk_size: int, chunk_overlap: int) -> list[tuple] | None:
+    """
+    @desc     : 在进程池中解析并切片文件，进程池未启用时 docx 在线程中按章节切片
+    @param    : file_path: 文件路径
+    @param    : chunk_size: 文本块大小
+    @param    : chunk_overlap: 文本块重叠大小
+    @return   : 同 parse_and_split；进程池未启用、文件类型不支持或为扫描版 PDF 时返回 None，由调用方走原有流程
+    """
+    global _POOL
+    pool = get_parse_pool()
+    ext = os.path.splitext(file_path)[1].lower()
+    if pool is None and ext in STRUCTURED_EXTS:
+        return await asyncio.to_thread(parse_and_split, file_path, chunk_size, chunk_overlap)
+    if pool is None or ext not in POOL_EXTS:
+        return None
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            pool, parse_and_split, file_path, chunk_size, chunk_overlap
+        )
+    except BrokenProcessPool:
+        # 子进程异常退出（如内存不足）后进程池不可再用，下次调用时重建
+        logger.error(f"解析进程池已损坏，文件: {file_path}")
+        if _POOL is pool:
+            _POOL = None
+        raise
@@ -11,16 +11,28 @@ import os
 import asyncio
 import logging
 import traceback
+import numpy as np
 from settings import settings
 from typing import List, Tuple
 from service.chroma import search_from_chroma
 from service.bm25_service import bm25_search
 from service.llm import get_llm_response
 from service.prompt import search_key_prompt
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from service.file_process import read_file_content
-from model.chroma_model import get_chroma_collection
+from service.file_process import read_file_content, read_pdf_text_layer, iter_ocr_chunks
+from service.parse_worker import split_file_in_pool
+from service.text_splitter import TextSplitter
+from model.chroma_model import chroma_client, get_chroma_collection, get_collection_model
+from service.embedding_service import EMBEDDING_BATCHER
+from service.rerank_service import rerank
+from service.answer_cache import ANSWER_CACHE
+from service.retrieval_cache import RETRIEVAL_CACHE
+from model.bm25_index import read_index_version
+from model.kb_catalog import KB_CATALOG
+from model.chunk_store import CHUNK_STORES
+from service.warmup_service import KB_ACCESS, kb_exists
+from service.metrics_service import record_keyword_fanout
 from service.bm25_service import save_to_bm25_file
+from libs.tracing import span, start_trace, traced
 
 logger = logging.getLogger(__name__)
 
@@ -42,100 +54,425 @@ async def store_to_knowledge_base(
     all_ids = []
     all_metadatas = []
 
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-    )
+    splitter = TextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
     NOT_EXIST_FILES = []
-    for filename in filenames:
-        file_path = filename
-        if not os.path.exists(file_path):
-            NOT_EXIST_FILES.append(filename)
-            continue
+    with start_trace("ingest", kb=kb_name, files=len(filenames)):
+        for filename in filenames:
+            file_path = filename
+            if not os.path.exists(file_path):
+                NOT_EXIST_FILES.append(filename)
+                continue
 
-        content = await read_file_content(file_path)
+            await asyncio.to_thread(KB_CATALOG.register_file, kb_name, file_path, reset_chunks=True)
+            with span("parse_split.process"):
+                chunks = await split_file_in_pool(file_path, chunk_size, chunk_overlap)
+            if chunks is None and file_path.lower().endswith(".pdf"):
+                # 优先使用文本层，扫描件逐页 OCR，文本块带页码
+                content = await asyncio.to_thread(read_pdf_text_layer, file_path)
+                if not content:
+                    chunks = [
+                        chunk
+                        async for batch in iter_ocr_chunks(file_path, chunk_size, chunk_overlap)
+                        for chunk in batch
+                    ]
+            elif chunks is None:
+                content = await read_file_content(file_path)
+            if chunks is None:
+                with span("split_text", chars=len(content)):
+                    chunks = await asyncio.to_thread(splitter.split_chunks, content)
+
+            all_chunks.extend(chunk[0] for chunk in chunks)
+            all_ids.extend(f"{filename}_{i}" for i in range(len(chunks)))
+            all_metadatas.extend(chunk_metadatas(filename.split("/")[-1], 0, chunks))
+
+        logger.info(f"准备存储 {len(all_chunks)} 个文本块到知识库 '{kb_name}'")
+
+        await index_chunks(collection, kb_name, all_chunks, all_ids, all_metadatas)
+
+    return NOT_EXIST_FILES if len(NOT_EXIST_FILES) > 0 else None, len(all_chunks)
 
-        chunks = await asyncio.to_thread(splitter.split_text, content)
 
-        for i, chunk in enumerate(chunks):
-            all_chunks.append(f"{chunk}")
-            all_ids.append(f"{filename}_{i}")
-            all_metadatas.append({"file_name": filename.split("/")[-1], "chunk_index": i})
+async def index_chunks(
+    collection,
+    kb_name: str,
+    chunks: list[str],
+    ids: list[str],
+    metadatas: list[dict],
+    bm25: bool = True,
+):
+    """
+    @desc     : 原文写入文本块存储，编码后向量库与 BM25 索引只按 id 引用
+    @param    : collection: Chroma Collection
+    @param    : kb_name: 知识库名称
+    @param    : chunks: 文本块列表
+    @param    : ids: 文本块 id 列表
+    @param    : metadatas: 文本块元数据列表
+    @param    : bm25: 为 False 时不写入 BM25，由调用方稍后通过 commit_bm25 一次写入
+    """
+    if not chunks:
+        return
+
+    ANSWER_CACHE.invalidate(kb_name)
+    RETRIEVAL_CACHE.invalidate(kb_name)
+    with start_trace("index_chunks", kb=kb_name, chunks=len(chunks)):
+        with span("embedding", chunks=len(chunks)):
+            embeddings, _ = await asyncio.gather(
+                EMBEDDING_BATCHER.encode(chunks, get_collection_model(collection), priority="ingest"),
+                asyncio.to_thread(traced("chunk_store.append")(CHUNK_STORES.get(kb_name).append), ids, chunks),
+            )
+        writes = [
+            asyncio.to_thread(
+                traced("collection.add")(collection.add),
+                embeddings=embeddings,
+                ids=ids,
+                metadatas=metadatas,
+            )
+        ]
+        if bm25:
+            writes.append(asyncio.to_thread(traced("bm25.add")(save_to_bm25_file), kb_name, ids, chunks))
+        await asyncio.gather(*writes)
+        await asyncio.to_thread(KB_CATALOG.record_chunks, kb_name, metadatas, get_collection_model(collection))
+
+
+async def commit_bm25(kb_name: str, ids: list[str]):
+    """
+    @desc     : 将已写入文本块存储的文本块一次加入 BM25 索引，原文从文本块存储读取。
+                流式入库按文件合并各批次的 BM25 写入，每个文件只重建一次 BM25
+    @param    : kb_name: 知识库名称
+    @param    : ids: 文本块 id 列表
+    """
+    if not ids:
+        return
 
-    logger.info(f"准备存储 {len(all_chunks)} 个文本块到知识库 '{kb_name}'")
+    ANSWER_CACHE.invalidate(kb_name)
+    RETRIEVAL_CACHE.invalidate(kb_name)
+    with span("bm25.add", chunks=len(ids)):
+        await asyncio.to_thread(save_to_bm25_file, kb_name, ids, None)
 
-    await asyncio.gather(
-        asyncio.to_thread(collection.add, documents=all_chunks, ids=all_ids, metadatas=all_metadatas),
-        asyncio.to_thread(save_to_bm25_file, kb_name, all_ids, all_chunks),
-    )
 
-    return NOT_EXIST_FILES if len(NOT_EXIST_FILES) > 0 else None, len(all_chunks)
+def chunk_metadatas(file_name: str, first_index: int, chunks: list[tuple]) -> list[dict]:
+    """
+    @desc     : 生成文本块的元数据，解析时附带的章节路径等字段一并写入
+    @param    : file_name: 文件名
+    @param    : first_index: 第一个文本块的序号
+    @param    : chunks: (文本块, start, end) 或 (文本块, start, end, 附加元数据) 列表
+    @return   : 元数据列表
+    """
+    metadatas = []
+    for i, (_, start, end, *extra) in enumerate(chunks):
+        metadata = {"file_name": file_name, "chunk_index": first_index + i, "start": start, "end": end}
+        if extra:
+            metadata.update(extra[0])
+        metadatas.append(metadata)
+    return metadatas
 
 
+@traced()
 async def recall_knowledge(
     query: str,
-    kb_name: str = settings.DEFAULT_KNOWLEDGE_BASE,
+    kb_name: str | list[str] = settings.DEFAULT_KNOWLEDGE_BASE,
     top_k: int = settings.TOP_K,
-) -> Tuple[List[str], List[int]]:
+    errors: List[str] = None,
+    metadatas: List[dict] = None,
+) -> Tuple[List[str], List[str]]:
     """
-    @desc     : 从知识库中召回相关内容
+    @desc     : 从知识库中召回相关内容，传入多个知识库时并发检索并按分数全局合并
     @param    : query: 查询内容
-    @param    : kb_name: 知识库名称
+    @param    : kb_name: 知识库名称或知识库名称列表
     @param    : top_k: 返回的最大结果数量
-    @return   : 去重后的知识列表，最多包含top_k条记录
+    @param    : errors: 关键词提取失败、检索异常或超时等不完整召回的原因追加到该列表，结果仍尽量返回
+    @param    : metadatas: 传入列表时按返回顺序追加各文本块的元数据（含 kb_name），查不到时为 {"kb_name": 知识库}
+    @return   : 去重后的知识列表，最多包含top_k条记录；多知识库时 id 形如 "{知识库}:{文本块 id}"
     """
+    errors = [] if errors is None else errors
+    kb_names = []
+    # 先校验名称与存在性，再构建 BM25 索引或文本块存储，避免为不存在的知识库创建目录与文件锁
+    for name in ([kb_name] if isinstance(kb_name, str) else list(dict.fromkeys(kb_name))):
+        if await asyncio.to_thread(kb_exists, name):
+            kb_names.append(name)
+        else:
+            errors.append(f"{name}: 知识库不存在")
+    if not kb_names:
+        return [], []
+    for name in kb_names:
+        KB_ACCESS.record(name)
 
     ans_top_k = top_k
     top_k = top_k * 2
 
     try:
-        keywords = await _extract_keywords(query)
+        keywords = await _extract_keywords(query, errors)
         if not keywords:
             logger.warning("未提取到有效关键词")
-            return []
+            return [], []
+
+        results = await asyncio.gather(*[_recall_with_timeout(keywords, name, top_k, query, errors) for name in kb_names])
+
+        if len(results) == 1:
+            # 单知识库保持检索顺序
+            knowledge_list = [k for k, _, _ in results[0]]
+            idx_list = [i for _, i, _ in results[0]]
+            knowledges, ids = _deduplicate_knowledge(knowledge_list, idx_list, ans_top_k)
+            chunks = {idx: (kb_names[0], idx) for idx in ids}
+        else:
+            # 不同知识库的文本块 id 可能相同，按 (知识库, id) 合并，返回的 id 带知识库前缀
+            candidates = [(k, (name, i), s) for name, result in zip(kb_names, results) for k, i, s in result]
+            knowledges, keys = _merge_by_score(candidates, ans_top_k)
+            ids = [f"{name}:{idx}" for name, idx in keys]
+            chunks = dict(zip(ids, keys))
+
+        if settings.RERANK_ENABLED:
+            try:
+                knowledges, ids = await rerank(query, knowledges, ids, min(settings.RERANK_TOP_N, ans_top_k))
+            except Exception as e:
+                logger.error(f"重排失败，使用原召回顺序: {str(e)}")
+                logger.error(traceback.format_exc())
+        if metadatas is not None:
+            metadatas.extend(await _fetch_metadatas([chunks[idx] for idx in ids]))
+        return knowledges, ids
 
-        knowledge_list = []
-        idx_list = []
-        initial_num = min(settings.NUMS_KNOWLEDGE if settings.NUMS_KNOWLEDGE > 0 else settings.MAX_KNOWLEDGE, top_k)
-        num_knowledges = initial_num
+    except Exception as e:
+        logger.error(f"知识召回过程异常: {str(e)}")
+        logger.error(traceback.format_exc())
+        errors.append(f"recall: {e}")
+        return [], []
 
-        for idx, keyword in enumerate(keywords):
-            if len(knowledge_list) >= top_k or num_knowledges <= 0:
+
+async def _fetch_metadatas(chunks: List[Tuple[str, str]]) -> List[dict]:
+    """
+    @desc     : 从向量库批量读取文本块元数据，每个知识库一次查询，读取失败时只返回知识库名称
+    @param    : chunks: (知识库名称, 文本块 id) 列表
+    @return   : 与 chunks 一一对应的元数据，附带 kb_name
+    """
+    by_kb: dict[str, list] = {}
+    for kb_name, idx in chunks:
+        by_kb.setdefault(kb_name, []).append(idx)
+
+    found = {}
+    for kb_name, ids in by_kb.items():
+        try:
+            collection = chroma_client.get_collection(name=kb_name)
+            result = await asyncio.to_thread(collection.get, ids=ids, include=["metadatas"])
+        except Exception as e:
+            logger.warning(f"读取知识库 '{kb_name}' 文本块元数据失败: {e}")
+            continue
+        for idx, metadata in zip(result["ids"], result["metadatas"]):
+            found[(kb_name, idx)] = metadata or {}
+
+    return [{**found.get((kb_name, idx), {}), "kb_name": kb_name} for kb_name, idx in chunks]
+
+
+async def _recall_with_timeout(
+    keywords: List[str], kb_name: str, top_k: int, query: str = None, errors: List[str] = None
+) -> List[Tuple[str, str, float]]:
+    """
+    @desc     : 带超时的单知识库召回，超时后返回已召回的部分结果，不阻塞其他知识库
+    @param    : keywords: 关键词列表
+    @param    : kb_name: 知识库名称
+    @param    : top_k: 召回数量上限
+    @param    : query: 原始问题，adaptive 策略用来计算关键词的相关度
+    @param    : errors: 检索异常与超时追加到该列表
+    @return   : (知识, id, 归一化分数) 列表
+    """
+    results = []
+    errors = [] if errors is None else errors
+    try:
+        await asyncio.wait_for(
+            _recall_from_kb(keywords, kb_name, top_k, results, query, errors), settings.KB_SEARCH_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"知识库 '{kb_name}' 检索超时({settings.KB_SEARCH_TIMEOUT}s)，使用已召回的 {len(results)} 条知识")
+        errors.append(f"{kb_name}: timeout")
+    except Exception as e:
+        logger.error(f"知识库 '{kb_name}' 检索失败: {str(e)}")
+        errors.append(f"{kb_name}: {e}")
+    return results
+
+
+async def _recall_from_kb(
+    keywords: List[str],
+    kb_name: str,
+    top_k: int,
+    results: List[Tuple[str, str, float]],
+    query: str = None,
+    errors: List[str] = None,
+):
+    """
+    @desc     : 按关键词依次在单个知识库中进行向量与 BM25 混合检索，扩展策略由 KEYWORDS_POLICY 决定
+    @param    : keywords: 关键词列表
+    @param    : kb_name: 知识库名称
+    @param    : top_k: 召回数量上限
+    @param    : results: 召回结果追加到该列表，按检索顺序排列
+    @param    : query: 原始问题，为空时使用 fixed 策略
+    @param    : errors: 单个关键词的检索异常追加到该列表
+    """
+    errors = [] if errors is None else errors
+    initial_num = min(settings.NUMS_KNOWLEDGE if settings.NUMS_KNOWLEDGE > 0 else settings.MAX_KNOWLEDGE, top_k)
+    version = await asyncio.to_thread(read_index_version, kb_name)
+
+    if settings.KEYWORDS_POLICY == "adaptive" and query:
+        try:
+            with span("embedding"):
+                model_name = get_collection_model(chroma_client.get_collection(name=kb_name))
+                vectors = await EMBEDDING_BATCHER.encode([query] + keywords, model_name)
+        except Exception as e:
+            logger.error(f"知识库 '{kb_name}' 关键词相关度计算失败，使用固定衰减策略: {str(e)}")
+        else:
+            await _adaptive_fanout(keywords, vectors, kb_name, top_k, initial_num, version, results, errors)
+            return
+    await _fixed_fanout(keywords, kb_name, top_k, initial_num, version, results, errors)
+
+
+async def _fixed_fanout(
+    keywords: List[str],
+    kb_name: str,
+    top_k: int,
+    initial_num: int,
+    version: str,
+    results: List[Tuple[str, str, float]],
+    errors: List[str],
+):
+    """
+    @desc     : 按提取顺序检索全部关键词，每个关键词的召回数量按 KEYWORDS_DELAY 几何衰减
+    """
+    num_knowledges = initial_num
+    searches = 0
+    with span("keyword_fanout", kb=kb_name, policy="fixed") as item:
+        for keyword in keywords:
+            if len(results) >= top_k or num_knowledges <= 0:
                 break
 
-            current_num = min(num_knowledges, top_k - len(knowledge_list))
+            current_num = min(num_knowledges, top_k - len(results))
 
             try:
-                k, i, d = search_from_chroma(keyword, kb_name, current_num)
+                searches += 2
+                results.extend(await _search_keyword(keyword, kb_name, current_num, version))
+                num_knowledges = max(int(num_knowledges * (1 - settings.KEYWORDS_DELAY)), 1)
 
-                logger.debug(f"关键词 '{keyword}' chro召回 {len(k)} 条知识")
-                texts, ids, ranked_scores = bm25_search(keyword, kb_name, current_num)
-                logger.debug(f"关键词 '{keyword}' bm25召回 {len(texts)} 条知识")
+            except Exception as e:
+                logger.error(f"知识库 '{kb_name}' 关键词 '{keyword}' 搜索失败: {str(e)}")
+                logger.error(traceback.format_exc())
+                errors.append(f"{kb_name}/{keyword}: {e}")
+                continue
+        item.set("searches", searches)
+    record_keyword_fanout("fixed", searches)
 
-                knowledge_list.extend(k)
-                knowledge_list.extend(texts)
-                idx_list.extend(i)
-                idx_list.extend(ids)
 
-                num_knowledges = max(int(num_knowledges * (1 - settings.KEYWORDS_DELAY)), 1)
+async def _adaptive_fanout(
+    keywords: List[str],
+    vectors: list,
+    kb_name: str,
+    top_k: int,
+    initial_num: int,
+    version: str,
+    results: List[Tuple[str, str, float]],
+    errors: List[str],
+):
+    """
+    @desc     : 按关键词与问题的余弦相似度从高到低检索，召回数量按相似度占最高相似度的比例分配；
+                从第二个关键词起，召回结果中新 id 的占比低于 KEYWORDS_MIN_NOVELTY，
+                或最高归一化分数低于 KEYWORDS_MIN_SCORE 时，不再检索剩余关键词
+    @param    : vectors: 问题与各关键词的向量，第一个为问题
+    """
+    query_vector = np.asarray(vectors[0], dtype=np.float32)
+    keyword_vectors = np.asarray(vectors[1:], dtype=np.float32)
+    norms = np.linalg.norm(keyword_vectors, axis=1) * np.linalg.norm(query_vector)
+    relevance = np.clip(keyword_vectors @ query_vector / np.maximum(norms, 1e-12), 0.0, None)
+    order = np.argsort(-relevance, kind="stable")
+    top_relevance = max(float(relevance[order[0]]), 1e-6)
+
+    seen = set()
+    searches, avoided, reason = 0, 0, None
+    with span("keyword_fanout", kb=kb_name, policy="adaptive") as item:
+        for n, i in enumerate(order):
+            if len(results) >= top_k:
+                break
+
+            num_knowledges = max(round(initial_num * float(relevance[i]) / top_relevance), 1)
+            current_num = min(num_knowledges, top_k - len(results))
 
+            try:
+                searches += 2
+                found = await _search_keyword(keywords[i], kb_name, current_num, version, vectors[i + 1])
             except Exception as e:
-                logger.error(f"关键词 '{keyword}' 搜索失败: {str(e)}")
+                logger.error(f"知识库 '{kb_name}' 关键词 '{keywords[i]}' 搜索失败: {str(e)}")
                 logger.error(traceback.format_exc())
+                errors.append(f"{kb_name}/{keywords[i]}: {e}")
                 continue
+            results.extend(found)
 
-        return _deduplicate_knowledge(knowledge_list, idx_list, ans_top_k)
+            ids = {id for _, id, _ in found}
+            novelty = len(ids - seen) / len(ids) if ids else 0.0
+            best_score = max((score for _, _, score in found), default=0.0)
+            seen |= ids
+            if n == 0 or n == len(order) - 1:
+                continue
+            if novelty < settings.KEYWORDS_MIN_NOVELTY:
+                reason = "duplicate"
+            elif best_score < settings.KEYWORDS_MIN_SCORE:
+                reason = "low_score"
+            else:
+                continue
+            avoided = 2 * (len(order) - n - 1)
+            logger.debug(f"关键词 '{keywords[i]}' 新结果占比 {novelty:.2f}、最高分 {best_score:.3f}，停止扩展")
+            break
+        item.set("searches", searches)
+        item.set("avoided", avoided)
+    record_keyword_fanout("adaptive", searches, avoided, reason)
 
-    except Exception as e:
-        logger.error(f"知识召回过程异常: {str(e)}")
-        logger.error(traceback.format_exc())
-        return []
 
+async def _search_keyword(
+    keyword: str, kb_name: str, top_k: int, version: str, query_embedding: list = None
+) -> List[Tuple[str, str, float]]:
+    """
+    @desc     : 单关键词的向量与 BM25 并发检索
+    @return   : (知识, id, 归一化分数) 列表，向量结果在前
+    """
+    (k, i, d), (texts, ids, ranked_scores) = await asyncio.gather(
+        _cached_search("chroma", keyword, kb_name, top_k, version, query_embedding),
+        _cached_search("bm25", keyword, kb_name, top_k, version),
+    )
+    logger.debug(f"关键词 '{keyword}' chro召回 {len(k)} 条知识")
+    logger.debug(f"关键词 '{keyword}' bm25召回 {len(texts)} 条知识")
+
+    found = [(doc, id, 1 / (1 + distance)) for doc, id, distance in zip(k, i, d)]
+    found.extend(
+        (doc, id, score / (score + settings.BM25_SCORE_SCALE)) for doc, id, score in zip(texts, ids, ranked_scores)
+    )
+    return found
 
-async def _extract_keywords(query: str) -> List[str]:
+
+async def _cached_search(
+    source: str, keyword: str, kb_name: str, top_k: int, version: str, query_embedding: list = None
+):
+    """
+    @desc     : 带缓存的单关键词检索
+    @param    : source: chroma / bm25
+    @param    : keyword: 关键词
+    @param    : kb_name: 知识库名称
+    @param    : top_k: 返回数量
+    @param    : version: 知识库索引版本
+    @param    : query_embedding: 关键词向量，已编码时向量检索不再重复编码
+    @return   : (文本列表, id列表, 距离或分数列表)
+    """
+    cached = RETRIEVAL_CACHE.get(kb_name, source, keyword, top_k, version)
+    if cached is not None:
+        return cached
+
+    if source == "chroma":
+        result = await search_from_chroma(keyword, kb_name, top_k, query_embedding)
+    else:
+        result = await asyncio.to_thread(bm25_search, keyword, kb_name, top_k)
+    RETRIEVAL_CACHE.put(kb_name, source, keyword, top_k, version, result)
+    return result
+
+
+@traced()
+async def _extract_keywords(query: str, errors: List[str] = None) -> List[str]:
     """
     @desc     : 从查询中提取关键词
     @param    : query: 查询内容
+    @param    : errors: 提取失败时追加原因
     @return   : 提取到的关键词列表
     """
     try:
@@ -154,6 +491,8 @@ async def _extract_keywords(query: str) -> List[str]:
     except Exception as e:
         logger.error(f"关键词提取失败: {str(e)}")
         logger.error(traceback.format_exc())
+        if errors is not None:
+            errors.append(f"keywords: {e}")
         return []
 
 
@@ -178,3 +517,22 @@ def _deduplicate_knowledge(
     dedup_ids = list(unique_knowledge.keys())[:top_k]
 
     return dedup_knowledge, dedup_ids
+
+
+def _merge_by_score(
+    candidates: List[Tuple[str, Tuple[str, str], float]],
+    top_k: int,
+) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """
+    @desc     : 合并多个知识库的召回结果，同一 (知识库, id) 取最高分后按分数取全局 top_k
+    @param    : candidates: (知识, (知识库, id), 归一化分数) 列表
+    @param    : top_k: 返回的最大数量
+    @return   : 排序后的知识列表与 (知识库, id) 列表
+    """
+    best = {}
+    for knowledge, idx, score in candidates:
+        if idx not in best or score > best[idx][1]:
+            best[idx] = (knowledge, score)
+
+    ranked = sorted(best.items(), key=lambda x: x[1][1], reverse=True)[:top_k]
+    return [knowledge for _, (knowledge, _) in ranked], [idx for idx, _ in ranked]
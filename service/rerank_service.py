@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   rerank_service.py
+@Time    :   2026/10/19 15:36:40
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   召回结果重排，按批打分并受耗时上限约束。打分在专用的小线程池中执行，
+             超时的打分无法中断，会继续占用线程；线程都被占用时在耗时上限内排队等待，
+             到期仍无空闲线程才跳过重排，避免堆积拖慢其他请求
+"""
+import asyncio
+import logging
+from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
+from settings import settings
+from model.rerank_model import get_rerank_model
+from service.metrics_service import RERANK_SKIPPED
+
+logger = logging.getLogger(__name__)
+
+RERANK_EXECUTOR = ThreadPoolExecutor(max_workers=settings.RERANK_WORKERS, thread_name_prefix="rerank")
+# 空闲重排线程的名额，打分结束（包括等待方已超时放弃的）才归还；按事件循环创建
+_slots: asyncio.Semaphore | None = None
+_slots_loop = None
+
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots, _slots_loop
+    loop = asyncio.get_running_loop()
+    if _slots_loop is not loop:
+        # 事件循环变化（如多次 asyncio.run）时旧的信号量已失效，重新创建
+        _slots_loop = loop
+        _slots = asyncio.Semaphore(settings.RERANK_WORKERS)
+    return _slots
+
+
+def _release(loop: asyncio.AbstractEventLoop, slots: asyncio.Semaphore):
+    try:
+        loop.call_soon_threadsafe(slots.release)
+    except RuntimeError:
+        # 事件循环已关闭，名额随之失效
+        pass
+
+
+async def _submit_predict(model, pairs: list, timeout: float) -> asyncio.Future | None:
+    """
+    @desc     : 等待空闲的重排线程并提交一批打分
+    @param    : timeout: 最长等待时间(秒)
+    @return   : 打分结果的 Future，timeout 内没有空闲线程时返回 None
+    """
+    slots = _get_slots()
+    try:
+        await asyncio.wait_for(slots.acquire(), timeout)
+    except asyncio.TimeoutError:
+        return None
+    loop = asyncio.get_running_loop()
+    try:
+        future = RERANK_EXECUTOR.submit(model.predict, pairs)
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: _release(loop, slots))
+    return asyncio.wrap_future(future)
+
+
+async def rerank(
+    query: str,
+    knowledges: List[str],
+    ids: List[str],
+    top_n: int = settings.RERANK_TOP_N,
+) -> Tuple[List[str], List[str]]:
+    """
+    @desc     : 用 cross-encoder 对 (问题, 知识) 打分并保留得分最高的 top_n 条
+                重排线程繁忙时在 RERANK_TIMEOUT_MS 内等待空闲线程，超过耗时上限时停止打分，
+                未打分的知识按原召回顺序排在已打分知识之后
+    @param    : query: 用户问题
+    @param    : knowledges: 召回的知识列表
+    @param    : ids: 知识对应的 id 列表
+    @param    : top_n: 保留的知识数量
+    @return   : 重排后的知识列表与 id 列表
+    """
+    if len(knowledges) <= 1:
+        return knowledges[:top_n], ids[:top_n]
+
+    # 模型加载不计入耗时上限
+    model = await asyncio.to_thread(get_rerank_model)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.RERANK_TIMEOUT_MS / 1000
+    scores = [None] * len(knowledges)
+    batch_size = settings.RERANK_BATCH_SIZE
+    skipped = "timeout"
+
+    for start in range(0, len(knowledges), batch_size):
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        pairs = [(query, k) for k in knowledges[start : start + batch_size]]
+        predict = await _submit_predict(model, pairs, remaining)
+        if predict is None:
+            skipped = "busy"
+            break
+        try:
+            batch_scores = await asyncio.wait_for(predict, deadline - loop.time())
+        except asyncio.TimeoutError:
+            skipped = "timeout"
+            break
+        scores[start : start + len(pairs)] = [float(s) for s in batch_scores]
+
+    scored = sorted((i for i, s in enumerate(scores) if s is not None), key=lambda i: scores[i], reverse=True)
+    unscored = [i for i, s in enumerate(scores) if s is None]
+    if unscored:
+        RERANK_SKIPPED.inc(reason=skipped)
+        if skipped == "busy":
+            logger.warning(f"等待重排线程超时({settings.RERANK_TIMEOUT_MS}ms)，{len(unscored)} 条知识未参与打分")
+        else:
+            logger.warning(f"重排超时({settings.RERANK_TIMEOUT_MS}ms)，{len(unscored)} 条知识未参与打分")
+
+    order = (scored + unscored)[:top_n]
+    return [knowledges[i] for i in order], [ids[i] for i in order]
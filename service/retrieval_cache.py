@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   retrieval_cache.py
+@Time    :   2026/10/19 17:20:44
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   单个关键词检索结果缓存，较小的 n 可直接由已缓存的较大 n 的结果截取
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievalCache:
+    """
+    @name     : RetrievalCache
+    @desc     : 缓存 (知识库, 检索方式, 关键词) → 前 n 条候选，条目记录写入时的知识库索引版本，
+                版本变化（入库、删除）后自动失效
+    """
+
+    def __init__(self, max_entries: int = settings.RETRIEVAL_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.cache: OrderedDict[tuple, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kb_name: str, source: str, keyword: str, n: int, version: str) -> tuple | None:
+        """
+        @desc     : 查询缓存
+        @param    : kb_name: 知识库名称
+        @param    : source: 检索方式，chroma / bm25
+        @param    : keyword: 关键词
+        @param    : n: 需要的结果数量
+        @param    : version: 知识库当前的索引版本
+        @return   : (文本列表, id列表, 分数列表)，未命中时为 None
+        """
+        key = (kb_name, source, keyword)
+        with self._lock:
+            entry = self.cache.get(key)
+            # 已缓存的结果数少于当时请求的数量，说明已取尽全部候选，对更大的 n 同样有效
+            if entry and entry["version"] == version and (entry["n"] >= n or len(entry["ids"]) < entry["n"]):
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return entry["texts"][:n], entry["ids"][:n], entry["scores"][:n]
+            self.misses += 1
+            return None
+
+    def put(self, kb_name: str, source: str, keyword: str, n: int, version: str, result: tuple):
+        if self.max_entries <= 0:
+            return
+        key = (kb_name, source, keyword)
+        texts, ids, scores = result
+        with self._lock:
+            entry = self.cache.get(key)
+            if entry and entry["version"] == version and entry["n"] >= n:
+                return
+            self.cache[key] = {"version": version, "n": n, "texts": texts, "ids": ids, "scores": scores}
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+
+    def invalidate(self, kb_name: str):
+        """
+        @desc     : 清除该知识库的全部缓存
+        @param    : kb_name: 知识库名称
+        """
+        with self._lock:
+            for key in [key for key in self.cache if key[0] == kb_name]:
+                del self.cache[key]
+
+
+# 全局唯一实例
+RETRIEVAL_CACHE = RetrievalCache()
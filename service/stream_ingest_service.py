@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   stream_ingest_service.py
+@Time    :   2026/10/19 14:40:26
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   上传与入库合并为一次流式处理：文本文件边接收边切片、编码、入库，
+             docx/pdf 在单个文件接收完成后立即解析，无需等待整个请求结束；
+             向量按批写入，BM25 按文件在入库完成后一次写入
+"""
+import os
+import json
+import time
+import codecs
+import asyncio
+import logging
+import traceback
+from contextlib import aclosing
+from fastapi import Request
+
+from model.chroma_model import get_chroma_collection
+from service.file_process import read_file_content, iter_ocr_chunks, read_pdf_text_layer
+from service.chroma import delete_by_file_chroma
+from service.bm25_service import delete_by_file_bm25, bump_bm25_version
+from service.answer_cache import ANSWER_CACHE
+from service.retrieval_cache import RETRIEVAL_CACHE
+from model.chunk_store import CHUNK_STORES
+from service.rag_service import index_chunks, commit_bm25, chunk_metadatas
+from service.parse_worker import split_file_in_pool
+from service.text_splitter import IncrementalSplitter
+from service.upload_service import InvalidUploadName, UploadSizeExceeded, UploadWriter, discard_files, stream_upload
+from model.kb_catalog import KB_CATALOG
+from libs.tracing import Trace, span
+
+logger = logging.getLogger(__name__)
+
+STREAMING_EXTS = {".txt", ".md"}
+BUFFERED_EXTS = {".docx", ".pdf"}
+
+
+class FileIngest:
+    """
+    @name     : FileIngest
+    @desc     : 单个文件的入库任务，文本块按顺序逐批写入，保证 chunk_index 连续
+    """
+
+    def __init__(self, ingestor: "StreamIngestor", writer: UploadWriter):
+        self.ingestor = ingestor
+        self.file_path = writer.file_path
+        self.file_name = os.path.basename(writer.file_path)
+        self.ext = os.path.splitext(writer.filename)[1].lower()
+        self.num_chunks = 0
+        # 已写入向量库、待文件入库完成后一次加入 BM25 的文本块 id
+        self.bm25_ids: list[str] = []
+        self.failed = False
+        self.missing_pages: list[int] = []
+        self.start_time = time.perf_counter()
+        # 切片发生在上传请求的任务中，入库在独立任务中，两边共用同一个 Trace
+        self.trace = Trace("ingest", kb=ingestor.kb_name, file=self.file_name)
+
+        self.splitter = IncrementalSplitter(ingestor.chunk_size, ingestor.chunk_overlap)
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._consume())
+
+    async def feed(self, data: bytes):
+        if self.ext in STREAMING_EXTS:
+            with self.trace.activate(), span("split_text"):
+                chunks = await asyncio.to_thread(self.splitter.feed, self.decoder.decode(data))
+            if chunks:
+                self.queue.put_nowait(chunks)
+
+    async def finish(self):
+        if self.ext in STREAMING_EXTS:
+            text = self.decoder.decode(b"", final=True)
+            self.splitter.buffer += text
+            with self.trace.activate(), span("split_text"):
+                self.queue.put_nowait(await asyncio.to_thread(self.splitter.finish))
+        else:
+            # 解析放到入库任务中执行，解析失败只影响当前文件，不中断上传
+            self.queue.put_nowait(self._parse)
+        self.queue.put_nowait(None)
+
+    async def _parse(self):
+        """
+        @desc     : 解析完整的 docx/pdf 文件并切片，docx 按章节切片，PDF 优先使用文本层；
+                    扫描件逐页 OCR，前面的页识别完成即切片入库，与后续页的识别并行；
+                    启用进程池时解析与切片在子进程中执行
+        @return   : 生成文本块批次
+        """
+        with span("parse_split.process"):
+            chunks = await split_file_in_pool(
+                self.file_path, self.ingestor.chunk_size, self.ingestor.chunk_overlap
+            )
+        if chunks is not None:
+            yield chunks
+            return
+
+        if self.ext == ".pdf":
+            content = await asyncio.to_thread(read_pdf_text_layer, self.file_path)
+            if not content:
+                batches = iter_ocr_chunks(
+                    self.file_path, self.ingestor.chunk_size, self.ingestor.chunk_overlap, self.missing_pages
+                )
+                async with aclosing(batches):
+                    async for chunks in batches:
+                        yield chunks
+                return
+        else:
+            content = await read_file_content(self.file_path)
+        with span("split_text", chars=len(content)):
+            chunks = await asyncio.to_thread(self.splitter.splitter.split_chunks, content)
+        yield chunks
+
+    async def rollback(self):
+        """
+        @desc     : 删除该文件已写入向量库与 BM25 的文本块，并与 index_chunks 一样推进索引版本号、清空缓存
+        """
+        kb_name = self.ingestor.kb_name
+        await delete_by_file_chroma([self.file_name], kb_name)
+        await delete_by_file_bm25([self.file_name], kb_name)
+        await asyncio.to_thread(CHUNK_STORES.get(kb_name).delete_files, [self.file_name])
+        # 已写入向量库的文本块可能已被检索并缓存，BM25 未提交时删除不会改变版本号，需单独推进
+        await asyncio.to_thread(bump_bm25_version, kb_name)
+        ANSWER_CACHE.invalidate(kb_name)
+        RETRIEVAL_CACHE.invalidate(kb_name)
+        self.num_chunks = 0
+        self.bm25_ids = []
+
+    async def _consume(self):
+        with self.trace.activate():
+            try:
+                await self._consume_queue()
+            finally:
+                self.trace.root.set("chunks", self.num_chunks)
+                self.trace.finish()
+
+    async def _consume_queue(self):
+        await asyncio.to_thread(KB_CATALOG.reset_chunks, self.ingestor.kb_name, self.file_name)
+        while True:
+            chunks = await self.queue.get()
+            if chunks is None:
+                break
+            if self.failed:
+                continue
+
+            try:
+                if callable(chunks):
+                    async with aclosing(chunks()) as batches:
+                        async for batch in batches:
+                            await self._index(batch)
+                else:
+                    await self._index(chunks)
+            except Exception as e:
+                self.failed = True
+                logger.error(f"文件 {self.file_name} 入库失败: {e}")
+                logger.error(traceback.format_exc())
+                self.ingestor.emit("error", {"file": self.file_name, "error": str(e)})
+                continue
+
+        if self.failed:
+            await self.rollback()
+        else:
+            await commit_bm25(self.ingestor.kb_name, self.bm25_ids)
+            done = {
+                "file": self.file_name,
+                "chunks_count": self.num_chunks,
+                "seconds": round(time.perf_counter() - self.start_time, 3),
+            }
+            if self.missing_pages:
+                done["missing_pages"] = self.missing_pages
+            self.ingestor.emit("file_done", done)
+
+    async def _index(self, chunks: list[tuple]):
+        """
+        @desc     : 写入一批文本块，序号接续已写入的文本块
+        """
+        if not chunks:
+            return
+        ids = [f"{self.file_path}_{self.num_chunks + i}" for i in range(len(chunks))]
+        metadatas = chunk_metadatas(self.file_name, self.num_chunks, chunks)
+        texts = [chunk[0] for chunk in chunks]
+        await index_chunks(self.ingestor.collection, self.ingestor.kb_name, texts, ids, metadatas, bm25=False)
+        self.bm25_ids.extend(ids)
+        self.num_chunks += len(chunks)
+        self.ingestor.emit("chunks", {"file": self.file_name, "chunks_count": self.num_chunks})
+
+
+class StreamIngestor:
+    """
+    @name     : StreamIngestor
+    @desc     : 作为 stream_upload 的回调，在文件写盘的同时完成切片与入库，并产生 SSE 进度事件。
+                start 在独立任务中接收上传，上传失败（超过大小限制、请求中断等）以 error 事件返回
+    """
+
+    def __init__(self, kb_name: str, chunk_size: int = 500, chunk_overlap: int = 50):
+        self.kb_name = kb_name
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.collection = get_chroma_collection(kb_name)
+        self.files: list[FileIngest] = []
+        self.events: asyncio.Queue = asyncio.Queue()
+        self.upload_task: asyncio.Task | None = None
+
+    def emit(self, event: str, data: dict):
+        self.events.put_nowait({"event": event, "data": json.dumps(data, ensure_ascii=False)})
+
+    async def on_event(self, event: str, writer: UploadWriter, data):
+        if event == "file":
+            ext = os.path.splitext(writer.filename)[1].lower()
+            if ext not in STREAMING_EXTS | BUFFERED_EXTS:
+                self.emit("unsupported", {"file": writer.filename})
+                return
+            self.files.append(FileIngest(self, writer))
+            self.emit("file", {"file": os.path.basename(writer.file_path)})
+            return
+
+        current = self.files[-1] if self.files and self.files[-1].file_path == writer.file_path else None
+        if current is None:
+            return
+
+        if event == "data":
+            await current.feed(data)
+        elif data:
+            # 与已有文件内容相同：停止入库，并回滚已写入的文本块
+            self.files.remove(current)
+            current.failed = True
+            current.queue.put_nowait(None)
+            await current.task
+            self.emit("duplicate", {"file": writer.filename, "existing": data})
+        else:
+            await current.finish()
+
+    def start(self, request: Request) -> asyncio.Task:
+        """
+        @desc     : 在后台任务中接收上传并入库，调用后即可开始输出进度事件
+        @param    : request: 原始请求
+        @return   : 上传任务
+        """
+        self.upload_task = asyncio.create_task(self._upload(request))
+        return self.upload_task
+
+    async def _upload(self, request: Request):
+        try:
+            await stream_upload(request, self.kb_name, on_event=self.on_event)
+        except UploadSizeExceeded as e:
+            logger.warning(f"上传文件超过大小限制: {e.filename}, 限制 {e.limit} 字节")
+            self.emit("error", {"file": e.filename, "error": e.msg, "limit": e.limit})
+            await self.abort()
+        except InvalidUploadName as e:
+            logger.warning(f"拒绝上传: {e.msg}: {e.filename!r}")
+            self.emit("error", {"file": e.filename, "error": e.msg})
+            await self.abort()
+        except Exception as e:
+            logger.error(f"上传并入库失败: {str(e)}")
+            logger.error(traceback.format_exc())
+            self.emit("error", {"error": f"上传失败: {e}"})
+            await self.abort()
+        except BaseException:
+            await self.abort()
+            raise
+
+    async def abort(self):
+        """
+        @desc     : 上传失败时取消所有入库任务，回滚已写入的文本块并删除文件登记
+        """
+        for item in self.files:
+            item.failed = True
+            item.task.cancel()
+        await asyncio.gather(*[item.task for item in self.files], return_exceptions=True)
+        for item in self.files:
+            await item.rollback()
+        # 入库任务记录文本块数量时会重新插入登记，取消任务后再清理一次
+        await asyncio.to_thread(discard_files, self.kb_name, [item.file_path for item in self.files])
+
+    async def _drain(self, done: asyncio.Future):
+        """
+        @desc     : 输出进度事件，直到 done 完成且事件队列为空
+        """
+        while not done.done() or not self.events.empty():
+            get_event = asyncio.ensure_future(self.events.get())
+            await asyncio.wait({get_event, done}, return_when=asyncio.FIRST_COMPLETED)
+            if get_event.done():
+                yield get_event.result()
+            else:
+                get_event.cancel()
+
+    async def stream_events(self):
+        """
+        @desc     : 输出进度事件，上传结束且所有文件入库完成后以 finish 事件结束；
+                    客户端提前断开时取消仍在进行的上传
+        """
+        try:
+            if self.upload_task:
+                async for event in self._drain(self.upload_task):
+                    yield event
+            done = asyncio.ensure_future(
+                asyncio.gather(*[item.task for item in self.files], return_exceptions=True)
+            )
+            async for event in self._drain(done):
+                yield event
+        finally:
+            if self.upload_task and not self.upload_task.done():
+                self.upload_task.cancel()
+
+        yield {
+            "event": "finish",
+            "data": json.dumps(
+                {
+                    "chunks_count": sum(item.num_chunks for item in self.files),
+                    "failed_files": [item.file_name for item in self.files if item.failed],
+                },
+                ensure_ascii=False,
+            ),
+        }
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   text_splitter.py
+@Time    :   2026/10/20 09:12:40
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   递归字符切片：与 RecursiveCharacterTextSplitter 相同的 chunk_size / chunk_overlap 语义，
+             按段落、换行、中英文句末标点、分句标点、空格逐级切分，只记录偏移量，最后才切出字符串
+"""
+from typing import Iterable
+
+from settings import settings
+
+# 按优先级排列，标点保留在前一句的末尾
+DEFAULT_SEPARATORS = (
+    "\n\n",
+    "\n",
+    "。", "！", "？", "!", "?",
+    "；", ";",
+    "，", "、", ",",
+    " ",
+    "",
+)
+
+
+class TextSplitter:
+    """
+    @name     : TextSplitter
+    @desc     : 先用第一个出现在文本中的分隔符切开，未超过 chunk_size 的片段依次合并为文本块，
+                相邻文本块最多重叠 chunk_overlap 个字符；超长片段用下一级分隔符继续切分，
+                最后一级 "" 按 chunk_size 硬切。片段首尾相接，合并后的文本块是原文中连续的一段
+    """
+
+    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50, separators: tuple[str, ...] = DEFAULT_SEPARATORS):
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap({chunk_overlap}) 必须小于 chunk_size({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = separators
+
+    def split_spans(self, text: str) -> list[tuple[int, int]]:
+        """
+        @desc     : 切片并返回每个文本块在原文中的 [start, end) 偏移，已去除首尾空白，不含空白文本块
+        @param    : text: 原文
+        @return   : 偏移列表
+        """
+        spans = []
+        for start, end in self._split(text, 0, len(text), 0):
+            while start < end and text[start].isspace():
+                start += 1
+            while end > start and text[end - 1].isspace():
+                end -= 1
+            # 片段末尾带着分隔符，去掉空白后可能完全落在上一个文本块内
+            if start < end and (not spans or end > spans[-1][1]):
+                spans.append((start, end))
+        return spans
+
+    def split_chunks(self, text: str) -> list[tuple[str, int, int]]:
+        """
+        @desc     : 切片并返回 (文本块, start, end)
+        """
+        return [(text[start:end], start, end) for start, end in self.split_spans(text)]
+
+    def split_sections(self, sections: Iterable[tuple[str, str]]) -> list[tuple[str, int, int, dict]]:
+        """
+        @desc     : 逐章节切片，文本块不跨越章节边界
+        @param    : sections: (章节路径, 章节文本)，按文档顺序排列
+        @return   : (文本块, start, end, {"section": 章节路径})，偏移相对于各章节以换行连接后的全文
+        """
+        chunks, offset = [], 0
+        for section, text in sections:
+            chunks.extend(
+                (text[start:end], offset + start, offset + end, {"section": section})
+                for start, end in self.split_spans(text)
+            )
+            offset += len(text) + 1
+        return chunks
+
+    def split_text(self, text: str) -> list[str]:
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    def _split(self, text: str, start: int, end: int, level: int) -> list[tuple[int, int]]:
+        separator = ""
+        for level in range(level, len(self.separators)):
+            separator = self.separators[level]
+            if not separator or text.find(separator, start, end) != -1:
+                break
+        if not separator:
+            return self._hard_split(start, end)
+
+        chunks, pieces = [], []
+        pos = start
+        while pos < end:
+            found = text.find(separator, pos, end)
+            piece_end = end if found == -1 else found + len(separator)
+            if piece_end - pos <= self.chunk_size:
+                pieces.append((pos, piece_end))
+            else:
+                # 超长片段之前的片段先合并，保证文本块顺序
+                chunks.extend(self._merge(pieces))
+                pieces = []
+                chunks.extend(self._split(text, pos, piece_end, level + 1))
+            pos = piece_end
+        chunks.extend(self._merge(pieces))
+        return chunks
+
+    def _merge(self, pieces: list[tuple[int, int]]) -> list[tuple[int, int]]:
+        """
+        @desc     : 依次合并相邻片段，超过 chunk_size 时输出当前文本块，并从头部丢弃片段直到剩余长度不超过 chunk_overlap
+        """
+        chunks = []
+        first = 0
+        total = 0
+        for i, (start, end) in enumerate(pieces):
+            length = end - start
+            if total + length > self.chunk_size and i > first:
+                chunks.append((pieces[first][0], pieces[i - 1][1]))
+                while total > self.chunk_overlap or (total + length > self.chunk_size and total > 0):
+                    total -= pieces[first][1] - pieces[first][0]
+                    first += 1
+            total += length
+        if first < len(pieces):
+            chunks.append((pieces[first][0], pieces[-1][1]))
+        return chunks
+
+    def _hard_split(self, start: int, end: int) -> list[tuple[int, int]]:
+        step = self.chunk_size - self.chunk_overlap
+        spans = []
+        for pos in range(start, end, step):
+            spans.append((pos, min(pos + self.chunk_size, end)))
+            if pos + self.chunk_size >= end:
+                break
+        return spans
+
+
+class IncrementalSplitter:
+    """
+    @name     : IncrementalSplitter
+    @desc     : 增量切片，缓冲区足够长时切出前面已确定的文本块，最后一块留待与后续文本一起切分；
+                offset 为缓冲区在整个文件文本中的起点，输出的偏移均相对于整个文件
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int):
+        self.splitter = TextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.flush_size = chunk_size * settings.INGEST_STREAM_BATCH
+        self.buffer = ""
+        self.offset = 0
+
+    def feed(self, text: str) -> list[tuple[str, int, int]]:
+        self.buffer += text
+        if len(self.buffer) < self.flush_size:
+            return []
+
+        spans = self.splitter.split_spans(self.buffer)
+        if len(spans) <= 1:
+            return []
+        chunks = self._chunks(spans[:-1])
+        tail_start = spans[-1][0]
+        self.buffer = self.buffer[tail_start:]
+        self.offset += tail_start
+        return chunks
+
+    def finish(self) -> list[tuple[str, int, int]]:
+        chunks = self._chunks(self.splitter.split_spans(self.buffer))
+        self.offset += len(self.buffer)
+        self.buffer = ""
+        return chunks
+
+    def _chunks(self, spans: list[tuple[int, int]]) -> list[tuple[str, int, int]]:
+        return [(self.buffer[start:end], self.offset + start, self.offset + end) for start, end in spans]
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   upload_service.py
+@Time    :   2026/10/19 13:32:18
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   流式保存上传文件：分块落盘、限制大小、边写边计算哈希，文件名与知识库名称不允许跳出上传目录
+"""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from fastapi import Request
+
+from settings import settings
+from libs.multipart_stream import MultipartStreamReader
+from model.kb_catalog import KB_CATALOG
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = settings.UPLOAD_DIR
+
+
+class UploadSizeExceeded(ValueError):
+    """上传大小超过限制"""
+
+    def __init__(self, msg: str, filename: str, limit: int):
+        super().__init__(msg)
+        self.msg = msg
+        self.filename = filename
+        self.limit = limit
+
+
+class InvalidUploadName(ValueError):
+    """文件名或知识库名称不合法"""
+
+    def __init__(self, msg: str, filename: str):
+        super().__init__(msg)
+        self.msg = msg
+        self.filename = filename
+
+
+def check_name(name: str, msg: str) -> str:
+    """
+    @desc     : 校验单级文件名或知识库名称：不能为空，不能包含路径分隔符（含反斜杠），
+                不能以 "." 开头（同时排除了 "." 与 ".." 以及隐藏文件）
+    @param    : name: 待校验的名称
+    @param    : msg: 不合法时的错误信息
+    @return   : 原名称
+    """
+    if not name or name.startswith(".") or any(c in name for c in ("/", "\\", "\0")):
+        raise InvalidUploadName(msg, name or "")
+    return name
+
+
+def resolve_under(base: str, name: str, msg: str) -> str:
+    """
+    @desc     : 拼接路径并确认解析后（含符号链接）仍位于 base 目录下
+    @param    : base: 父目录
+    @param    : name: 已通过 check_name 的单级名称
+    @param    : msg: 越界时的错误信息
+    @return   : 拼接后的路径
+    """
+    path = os.path.join(base, name)
+    if os.path.dirname(os.path.realpath(path)) != os.path.realpath(base):
+        raise InvalidUploadName(msg, name)
+    return path
+
+
+class UploadWriter:
+    """
+    @name     : UploadWriter
+    @desc     : 单个上传文件的写入器，数据攒够 UPLOAD_BUFFER_SIZE 后连同哈希计算一起放到线程池执行
+    """
+
+    def __init__(self, kb_path: str, filename: str):
+        self.filename = check_name(filename, "文件名不合法")
+        self.file_path = resolve_under(kb_path, str(int(time.time() * 100)) + "-" + self.filename, "文件名不合法")
+        self.tmp_path = self.file_path + ".part"
+        self.size = 0
+        self.hasher = hashlib.sha256()
+        self._buffer = bytearray()
+        self._fh = None
+
+    async def open(self):
+        self._fh = await asyncio.to_thread(open, self.tmp_path, "wb")
+
+    def _write(self, data: bytes):
+        # hashlib 与文件写入在大块数据上都会释放 GIL
+        self.hasher.update(data)
+        self._fh.write(data)
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        self._buffer += data
+        if len(self._buffer) >= settings.UPLOAD_BUFFER_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        if self._buffer:
+            data, self._buffer = bytes(self._buffer), bytearray()
+            await asyncio.to_thread(self._write, data)
+
+    async def close(self) -> str:
+        """
+        @desc     : 写完剩余数据并落为正式文件
+        @return   : 文件内容的 sha256
+        """
+        await self.flush()
+        await asyncio.to_thread(self._fh.close)
+        await asyncio.to_thread(os.replace, self.tmp_path, self.file_path)
+        return self.hasher.hexdigest()
+
+    async def abort(self):
+        if self._fh and not self._fh.closed:
+            await asyncio.to_thread(self._fh.close)
+        for path in (self.tmp_path, self.file_path):
+            if os.path.exists(path):
+                await asyncio.to_thread(os.remove, path)
+
+
+def register_file_hash(kb_name: str, sha256: str, file_path: str, size: int = None) -> str | None:
+    """
+    @desc     : 在知识库目录中登记文件，若知识库中已存在相同内容的文件则返回其路径
+    @param    : kb_name: 知识库名称
+    @param    : sha256: 文件哈希
+    @param    : file_path: 新文件路径
+    @param    : size: 文件大小
+    @return   : 已存在的同内容文件路径，不存在时为 None
+    """
+    return KB_CATALOG.register_file(kb_name, file_path, sha256, size)
+
+
+def discard_files(kb_name: str, file_paths: list[str]):
+    """
+    @desc     : 删除上传失败的文件及其在知识库目录中的登记，入库中途写入的文本块数量一并清除
+    @param    : kb_name: 知识库名称
+    @param    : file_paths: 文件路径列表
+    """
+    for file_path in file_paths:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    if file_paths:
+        KB_CATALOG.delete_files(kb_name, file_paths)
+
+
+async def stream_upload(request: Request, kb_name: str, on_event=None) -> tuple[list[dict], list[dict]]:
+    """
+    @desc     : 边接收边落盘保存请求中的所有文件
+    @param    : request: 原始请求
+    @param    : kb_name: 知识库名称
+    @param    : on_event: 可选的异步回调 on_event(事件名, writer, 数据)，用于在写盘的同时消费数据，
+                事件依次为 file / data / end，end 的数据为重复文件的已有路径（不重复时为 None）
+    @return   : (已保存文件列表, 重复文件列表)
+    """
+    kb_path = resolve_under(UPLOAD_DIR, check_name(kb_name, "知识库名称不合法"), "知识库名称不合法")
+    if not os.path.isdir(kb_path):
+        raise FileNotFoundError(f"知识库 {kb_name} 不存在")
+
+    content_length = int(request.headers.get("content-length") or 0)
+    if content_length > settings.UPLOAD_MAX_REQUEST_SIZE:
+        raise UploadSizeExceeded("请求体超过大小限制", "", settings.UPLOAD_MAX_REQUEST_SIZE)
+
+    saved, duplicates = [], []
+    writer = None
+    total_size = 0
+    try:
+        async for event in MultipartStreamReader(request):
+            if event[0] == "file":
+                writer = UploadWriter(kb_path, event[2])
+                await writer.open()
+                if on_event:
+                    await on_event("file", writer, None)
+
+            elif event[0] == "data" and writer:
+                total_size += len(event[1])
+                await writer.write(event[1])
+                if writer.size > settings.UPLOAD_MAX_FILE_SIZE:
+                    raise UploadSizeExceeded("文件超过大小限制", writer.filename, settings.UPLOAD_MAX_FILE_SIZE)
+                if total_size > settings.UPLOAD_MAX_REQUEST_SIZE:
+                    raise UploadSizeExceeded("请求体超过大小限制", writer.filename, settings.UPLOAD_MAX_REQUEST_SIZE)
+                if on_event:
+                    await on_event("data", writer, event[1])
+
+            elif event[0] == "end" and writer:
+                sha256 = await writer.close()
+                existing = await asyncio.to_thread(register_file_hash, kb_name, sha256, writer.file_path, writer.size)
+                if existing:
+                    await writer.abort()
+                    duplicates.append({"filename": writer.filename, "existing": existing, "sha256": sha256})
+                    logger.info(f"文件 {writer.filename} 与 {existing} 内容相同，跳过保存")
+                else:
+                    saved.append({"file_path": writer.file_path, "sha256": sha256, "size": writer.size})
+                if on_event:
+                    await on_event("end", writer, existing)
+                writer = None
+
+    except BaseException:
+        # 失败时清理本次请求已写入的所有文件及其登记，避免留下半截文件
+        if writer:
+            await writer.abort()
+        discard_files(kb_name, [item["file_path"] for item in saved])
+        raise
+
+    return saved, duplicates
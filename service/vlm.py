@@ -9,6 +9,7 @@
 """
 import os
 import json
+import asyncio
 import base64
 import aiohttp
 import logging
@@ -17,9 +18,21 @@ import traceback
 logger = logging.getLogger(__name__)
 
 from settings import settings
+from service.metrics_service import track_model_request
 
 api_key = os.getenv("CHATGLM_API_KEY", settings.CHATGLM_API_KEY)
 
+# 全局的图片识别并发上限，多个入库请求各自的 OCR 并发叠加后也不会超过该值
+_vlm_semaphores: dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+
+
+def get_vlm_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in _vlm_semaphores:
+        _vlm_semaphores.clear()
+        _vlm_semaphores[loop] = asyncio.Semaphore(settings.VLM_MAX_CONCURRENT)
+    return _vlm_semaphores[loop]
+
 
 def image_to_base64(image_path: str) -> str:
     """
@@ -67,21 +80,23 @@ async def get_image_text(
         }
         # print(payload)
         # logger.info(f"base_url = {settings.LLM_BASE_URL + '/chat/completions'}")
-        async with aiohttp.ClientSession(trust_env=True, timeout=aiohttp.ClientTimeout(total=120)) as session:
-            async with session.post(
-                settings.VLM_BASE_URL + '/chat/completions',
-                headers=headers,
-                data=json.dumps(payload),
-            ) as resp:
-                if resp.status != 200:
-                    text = await resp.text()
-                    logger.error(f"请求失败: {resp.status}, {text}")
-                    raise ValueError(f"请求失败: {resp.status}, {text}")
+        async with get_vlm_semaphore():
+            with track_model_request("vlm"):
+                async with aiohttp.ClientSession(trust_env=True, timeout=aiohttp.ClientTimeout(total=120)) as session:
+                    async with session.post(
+                        settings.VLM_BASE_URL + '/chat/completions',
+                        headers=headers,
+                        data=json.dumps(payload),
+                    ) as resp:
+                        if resp.status != 200:
+                            text = await resp.text()
+                            logger.error(f"请求失败: {resp.status}, {text}")
+                            raise ValueError(f"请求失败: {resp.status}, {text}")
 
-                response = await resp.json()
-                content = response.get("choices", [{}])[0].get("message", {}).get("content", "")
-                content = content.split("<|begin_of_box|>")[-1].split("<|end_of_box|>")[0]
-                return content if content else ""
+                        response = await resp.json()
+                        content = response.get("choices", [{}])[0].get("message", {}).get("content", "")
+                        content = content.split("<|begin_of_box|>")[-1].split("<|end_of_box|>")[0]
+                        return content if content else ""
     except Exception as e:
         logger.error(f"调用模型出错: {repr(e)}")  # 显示异常类名和信息
         logger.error(traceback.format_exc())  # 打印完整堆栈
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   warmup_service.py
+@Time    :   2026/10/20 11:02:17
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   知识库索引预热：按访问频率保持热点知识库的 BM25 索引、向量索引、文本块偏移表与嵌入模型常驻，
+             会话开始时可提前预热，避免首个问答请求承担冷加载
+"""
+import math
+import time
+import asyncio
+import logging
+import threading
+
+from settings import settings
+from model.bm25_index import BM25_REGISTRY
+from model.chunk_store import CHUNK_STORES
+from model.chroma_model import chroma_client, get_collection_model
+from model.embedding_model import EMBEDDING_REGISTRY
+from model.kb_catalog import KB_CATALOG
+from service.upload_service import InvalidUploadName, check_name
+from libs.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+
+class KBAccessTracker:
+    """
+    @name     : KBAccessTracker
+    @desc     : 按指数衰减统计知识库的访问频率，半衰期为 KB_ACCESS_HALF_LIFE 秒；pinned 中的知识库始终视为最热
+    """
+
+    def __init__(self, half_life: float = settings.KB_ACCESS_HALF_LIFE, pinned: list[str] = ()):
+        self.decay = math.log(2) / half_life
+        self.pinned = set(pinned)
+        self.scores: dict[str, tuple[float, float]] = {kb_name: (0.0, time.monotonic()) for kb_name in pinned}
+        self._lock = threading.Lock()
+
+    def _decayed(self, kb_name: str, now: float) -> float:
+        if kb_name in self.pinned:
+            return math.inf
+        score, last = self.scores.get(kb_name, (0.0, now))
+        return score * math.exp(-self.decay * (now - last))
+
+    def record(self, kb_name: str, weight: float = 1.0):
+        now = time.monotonic()
+        with self._lock:
+            self.scores[kb_name] = (self._decayed(kb_name, now) + weight, now)
+
+    def score(self, kb_name: str) -> float:
+        with self._lock:
+            return self._decayed(kb_name, time.monotonic())
+
+    def forget(self, kb_name: str):
+        with self._lock:
+            self.scores.pop(kb_name, None)
+            self.pinned.discard(kb_name)
+
+    def hot(self, limit: int) -> list[str]:
+        """
+        @desc     : 访问频率最高的 limit 个知识库
+        """
+        now = time.monotonic()
+        with self._lock:
+            ranked = sorted(self.scores, key=lambda kb: self._decayed(kb, now), reverse=True)
+        return ranked[:limit]
+
+    def stats(self) -> dict[str, float]:
+        now = time.monotonic()
+        with self._lock:
+            return {kb: round(self._decayed(kb, now), 3) for kb in self.scores}
+
+
+KB_ACCESS = KBAccessTracker(pinned=settings.WARMUP_KBS)
+# BM25 缓存满时淘汰访问频率最低的知识库，而不是最久未访问的
+BM25_REGISTRY.score_fn = KB_ACCESS.score
+
+_warming: dict[str, asyncio.Task] = {}
+
+
+def kb_exists(kb_name: str) -> bool:
+    """
+    @desc     : 知识库是否已在目录中登记或已有向量库集合，名称不合法（含路径分隔符等）时视为不存在。
+                加载 BM25 索引与文本块存储会创建文件锁，不能用目录是否存在判断
+    @param    : kb_name: 知识库名称
+    """
+    try:
+        check_name(kb_name, "知识库名称不合法")
+    except InvalidUploadName:
+        return False
+    if KB_CATALOG.get_kb(kb_name):
+        return True
+    try:
+        chroma_client.get_collection(name=kb_name)
+        return True
+    except Exception:
+        return False
+
+
+@traced()
+def warm_kb(kb_name: str) -> dict:
+    """
+    @desc     : 同步加载知识库的各类索引，知识库不存在时不加载任何内容
+    @param    : kb_name: 知识库名称
+    @return   : 各部分耗时(秒)
+    """
+    if not kb_exists(kb_name):
+        raise FileNotFoundError(f"知识库 {kb_name} 不存在")
+
+    timings = {}
+
+    start = time.perf_counter()
+    BM25_REGISTRY.get(kb_name)
+    timings["bm25"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    CHUNK_STORES.get(kb_name).refresh()
+    timings["chunk_store"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    collection = chroma_client.get_collection(name=kb_name)
+    EMBEDDING_REGISTRY.get(get_collection_model(collection))
+    timings["embedding_model"] = time.perf_counter() - start
+
+    # 用库内已有的一条向量查询一次，促使 Chroma 加载 HNSW 索引
+    start = time.perf_counter()
+    sample = collection.get(limit=1, include=["embeddings"])
+    if sample["ids"]:
+        collection.query(query_embeddings=[list(sample["embeddings"][0])], n_results=1, include=[])
+    timings["chroma"] = time.perf_counter() - start
+
+    return {name: round(seconds, 4) for name, seconds in timings.items()}
+
+
+async def warm_kbs(kb_names: list[str]) -> dict:
+    """
+    @desc     : 依次预热多个知识库，同一知识库正在预热时等待已有任务
+    @param    : kb_names: 知识库名称列表
+    @return   : {知识库: 各部分耗时或错误信息}
+    """
+    results = {}
+    for kb_name in dict.fromkeys(kb_names):
+        task = _warming.get(kb_name)
+        if task is None:
+            task = asyncio.create_task(asyncio.to_thread(warm_kb, kb_name))
+            _warming[kb_name] = task
+            task.add_done_callback(lambda _, kb_name=kb_name: _warming.pop(kb_name, None))
+        try:
+            results[kb_name] = await asyncio.shield(task)
+        except Exception as e:
+            # 知识库不存在或已删除，不再作为热点
+            logger.error(f"预热知识库 {kb_name} 失败: {e}")
+            KB_ACCESS.forget(kb_name)
+            results[kb_name] = {"error": str(e)}
+    return results
+
+
+def schedule_warmup(kb_names: list[str]) -> asyncio.Task:
+    """
+    @desc     : 在后台预热，不等待完成
+    """
+    return asyncio.create_task(warm_kbs(kb_names))
+
+
+async def keep_hot(interval: float = settings.WARMUP_INTERVAL):
+    """
+    @desc     : 启动时预热 WARMUP_KBS，之后定期把访问频率最高、但已不在缓存中的知识库重新加载
+    @param    : interval: 检查间隔(秒)，为 0 时只做启动预热
+    """
+    if settings.WARMUP_KBS:
+        results = await warm_kbs(settings.WARMUP_KBS)
+        logger.info(f"启动预热完成: {results}")
+    while interval > 0:
+        await asyncio.sleep(interval)
+        cold = [kb for kb in KB_ACCESS.hot(settings.MAX_CACHED_KB) if not BM25_REGISTRY.contains(kb)]
+        if cold:
+            logger.info(f"重新预热热点知识库: {cold}")
+            await warm_kbs(cold)
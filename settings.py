@@ -38,6 +38,8 @@ class Settings(BaseSettings):
     """
     API_PREFIX: str = Field("/api", description="所有api接口都有的前缀")
     API_PORT: int = Field(5510, description="API服务端口号")
+    RUN_MODE: str = Field("dev", description="运行模式: dev 单进程热重载 / prod 多进程部署")
+    WORKERS: int = Field(1, description="prod 模式下的工作进程数")
 
     REDIS_HOST: str = Field("", description="")
     REDIS_PORT: int = Field(9531)
@@ -50,23 +52,94 @@ class Settings(BaseSettings):
     CHATGLM_API_KEY: str = Field("", description="ChatGLM API Key")
 
     UPLOAD_DIR: str = Field("uploads", description="文件上传目录")
+    UPLOAD_MAX_FILE_SIZE: int = Field(100 * 1024 * 1024, description="单个上传文件的大小上限(字节)")
+    UPLOAD_MAX_REQUEST_SIZE: int = Field(500 * 1024 * 1024, description="单次上传请求的大小上限(字节)")
+    UPLOAD_BUFFER_SIZE: int = Field(1024 * 1024, description="上传文件写盘的缓冲大小(字节)")
+    KB_CATALOG_PATH: str | None = Field(None, description="知识库元数据目录(SQLite)路径，为空时为上传目录下的 .kb_catalog.db")
+    INGEST_PROCESS_WORKERS: int = Field(0, description="解析与切片的进程池大小，0 表示不启用，在线程中执行")
+    INGEST_STREAM_BATCH: int = Field(32, description="边上传边入库时每批写入的文本块数量")
 
     IMAGE_MODEL: str = Field("glm-4.5v", description="默认的图像识别模型")
+    VLM_MAX_CONCURRENT: int = Field(8, description="全局同时进行的图片识别请求上限")
+    OCR_MAX_CONCURRENT: int = Field(5, description="单个 PDF 同时渲染并识别的页数")
+    OCR_PAGE_RETRIES: int = Field(2, description="单页识别失败后的重试次数，仍失败时跳过该页并记为缺页")
+
+    CHAT_MAX_CONCURRENT: int = Field(64, description="同时处理的问答请求上限（含流式输出）")
+    CHAT_MAX_QUEUE: int = Field(128, description="问答排队上限，超出返回 429")
+    CHAT_QUEUE_TIMEOUT: float = Field(10.0, description="问答排队的最长等待时间(秒)，超时返回 503")
+    INGEST_MAX_CONCURRENT: int = Field(2, description="同时处理的入库请求上限")
+    INGEST_MAX_QUEUE: int = Field(16, description="入库排队上限，超出返回 429")
+    INGEST_QUEUE_TIMEOUT: float = Field(60.0, description="入库排队的最长等待时间(秒)，超时返回 503")
 
     TEXT_LLM: str = Field("glm-4", description="默认的文本生成模型")
     EMBEDDING_MODEL: str = Field("BAAI/bge-large-zh-v1.5", description="默认的文本嵌入模型")
     EMBEDDING_MODEL_LOCAL_PATH: str | None = Field(None, description="默认的文本嵌入模型本地路径")
+    MAX_CACHED_EMBEDDING_MODEL: int = Field(2, description="最大缓存的嵌入模型数量")
+    EMBEDDING_BATCH_SIZE: int = Field(32, description="嵌入动态批处理的最大批大小")
+    EMBEDDING_BATCH_WAIT_MS: float = Field(5, description="嵌入动态批处理凑批的最长等待时间(毫秒)")
+    EMBEDDING_CHAT_WEIGHT: int = Field(4, ge=1, description="嵌入批处理中问答请求的权重")
+    EMBEDDING_INGEST_WEIGHT: int = Field(1, ge=1, description="嵌入批处理中入库请求的权重")
+    EMBEDDING_BACKEND: str = Field("torch", description="嵌入模型推理后端: torch / onnx / openvino")
+    EMBEDDING_BACKEND_FILE: str | None = Field(
+        None, description="onnx/openvino 后端加载的模型文件，如 onnx/model_qint8_avx512_vnni.onnx，为空时使用默认导出文件"
+    )
 
     TOP_K: int = Field(15, description="召回知识的最大数量")
 
     DEFAULT_KNOWLEDGE_BASE: str = Field("default", description="默认的知识库名称")
     BM25_INDEX_NAME: str = Field("bm25_index.json", description="BM25 索引文件名称,限制json类型")
     MAX_CACHED_KB: int = Field(3, description="最大加载到缓存的知识库数量")
+    CHUNK_STORE_BLOCK_SIZE: int = Field(64 * 1024, description="文本块存储中每个压缩数据块的大小(字节)")
+    CHUNK_STORE_MMAP: bool = Field(False, description="以 mmap 方式读取文本块存储")
+    WARMUP_KBS: list[str] = Field([], description="启动时预热并常驻的知识库，如 [\"default\"]")
+    WARMUP_INTERVAL: float = Field(60.0, description="检查热点知识库是否需要重新预热的间隔(秒)，0 表示只在启动时预热")
+    KB_ACCESS_HALF_LIFE: float = Field(1800.0, description="知识库访问频率的衰减半衰期(秒)")
+    BM25_RELOAD_INTERVAL: float = Field(1.0, description="检查 BM25 索引版本变化的最小间隔(秒)")
+    BM25_JOURNAL_MAX: int = Field(200, description="BM25 变更日志累计多少条后合并进索引文件")
+
+    CHROMA_PATH: str = Field(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), ".chroma"),
+        description="Chroma 本地持久化目录",
+    )
+    CHROMA_HOST: str = Field("", description="Chroma 服务地址，多进程部署时由独立的 Chroma 服务统一写入")
+    CHROMA_PORT: int = Field(8000, description="Chroma 服务端口")
     
     MAX_KEYWORDS: int = Field(5, description="最大关键词数量")
     NUMS_KNOWLEDGE: int = Field(15, description="每个知识库的最大知识数量")
     KEYWORDS_DELAY: float = Field(0.2, description="关键词提取数量衰减")
+    KEYWORDS_POLICY: str = Field(
+        "fixed",
+        description="关键词扩展策略：fixed 按 KEYWORDS_DELAY 逐个衰减并检索全部关键词；"
+        "adaptive 按关键词与问题的相似度分配召回数量，新关键词的结果大多重复或分数过低时停止",
+    )
+    KEYWORDS_MIN_NOVELTY: float = Field(0.3, description="adaptive 策略下关键词召回结果中新 id 的最低占比，低于该值停止扩展")
+    KEYWORDS_MIN_SCORE: float = Field(0.4, description="adaptive 策略下关键词召回的最高归一化分数低于该值时停止扩展")
     MAX_KNOWLEDGE: int = Field(20, description="最大知识数量")
+    KB_SEARCH_TIMEOUT: float = Field(10.0, description="多知识库检索时单个知识库的超时时间(秒)")
+    BM25_SCORE_SCALE: float = Field(5.0, description="BM25 分数归一化尺度，归一化分数 = s / (s + scale)")
+
+    RETRIEVAL_CACHE_SIZE: int = Field(4096, description="关键词检索结果缓存的最大条数，0 表示关闭")
+    ANSWER_CACHE_SIZE: int = Field(256, description="回答缓存的最大条数，0 表示关闭")
+    CONTEXT_TOKEN_BUDGET: int = Field(3000, description="拼入提示词的召回知识 token 预算，<=0 表示不限制")
+
+    RERANK_ENABLED: bool = Field(False, description="是否启用 cross-encoder 重排")
+    RERANK_MODEL: str = Field("BAAI/bge-reranker-base", description="重排模型")
+    RERANK_MODEL_LOCAL_PATH: str | None = Field(None, description="重排模型本地路径")
+    RERANK_TOP_N: int = Field(6, description="重排后保留的知识数量")
+    RERANK_BATCH_SIZE: int = Field(16, description="重排每批打分的数量")
+    RERANK_TIMEOUT_MS: float = Field(500, description="重排耗时上限(毫秒)，超时后未打分的知识按召回顺序补齐")
+    RERANK_WORKERS: int = Field(1, ge=1, description="重排专用线程数，线程都在打分（含超时后仍未结束的打分）时在耗时上限内排队等待")
+
+    DEBUG: bool = Field(False, description="调试模式，问答的 start 事件中附带各阶段耗时")
+    LOOP_LAG_INTERVAL: float = Field(0.5, description="事件循环延迟的采样间隔(秒)")
+    TRACE_ENABLED: bool = Field(False, description="是否导出请求级耗时追踪")
+    TRACE_SAMPLE_RATE: float = Field(1.0, description="导出追踪的采样比例，0~1")
+    TRACE_FILE_MAX_BYTES: int = Field(50 * 1024 * 1024, description="追踪文件的大小上限(字节)，超出后轮转")
+    TRACE_FILE_BACKUPS: int = Field(5, description="追踪文件轮转后保留的历史文件数")
+    TRACE_FILE: str = Field(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "traces.jsonl"),
+        description="耗时追踪的导出文件(JSONL，字段与 OpenTelemetry span 一致)，为空时写入日志",
+    )
 
     COMMON_RESOURCE_DIR: str = Field(
         os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources"),
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   test_embedding_parity.py
+@Time    :   2026/10/21 15:20:08
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   嵌入后端一致性测试：onnx / openvino 后端与 torch 基准的逐条余弦相似度不低于阈值。
+             需要本地模型（EMBEDDING_PARITY_MODEL 或 EMBEDDING_MODEL_LOCAL_PATH）与对应后端依赖，缺少时跳过
+
+    EMBEDDING_PARITY_MODEL=/models/bge-large-zh-v1.5 python -m pytest -q tests/test_embedding_parity.py
+"""
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("chromadb")
+
+from settings import settings
+from benchmark.embedding_bench import build_texts, cosine_agreement
+from model.embedding_model import build_embedding_function
+
+MIN_COSINE = 0.99
+# 后端及其额外依赖，与 build_embedding_function 的说明一致
+BACKEND_MODULES = {"onnx": "onnxruntime", "openvino": "openvino"}
+
+
+@pytest.fixture(scope="module")
+def model_path():
+    path = os.environ.get("EMBEDDING_PARITY_MODEL") or settings.EMBEDDING_MODEL_LOCAL_PATH
+    if not path or not os.path.isdir(path):
+        pytest.skip("未配置本地嵌入模型，跳过后端一致性测试")
+    return path
+
+
+@pytest.fixture(scope="module")
+def texts():
+    return build_texts(32)
+
+
+@pytest.fixture(scope="module")
+def reference(model_path, texts):
+    ef = build_embedding_function(model_path, backend="torch")
+    return np.asarray(ef(texts), dtype=np.float32)
+
+
+@pytest.mark.parametrize("backend", sorted(BACKEND_MODULES))
+def test_backend_matches_torch(backend, model_path, texts, reference):
+    pytest.importorskip("optimum")
+    pytest.importorskip(BACKEND_MODULES[backend])
+    # 配置的量化文件只属于配置的后端
+    backend_file = settings.EMBEDDING_BACKEND_FILE if backend == settings.EMBEDDING_BACKEND else None
+    try:
+        ef = build_embedding_function(model_path, backend=backend, backend_file=backend_file)
+    except Exception as e:
+        pytest.skip(f"无法加载 {backend} 后端: {e}")
+
+    candidate = np.asarray(ef(texts), dtype=np.float32)
+    assert candidate.shape == reference.shape
+    cosines = cosine_agreement(reference, candidate)
+    assert cosines.min() >= MIN_COSINE, f"{backend} 与 torch 输出不一致: cosine_min={cosines.min():.4f}"
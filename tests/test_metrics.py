@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+"""
+@File    :   test_metrics.py
+@Time    :   2026/10/21 10:12:45
+@Author  :   SeeStars
+@Version :   1.0
+@Desc    :   指标文本导出格式测试：Counter / Gauge / Histogram 的输出、标签转义、累计桶与 _sum/_count
+
+    python -m pytest -q tests/test_metrics.py
+"""
+import pytest
+
+from libs.metrics import Counter, Gauge, Histogram, Metric, MetricsRegistry
+
+
+def test_counter_render():
+    counter = Counter("docrag_test_total", "测试计数", ("kb",))
+    counter.inc(kb="a")
+    counter.inc(2, kb="a")
+    counter.inc(0.5, kb="b")
+
+    assert counter.render().split("\n") == [
+        "# HELP docrag_test_total 测试计数",
+        "# TYPE docrag_test_total counter",
+        'docrag_test_total{kb="a"} 3',
+        'docrag_test_total{kb="b"} 0.5',
+    ]
+
+
+def test_counter_without_labels():
+    counter = Counter("docrag_plain_total", "无标签")
+    counter.inc()
+
+    assert counter.samples() == ["docrag_plain_total 1"]
+
+
+def test_gauge_render():
+    gauge = Gauge("docrag_test_inflight", "测试仪表")
+    gauge.inc(3)
+    gauge.dec()
+
+    lines = gauge.render().split("\n")
+    assert lines[1] == "# TYPE docrag_test_inflight gauge"
+    assert lines[2:] == ["docrag_test_inflight 2"]
+
+
+def test_label_and_help_escaping():
+    counter = Counter("docrag_escape_total", 'help with \\ and\nnewline and "quote"', ("path",))
+    counter.inc(path='C:\\docs\\"a"\nb')
+
+    lines = counter.render().split("\n")
+    assert lines[0] == '# HELP docrag_escape_total help with \\\\ and\\nnewline and "quote"'
+    assert lines[2] == 'docrag_escape_total{path="C:\\\\docs\\\\\\"a\\"\\nb"} 1'
+
+
+def test_metric_requires_samples():
+    class Incomplete(Metric):
+        type = "gauge"
+
+    with pytest.raises(TypeError):
+        Incomplete("docrag_incomplete", "未实现 samples")
+
+
+def test_histogram_cumulative_buckets():
+    histogram = Histogram("docrag_test_seconds", "测试耗时", ("stage",), buckets=(1.0, 0.1, 0.5))
+    for value in (0.05, 0.1, 0.3, 0.7, 2.0):
+        histogram.observe(value, stage="recall")
+
+    lines = histogram.render().split("\n")
+    assert lines[1] == "# TYPE docrag_test_seconds histogram"
+    assert lines[2:] == [
+        'docrag_test_seconds_bucket{stage="recall",le="0.1"} 2',
+        'docrag_test_seconds_bucket{stage="recall",le="0.5"} 3',
+        'docrag_test_seconds_bucket{stage="recall",le="1"} 4',
+        'docrag_test_seconds_bucket{stage="recall",le="+Inf"} 5',
+        'docrag_test_seconds_sum{stage="recall"} 3.15',
+        'docrag_test_seconds_count{stage="recall"} 5',
+    ]
+
+
+def test_histogram_inf_bucket_equals_count():
+    histogram = Histogram("docrag_inf_seconds", "无标签直方图", buckets=(0.01,))
+    for value in (0.001, 5.0, 100.0):
+        histogram.observe(value)
+
+    samples = histogram.samples()
+    assert samples[0] == 'docrag_inf_seconds_bucket{le="0.01"} 1'
+    assert samples[1] == 'docrag_inf_seconds_bucket{le="+Inf"} 3'
+    assert samples[-1] == "docrag_inf_seconds_count 3"
+
+    counts = [int(line.rsplit(" ", 1)[1]) for line in samples if "_bucket" in line]
+    assert counts == sorted(counts)
+
+
+def test_registry_render_runs_collectors():
+    registry = MetricsRegistry()
+    gauge = registry.gauge("docrag_collected", "采集值")
+    registry.counter("docrag_registry_total", "注册表计数").inc()
+    registry.collectors.append(lambda: gauge.set(7))
+    registry.collectors.append(lambda: 1 / 0)
+
+    text = registry.render()
+    assert text.endswith("\n")
+    assert "docrag_collected 7\n" in text
+    assert "docrag_registry_total 1\n" in text
+    assert text.index("# TYPE docrag_collected gauge") < text.index("# TYPE docrag_registry_total counter")
+
+
+def test_registry_rejects_duplicate_names():
+    registry = MetricsRegistry()
+    registry.counter("docrag_dup_total", "重复")
+
+    with pytest.raises(ValueError):
+        registry.gauge("docrag_dup_total", "重复")